@@ -0,0 +1,149 @@
+"""
+Запуск операций с библиотекой без графического интерфейса (например, из cron).
+
+    python cli.py dump backup.json --parallel
+    python cli.py dump nightly.lbsnap --since 1520
+    python cli.py load full.lbsnap delta1.lbsnap delta2.lbsnap
+    python cli.py report month.pdf
+    python cli.py stats --granularity month --months 12
+    python cli.py serve --port 8085
+    python cli.py prune-changes --days 90
+
+Модуль не импортирует tkinter и src.interface, поэтому работает на сервере без дисплея.
+"""
+
+import argparse
+import asyncio
+import importlib
+import logging.config
+import sys
+from datetime import datetime, timedelta
+
+from sqlalchemy.exc import OperationalError
+
+from src.config_models import ConfigModel
+from src.db import init_db, EventType
+from src import statistics, change_feed
+from src.statistics import Granularity
+from src.service import run_service, DEFAULT_HOST, DEFAULT_PORT
+
+
+EXIT_OK = 0
+EXIT_ERROR = 1
+EXIT_DB_UNAVAILABLE = 3
+
+logger = logging.getLogger("src.cli")
+
+
+def _dump(args: argparse.Namespace):
+    from src.json_dump import Dumper, SNAPSHOT_EXTENSION
+
+    if args.file.endswith(SNAPSHOT_EXTENSION):
+        dump_id = Dumper.dump_to_snapshot(args.file, since_dump_id=args.since)
+        print(f"dump_id={dump_id}")
+    elif args.since is not None:
+        raise ValueError(f"Differential dumps are supported only for '{SNAPSHOT_EXTENSION}' files")
+    else:
+        Dumper.dump_to_file(args.file, parallel=args.parallel)
+
+
+def _load(args: argparse.Namespace):
+    from src.json_dump import Dumper, SNAPSHOT_EXTENSION
+
+    if args.file.endswith(SNAPSHOT_EXTENSION):
+        Dumper.load_from_snapshot(args.file, *args.deltas)
+    elif args.deltas:
+        raise ValueError(f"Differential dumps are supported only for '{SNAPSHOT_EXTENSION}' files")
+    else:
+        Dumper.load_from_file(args.file,
+                              progress=lambda p: logger.info(f"{p.section}: {p.done}/{p.total} "
+                                                             f"({p.records_per_second:.0f} records/s)"))
+
+
+def _report(args: argparse.Namespace):
+    from src.pdf_report import PdfCreator
+
+    PdfCreator.create_pdf_report(args.file, use_cache=not args.no_cache)
+
+
+def _stats(args: argparse.Namespace):
+    end = args.end or datetime.now()
+    start = args.start or statistics.get_months_start(args.months, end)
+
+    event_types = list(EventType)
+    print("\t".join(["period"] + [event_type.name for event_type in event_types]))
+    for stat in statistics.get_event_counts(start, end, Granularity(args.granularity)):
+        print("\t".join([stat.period] + [str(stat.get(event_type)) for event_type in event_types]))
+
+
+def _serve(args: argparse.Namespace):
+    asyncio.run(run_service(args.host, args.port))
+
+
+def _prune_changes(args: argparse.Namespace):
+    pruned = change_feed.prune_change_log(timedelta(days=args.days))
+    print(f"pruned={pruned}")
+
+
+def _create_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Library Manager batch operations")
+    parser.add_argument("--config", default="config", help="python module with configuration (default: config)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    dump_parser = subparsers.add_parser("dump", help="export database to json dump or binary snapshot")
+    dump_parser.add_argument("file")
+    dump_parser.add_argument("--parallel", action="store_true", help="read json dump sections in parallel")
+    dump_parser.add_argument("--since", type=int, help="make differential snapshot since this dump id")
+    dump_parser.set_defaults(handler=_dump)
+
+    load_parser = subparsers.add_parser("load", help="import json dump or restore binary snapshot")
+    load_parser.add_argument("file")
+    load_parser.add_argument("deltas", nargs="*", help="differential snapshots to apply after the full one")
+    load_parser.set_defaults(handler=_load)
+
+    report_parser = subparsers.add_parser("report", help="create pdf report")
+    report_parser.add_argument("file")
+    report_parser.add_argument("--no-cache", action="store_true", help="don't use cached report")
+    report_parser.set_defaults(handler=_report)
+
+    stats_parser = subparsers.add_parser("stats", help="print events statistics as tsv")
+    stats_parser.add_argument("--granularity", default="month", choices=[g.value for g in Granularity])
+    stats_parser.add_argument("--months", type=int, default=12, help="range length if --from is not set")
+    stats_parser.add_argument("--from", dest="start", type=datetime.fromisoformat)
+    stats_parser.add_argument("--to", dest="end", type=datetime.fromisoformat)
+    stats_parser.set_defaults(handler=_stats)
+
+    serve_parser = subparsers.add_parser("serve", help="run JSON over HTTP service for workstations")
+    serve_parser.add_argument("--host", default=DEFAULT_HOST)
+    serve_parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    serve_parser.set_defaults(handler=_serve)
+
+    prune_parser = subparsers.add_parser("prune-changes", help="delete old change log records")
+    prune_parser.add_argument("--days", type=int, default=change_feed.CHANGE_LOG_RETENTION.days,
+                              help="keep records for this number of days")
+    prune_parser.set_defaults(handler=_prune_changes)
+
+    return parser
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = _create_parser().parse_args(argv)
+
+    config_model = ConfigModel(**vars(importlib.import_module(args.config)))
+    logging.config.dictConfig(config_model.logging)
+
+    try:
+        init_db(config_model.database)
+        args.handler(args)
+    except OperationalError:
+        logger.exception("Unable to connect to database")
+        return EXIT_DB_UNAVAILABLE
+    except Exception:
+        logger.exception(f"Command '{args.command}' failed")
+        return EXIT_ERROR
+
+    return EXIT_OK
+
+
+if __name__ == "__main__":
+    sys.exit(main())
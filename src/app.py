@@ -6,16 +6,26 @@ from sqlalchemy.exc import OperationalError
 from customtkinter import set_default_color_theme, set_appearance_mode, \
     CTk, CTkButton, CTkTabview, CTkFrame, CTkProgressBar
 
+from . import profiler, async_db
 from .db import TableViewable, Book, Reader, BookToReader, History, init_db
-from .interface import RowAction, ProgressBarWindow, ErrorNotification
+from .interface import RowAction, ProgressBarWindow, ErrorNotification, Table, CanvasTable
 from .config_models import ConfigModel
 from .style_models import StyleConfig
-from .controllers import BooksController, ToolBarController, ReadersController, TablesController
+from .controllers import (
+    BooksController, ToolBarController, ReadersController, TablesController, ChangeWatcher, LoansPrefetcher
+)
+from .controllers.background import BackgroundTask
 
 
 WINDOW_WIDTH = 1000
 WINDOW_HEIGHT = 500
 
+# Пауза перед фоновой загрузкой каждой следующей невидимой вкладки
+BACKGROUND_LOAD_DELAY_MS = 300
+
+# Сколько секунд при закрытии ждать закрытия асинхронных соединений с бд
+ASYNC_DISPOSE_TIMEOUT = 2
+
 
 logger = getLogger(__name__)
 
@@ -25,10 +35,17 @@ _RowType = TypeVar("_RowType", Type[TableViewable], None)
 class CustomTabView(CTkTabview):
     def __init__(self, style: StyleConfig, *args, **kwargs):
         self._button_height = 32
-        super().__init__(*args, **kwargs)
+        super().__init__(*args, command=self._on_tab_selected, **kwargs)
 
         self._style = style
 
+        # Данные вкладки загружаются при первом её открытии, а не все сразу
+        self._tables: dict[str, Table] = dict()
+        self._loaded_tabs: set[str] = set()
+
+        # До подключения к бд вкладки показывают только строки из кэша
+        self._is_connected = False
+
     def add(self, db_class: _RowType, *args, **kwargs) -> CTkFrame:
         tab_frame = super().add(db_class.get_table_name())
 
@@ -38,13 +55,56 @@ class CustomTabView(CTkTabview):
             db_class=db_class,
             master=tab_frame,
             height=WINDOW_HEIGHT,
+            cache_key=db_class.__name__,
             **kwargs
         )
 
         table.pack(padx=10, fill="both", expand=True)
+        self._tables[db_class.get_table_name()] = table
 
         return tab_frame
 
+    def show_cached(self) -> bool:
+        """ Показывает во всех вкладках строки из локального кэша, возвращает True, если кэш был хотя бы у одной """
+
+        shown = [table.show_cached() for table in self._tables.values()]
+        return any(shown)
+
+    def save_cache(self):
+        for name in self._loaded_tabs:
+            try:
+                self._tables[name].save_cache()
+            except OSError:
+                logger.warning(f"Unable to save cache of tab '{name}'", exc_info=True)
+
+    def load_current_tab(self):
+        """ Вызывается после подключения к бд, до этого вкладки не загружаются """
+
+        self._is_connected = True
+        self._load_tab(self.get())
+
+    def load_other_tabs_in_background(self):
+        """ Загружает по одной ещё не открытые вкладки, давая интерфейсу обработать события между ними """
+
+        not_loaded = [name for name in self._tables if name not in self._loaded_tabs]
+        if not not_loaded:
+            return
+
+        self._load_tab(not_loaded[0])
+        self.after(BACKGROUND_LOAD_DELAY_MS, lambda: self.after_idle(self.load_other_tabs_in_background))
+
+    def _load_tab(self, name: str):
+        if name in self._loaded_tabs or name not in self._tables:
+            return
+
+        logger.debug(f"Loading tab '{name}'")
+        self._loaded_tabs.add(name)
+        self._tables[name].refresh()
+
+    def _on_tab_selected(self):
+        if self._is_connected:
+            self._load_tab(self.get())
+
 
 class Application(CTk):
     def __init__(self, config: ConfigModel, style: StyleConfig):
@@ -60,6 +120,10 @@ class Application(CTk):
 
         self.title("Library Manager")
         self.minsize(width=WINDOW_WIDTH, height=WINDOW_HEIGHT)
+        self.protocol("WM_DELETE_WINDOW", self._on_close)
+
+        self.tab_view: CustomTabView | None = None
+        self._change_watcher: ChangeWatcher | None = None
 
         self.after(20, self._create_progress_bar)
 
@@ -71,19 +135,36 @@ class Application(CTk):
                                                                       "Загрузка данных"])
 
     def _connect_to_db(self):
-        try:
-            logger.info("Connecting to database")
+        """ Создание таблиц и обновление схемы могут быть долгими, поэтому выполняются в отдельном потоке """
+
+        logger.info("Connecting to database")
+
+        def connect(report):
             init_db(self._config.database)
+            async_db.init_async_db(self._config.database)
+
+        BackgroundTask(self, connect, on_done=self._on_connected, on_error=self._on_connect_error).start()
+
+    def _on_connected(self, result=None):
+        if self._loading_progress is not None:
             self._loading_progress.next()
-            TablesController.refresh()
-            self.after(500, self._loading_progress.stop)
-        except OperationalError as e:
-            logger.exception("Unable to connect to database", exc_info=True)
-            self._loading_progress.stop()
-            ErrorNotification("Невозможно подключиться к базе данных.\n"
-                              f"Ошибка: {e.args}")
+        self.tab_view.load_current_tab()
+        self.after(500, self._stop_loading_progress)
+        self.after(500 + BACKGROUND_LOAD_DELAY_MS,
+                   lambda: self.after_idle(self.tab_view.load_other_tabs_in_background))
+        self.after(500, profiler.log_report)
+        self._change_watcher = ChangeWatcher(self).start()
 
-            self.destroy()
+    def _on_connect_error(self, error: Exception):
+        self._stop_loading_progress()
+        if not isinstance(error, OperationalError):
+            raise error
+
+        logger.error(f"Unable to connect to database: {error}")
+        ErrorNotification("Невозможно подключиться к базе данных.\n"
+                          f"Ошибка: {error.args}")
+
+        self.destroy()
 
     def _create_widgets(self):
         self._loading_progress.next()
@@ -103,7 +184,8 @@ class Application(CTk):
             add_command=lambda: BooksController.show_edit_window(self, self._config),
             row_actions=(
                 RowAction(text="Выданные книги",
-                          command=lambda db_obj: BooksController.show_taken_books(self._style, db_obj)),
+                          command=lambda db_obj: BooksController.show_taken_books(self._style, db_obj),
+                          on_hover=lambda row_id: LoansPrefetcher.prefetch(self, Book, row_id)),
                 RowAction(text="Выдать",
                           command=lambda db_obj: BooksController.give_book_to_reader(db_obj)),
                 RowAction(command=lambda db_obj: BooksController.show_edit_window(self, self._config, db_obj),
@@ -118,27 +200,54 @@ class Application(CTk):
             add_command=lambda: ReadersController.show_edit_window(self),
             row_actions=(
                 RowAction(text="Взятые книги",
-                          command=lambda db_obj: ReadersController.show_taken_books(self._style, db_obj)),
+                          command=lambda db_obj: ReadersController.show_taken_books(self._style, db_obj),
+                          on_hover=lambda row_id: LoansPrefetcher.prefetch(self, Reader, row_id)),
                 RowAction(command=lambda db_obj: ReadersController.show_edit_window(self, db_obj),
                           image_name="edit"),
                 RowAction(command=lambda db_obj: ReadersController.delete_reader(db_obj),
-                          image_name="delete")
+                          image_name="delete",
+                          load_relationships=(Reader.books_associations,))
             )
         )
 
         self.tab_view.add(
             db_class=BookToReader,
             row_actions=(
-                RowAction(text="Вернуть", command=BooksController.return_book),
-                RowAction(text="Списать", command=BooksController.delete_one_instance_book)
+                RowAction(text="Вернуть", command=lambda db_obj: BooksController.return_book(self, db_obj)),
+                RowAction(text="Списать",
+                          command=lambda db_obj: BooksController.delete_one_instance_book(self, db_obj))
             )
         )
 
-        self.tab_view.add(db_class=History, searchable=False)
+        # История быстро растёт, поэтому рисуется на Canvas без виджетов для каждой строки
+        self.tab_view.add(db_class=History, searchable=False, table_class=CanvasTable)
 
-        self._loading_progress.next()
+        # Если есть локальный кэш, с данными можно работать, не дожидаясь подключения к бд
+        if self.tab_view.show_cached():
+            self._stop_loading_progress()
+        else:
+            self._loading_progress.next()
         self.after(100, self._connect_to_db)
 
+    def _stop_loading_progress(self):
+        if self._loading_progress is not None:
+            self._loading_progress.stop()
+            self._loading_progress = None
+
+    def _on_close(self):
+        if self._change_watcher is not None:
+            self._change_watcher.stop()
+        if self.tab_view is not None:
+            self.tab_view.save_cache()
+        try:
+            if async_db.is_initialized():
+                async_db.AsyncBridge.run_and_wait(async_db.dispose(), timeout=ASYNC_DISPOSE_TIMEOUT)
+        except Exception:
+            # Окно должно закрыться, даже если соединения не удалось закрыть
+            logger.exception("Unable to dispose async database engine")
+        finally:
+            self.destroy()
+
     def _create_dump_menu(self):
         bar_frame = CTkFrame(self)
         bar_frame.pack(pady=10, padx=10, fill="x")
@@ -158,9 +267,15 @@ class Application(CTk):
         pdf_report_button = CTkButton(bar_frame,
                                       text="PDF отчёт",
                                       **self._buttons_style.dict(),
-                                      command=ToolBarController.on_pdf_report)
+                                      command=lambda: ToolBarController.on_pdf_report(self, self._config))
         pdf_report_button.pack(side="left", padx=4, pady=4)
 
+        scan_button = CTkButton(bar_frame,
+                                text="Сканирование",
+                                **self._buttons_style.dict(),
+                                command=lambda: ToolBarController.on_scan_mode(self))
+        scan_button.pack(side="left", padx=4, pady=4)
+
     @staticmethod
     def handle_exception_callback(*args):
         err = traceback.format_exception(*args)
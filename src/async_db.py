@@ -0,0 +1,169 @@
+"""
+Асинхронный доступ к базе данных (SQLAlchemy asyncio, драйверы aiomysql и aiosqlite).
+
+Запросы интерфейса (строки таблиц, лента изменений, возврат и списание книг) выполняются,
+не блокируя поток Tk, и могут выполняться одновременно. Логика изменений данных не дублируется:
+операции из src.operations выполняются в асинхронной сессии через run_sync.
+Из интерфейса корутины запускаются через AsyncBridge.
+"""
+
+import asyncio
+from concurrent.futures import Future
+from functools import wraps
+from logging import getLogger
+from threading import Thread, Lock
+from typing import Any, Callable, Coroutine, Iterable
+
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
+
+from . import operations, change_feed
+from .config_models import DbConfig
+from .db import TableViewable, DisplayRow, BookToReader, get_data_version
+
+
+logger = getLogger(__name__)
+
+# Синхронный драйвер в url заменяется на асинхронный
+ASYNC_DRIVERS = {
+    "mysql+pymysql": "mysql+aiomysql",
+    "mysql": "mysql+aiomysql",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+# Как часто поток Tk проверяет, завершилась ли корутина
+BRIDGE_POLL_INTERVAL_MS = 20
+
+_async_engine: AsyncEngine | None = None
+
+
+def to_async_url(url: str) -> str:
+    scheme, separator, rest = url.partition("://")
+    return ASYNC_DRIVERS.get(scheme, scheme) + separator + rest
+
+
+def init_async_db(db_config: DbConfig | str):
+    """ Таблицы создаются синхронным init_db, здесь только создаётся движок """
+
+    global _async_engine
+
+    url = db_config if isinstance(db_config, str) else db_config.url
+    _async_engine = create_async_engine(to_async_url(url))
+
+
+def is_initialized() -> bool:
+    return _async_engine is not None
+
+
+async def dispose():
+    global _async_engine
+
+    if _async_engine is not None:
+        await _async_engine.dispose()
+        _async_engine = None
+
+
+def wrap_with_async_database(f: Callable):
+    """ Асинхронный аналог db.wrap_with_database """
+
+    @wraps(f)
+    async def wrapper(*args, **kwargs):
+        if kwargs.get("db") is not None:
+            return await f(*args, **kwargs)
+
+        async with AsyncSession(bind=_async_engine, expire_on_commit=False) as db:
+            return await f(*args, **kwargs, db=db)
+
+    return wrapper
+
+
+# ----------- Выборки ------------
+
+@wrap_with_async_database
+async def fetch_table_rows(db_class: type[TableViewable],
+                           where_clauses: Iterable[Any] = (),
+                           order_by: Any = None,
+                           db: AsyncSession = None) -> tuple[int, list[DisplayRow]]:
+    """ Строки для таблицы интерфейса и версия данных (см. db.get_data_version), прочитанная перед строками """
+
+    data_version = await db.run_sync(get_data_version)
+
+    result = await db.execute(db_class.select_display_rows(where_clauses, order_by))
+    return data_version, [db_class.make_display_row(row) for row in result]
+
+
+@wrap_with_async_database
+async def get_changes(since: change_feed.ChangeCursor, db: AsyncSession = None) -> change_feed.ChangeSet:
+    return await db.run_sync(lambda session: change_feed.get_changes(since, db=session))
+
+
+# ----------- Выдача и возврат ------------
+
+@wrap_with_async_database
+async def return_book(loan_id: int, db: AsyncSession = None) -> BookToReader:
+    return await db.run_sync(lambda session: operations.return_book(loan_id, db=session))
+
+
+@wrap_with_async_database
+async def write_off_book(loan_id: int, db: AsyncSession = None) -> BookToReader:
+    return await db.run_sync(lambda session: operations.write_off_book(loan_id, db=session))
+
+
+# ----------- Связь с циклом Tk ------------
+
+class AsyncBridge:
+    """
+    Цикл asyncio работает в отдельном потоке, поэтому запросы не блокируют интерфейс
+    и могут выполняться одновременно. Результат корутины передаётся в on_done или on_error
+    в потоке Tk: виджет периодически проверяет future через after.
+    """
+
+    _loop: asyncio.AbstractEventLoop | None = None
+    _lock = Lock()
+
+    @classmethod
+    def get_loop(cls) -> asyncio.AbstractEventLoop:
+        with cls._lock:
+            if cls._loop is None:
+                cls._loop = asyncio.new_event_loop()
+                Thread(target=cls._loop.run_forever, name="async-db", daemon=True).start()
+
+        return cls._loop
+
+    @classmethod
+    def run_and_wait(cls, coro: Coroutine, timeout: float | None = None) -> Any:
+        """ Выполняет корутину в цикле моста и ждёт результата, блокируя вызывающий поток """
+
+        return asyncio.run_coroutine_threadsafe(coro, cls.get_loop()).result(timeout)
+
+    @classmethod
+    def run(cls,
+            widget: Any,
+            coro: Coroutine,
+            on_done: Callable[[Any], None] | None = None,
+            on_error: Callable[[BaseException], None] | None = None) -> Future:
+        """ Ошибка без on_error выбрасывается в потоке Tk и показывается обработчиком исключений приложения """
+
+        future = asyncio.run_coroutine_threadsafe(coro, cls.get_loop())
+
+        def poll():
+            if not widget.winfo_exists():
+                future.cancel()
+                return
+            if not future.done():
+                widget.after(BRIDGE_POLL_INTERVAL_MS, poll)
+                return
+            if future.cancelled():
+                return
+
+            error = future.exception()
+            if error is None:
+                if on_done:
+                    on_done(future.result())
+            elif on_error:
+                logger.error(f"Async database call failed: {error!r}")
+                on_error(error)
+            else:
+                raise error
+
+        widget.after(BRIDGE_POLL_INTERVAL_MS, poll)
+        return future
@@ -0,0 +1,181 @@
+"""
+Лента изменений данных для обновления интерфейса на нескольких рабочих местах.
+
+Изменения строк через ORM записываются в журнал change_log в той же транзакции (см. db._log_change),
+массовые изменения (например, восстановление из снимка) - одной записью на таблицу (см. db.log_table_change).
+Клиент периодически читает записи журнала после последней увиденной - это один запрос
+по первичному ключу, который почти всегда возвращает пустой результат.
+
+Позиция в журнале (ChangeCursor) используется и лентой, и дифференциальными снимками (см. Dumper.dump_to_snapshot),
+поэтому пропуски в id обрабатываются для них одинаково.
+Старые записи журнала удаляются prune_change_log (python cli.py prune-changes).
+"""
+
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from logging import getLogger
+
+import sqlalchemy as sql
+
+from .db import wrap_with_database, Session, ChangeLog, get_data_version, WHOLE_TABLE_ROW_ID
+
+
+logger = getLogger(__name__)
+
+# Ограничение на число записей журнала за один опрос, остальные будут прочитаны следующим опросом
+CHANGES_BATCH_SIZE = 1000
+
+# Сколько ждать пропущенный id: его транзакция могла ещё не завершиться или была откачена.
+# Отсчёт идёт от времени первой записи после пропуска, время записей берётся с часов рабочих мест,
+# поэтому срок с запасом перекрывает и долгие транзакции, и расхождение часов
+CHANGE_GAP_TIMEOUT = timedelta(minutes=10)
+
+# Сколько пропущенных id подряд отслеживается, при больших скачках автоинкремента остальные не ждём
+MAX_TRACKED_GAPS = 1000
+
+# Сколько хранятся записи журнала. Дифференциальный снимок можно сделать только относительно снимка,
+# изменения после которого ещё не удалены
+CHANGE_LOG_RETENTION = timedelta(days=90)
+
+
+@dataclass
+class ChangeCursor:
+    """
+    Позиция чтения журнала. id записи журнала выдаётся при вставке, а видна запись становится после фиксации
+    транзакции, поэтому запись с меньшим id может появиться позже записей с большими id.
+    Такие пропуски в последовательности id запоминаются в gaps (id -> время первой записи после пропуска)
+    и перечитываются, пока запись не появится или не истечёт CHANGE_GAP_TIMEOUT.
+    """
+
+    last_change_id: int = 0
+    gaps: dict[int, datetime] = field(default_factory=dict)
+
+    @property
+    def settled_change_id(self) -> int:
+        """ Наибольший id, до которого включительно все изменения уже видны """
+
+        return min(self.gaps) - 1 if self.gaps else self.last_change_id
+
+
+@dataclass
+class TableChanges:
+    """
+    has_late_changes - есть изменения из пропусков, более старые, чем версия данных уже загруженных таблиц.
+    whole_table - таблица менялась массово, row_ids и deleted_row_ids не полные.
+    """
+
+    table_name: str
+    last_change_id: int = 0
+    row_ids: set[int] = field(default_factory=set)
+    deleted_row_ids: set[int] = field(default_factory=set)
+    has_late_changes: bool = False
+    whole_table: bool = False
+
+
+@dataclass
+class ChangeSet:
+    last_change_id: int
+    tables: dict[str, TableChanges] = field(default_factory=dict)
+    cursor: ChangeCursor = field(default_factory=ChangeCursor)
+
+    def __bool__(self) -> bool:
+        return bool(self.tables)
+
+
+def _drop_expired_gaps(gaps: dict[int, datetime]) -> dict[int, datetime]:
+    settled_before = datetime.now() - CHANGE_GAP_TIMEOUT
+    return {change_id: noticed for change_id, noticed in gaps.items() if noticed > settled_before}
+
+
+def _find_gaps(db: Session, to_id: int) -> dict[int, datetime]:
+    """ Ещё не истёкшие пропуски среди последних MAX_TRACKED_GAPS id до to_id включительно """
+
+    from_id = max(to_id - MAX_TRACKED_GAPS, 0)
+    rows = db.execute(
+        sql.select(ChangeLog.id, ChangeLog.time)
+        .where(ChangeLog.id > from_id, ChangeLog.id <= to_id)
+        .order_by(ChangeLog.id)
+    ).all()
+
+    gaps = dict()
+    previous_id = from_id
+    for change_id, time in rows:
+        gaps.update((missing_id, time) for missing_id in range(previous_id + 1, change_id))
+        previous_id = change_id
+
+    return _drop_expired_gaps(gaps)
+
+
+@wrap_with_database
+def get_last_change_id(db: Session = None) -> int:
+    return get_data_version(db)
+
+
+@wrap_with_database
+def get_cursor(db: Session = None) -> ChangeCursor:
+    """ Позиция конца журнала, незавершённые транзакции ниже неё учитываются как пропуски """
+
+    last_change_id = get_data_version(db)
+    return ChangeCursor(last_change_id, _find_gaps(db, last_change_id))
+
+
+@wrap_with_database
+def get_changes(since: ChangeCursor | int, limit: int = CHANGES_BATCH_SIZE, db: Session = None) -> ChangeSet:
+    cursor = since if isinstance(since, ChangeCursor) else ChangeCursor(since)
+
+    gaps = _drop_expired_gaps(cursor.gaps)
+
+    condition = ChangeLog.id > cursor.last_change_id
+    if gaps:
+        condition = sql.or_(condition, ChangeLog.id.in_(gaps))
+
+    rows = db.execute(
+        sql.select(ChangeLog.id, ChangeLog.table_name, ChangeLog.row_id, ChangeLog.deleted, ChangeLog.time)
+        .where(condition)
+        .order_by(ChangeLog.id)
+        .limit(limit)
+    ).all()
+
+    change_set = ChangeSet(last_change_id=cursor.last_change_id)
+    for change_id, table_name, row_id, deleted, time in rows:
+        is_late = gaps.pop(change_id, None) is not None
+        if not is_late:
+            for missing_id in range(max(change_set.last_change_id + 1, change_id - MAX_TRACKED_GAPS), change_id):
+                gaps[missing_id] = time
+            change_set.last_change_id = change_id
+
+        changes = change_set.tables.setdefault(table_name, TableChanges(table_name))
+        changes.last_change_id = max(changes.last_change_id, change_id)
+        changes.has_late_changes |= is_late
+        if row_id == WHOLE_TABLE_ROW_ID:
+            changes.whole_table = True
+        else:
+            (changes.deleted_row_ids if deleted else changes.row_ids).add(row_id)
+
+    change_set.cursor = ChangeCursor(change_set.last_change_id, _drop_expired_gaps(gaps))
+    return change_set
+
+
+@wrap_with_database
+def get_oldest_change_id(db: Session = None) -> int:
+    """ Изменения с меньшими id удалены из журнала или не существовали """
+
+    return db.execute(sql.select(sql.func.min(ChangeLog.id))).scalar() or 0
+
+
+@wrap_with_database
+def prune_change_log(retention: timedelta = CHANGE_LOG_RETENTION, db: Session = None) -> int:
+    """
+    Удаляет записи журнала старше retention, возвращает число удалённых записей.
+    Последняя запись не удаляется никогда: по ней считается версия данных (см. db.get_data_version),
+    а автоинкремент в некоторых бд после перезапуска продолжается от наибольшего id в таблице.
+    """
+
+    last_change_id = get_data_version(db)
+    result = db.execute(
+        sql.delete(ChangeLog).where(ChangeLog.time < datetime.now() - retention, ChangeLog.id < last_change_id)
+    )
+    db.commit()
+
+    logger.info(f"Pruned {result.rowcount} change log records older than {retention}")
+    return result.rowcount
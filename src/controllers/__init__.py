@@ -2,3 +2,7 @@ from .books import BooksController
 from .tool_bar import ToolBarController
 from .readers import ReadersController
 from .tables_controller import TablesController, RowAction, refresh_tables
+from .reports import ReportsController
+from .export import ExportController
+from .change_watcher import ChangeWatcher
+from .prefetch import LoansPrefetcher
@@ -0,0 +1,68 @@
+from typing import Any, Callable
+from logging import getLogger
+from queue import Queue, Empty
+from threading import Thread
+
+from customtkinter import CTkBaseClass
+
+
+logger = getLogger(__name__)
+
+POLL_INTERVAL_MS = 100
+
+
+class BackgroundTask:
+    """
+    Выполняет функцию в отдельном потоке, не блокируя интерфейс.
+    Функция получает аргументом report, через который можно передавать прогресс.
+    Все обратные вызовы (on_progress, on_done, on_error) выполняются в потоке Tk.
+    """
+
+    def __init__(self,
+                 widget: CTkBaseClass,
+                 target: Callable[[Callable[[Any], None]], Any],
+                 on_progress: Callable[[Any], None] | None = None,
+                 on_done: Callable[[Any], None] | None = None,
+                 on_error: Callable[[Exception], None] | None = None):
+
+        self._widget = widget
+        self._target = target
+        self._on_progress = on_progress
+        self._on_done = on_done
+        self._on_error = on_error
+
+        self._events: Queue[tuple[str, Any]] = Queue()
+        self._thread = Thread(target=self._run, daemon=True)
+
+    def start(self) -> "BackgroundTask":
+        self._thread.start()
+        self._widget.after(POLL_INTERVAL_MS, self._poll)
+        return self
+
+    def _run(self):
+        try:
+            result = self._target(lambda progress: self._events.put(("progress", progress)))
+            self._events.put(("done", result))
+        except Exception as e:
+            logger.exception(f"Background task failed: {e}")
+            self._events.put(("error", e))
+
+    def _poll(self):
+        try:
+            while True:
+                kind, value = self._events.get_nowait()
+
+                if kind == "progress" and self._on_progress:
+                    self._on_progress(value)
+                elif kind == "done":
+                    if self._on_done:
+                        self._on_done(value)
+                    return
+                elif kind == "error":
+                    if self._on_error:
+                        self._on_error(value)
+                    return
+        except Empty:
+            pass
+
+        self._widget.after(POLL_INTERVAL_MS, self._poll)
@@ -3,9 +3,11 @@ from logging import getLogger
 from customtkinter import CTkToplevel
 
 from .tables_controller import TablesController, RowAction, refresh_tables
-from ..db import (
-    Book, wrap_with_database, Session, Reader, BookToReader, add_event_to_history, EventType, History, TakenBook
-)
+from .prefetch import LoansPrefetcher
+from .. import operations, async_db
+from ..async_db import AsyncBridge
+from ..db import Book, Reader, BookToReader, History, TakenBook
+from ..exc import OperationError
 from ..interface import CustomInputDialog, ErrorNotification, NotificationWindow, BookEditWindow
 from ..validators import Validator
 from ..style_models import StyleConfig
@@ -41,10 +43,8 @@ class BooksController:
 
     @staticmethod
     @refresh_tables((Book, Reader, BookToReader, History))
-    @wrap_with_database
-    def _assign_book_to_reader(book: Book, phone_number: str, db: Session = None):
-        reader = db.query(Reader).where(Reader.phone == phone_number).first()
-        if not reader:
+    def _assign_book_to_reader(book: Book, phone_number: str):
+        if not operations.find_reader_by_phone(phone_number):
             ErrorNotification("Не существует читателя с таким номером телефона.\n\n"
                               "Подсказка: Чтобы выдать книгу на данный номер,\n"
                               "сначала зарегистрируйте читателя с таким номером.")
@@ -55,11 +55,10 @@ class BooksController:
                                           show_cancel=True,
                                           wait_input=False)
         if confirmation.get_input():
-            association = BookToReader(book_id=book.id, reader_id=reader.id)
-            reader.books_associations.append(association)
-            db.commit()
-
-            add_event_to_history(EventType.BOOK_TAKEN, f"Книга '{book.code}' была выдана читателю '{phone_number}'")
+            try:
+                operations.issue_book(book.id, phone_number)
+            except OperationError as e:
+                ErrorNotification(str(e))
 
     @staticmethod
     @refresh_tables((Book, BookToReader))
@@ -69,8 +68,7 @@ class BooksController:
 
     @staticmethod
     @refresh_tables((Book, BookToReader, Reader))
-    @wrap_with_database
-    def delete_book(book: Book, db: Session = None):
+    def delete_book(book: Book):
         confirmation = NotificationWindow(
             title="Подтвердите действие",
             message="Вы уверены, что хотите удалить эту книгу?\n"
@@ -80,8 +78,7 @@ class BooksController:
         )
 
         if confirmation.get_input():
-            db.delete(book)
-            db.commit()
+            operations.delete_book(book.id)
 
     @classmethod
     def show_taken_books(cls, style: StyleConfig, db_obj: Book | None = None):
@@ -90,26 +87,30 @@ class BooksController:
         table_window.title("Выданные книги")
 
         row_actions = (
-            RowAction(text="Вернуть", command=BooksController.return_book),
-            RowAction(text="Списать", command=BooksController.delete_one_instance_book)
+            RowAction(text="Вернуть", command=lambda loan: BooksController.return_book(table_window, loan)),
+            RowAction(text="Списать",
+                      command=lambda loan: BooksController.delete_one_instance_book(table_window, loan))
         )
 
         table = TablesController.create_table(
             db_class=TakenBook,
             style=style,
             master=table_window,
-            default_where_clause=TakenBook.reader.has(Book.id == db_obj.id),
+            default_where_clause=LoansPrefetcher.get_where_clause(Book, db_obj.id),
             row_actions=row_actions
         )
         table.pack(fill="both", expand=True)
-        table.refresh()
+
+        prefetched = LoansPrefetcher.get(Book, db_obj.id)
+        if prefetched is not None:
+            table.show_rows(*prefetched)
+        else:
+            table.refresh()
         table.grab_set()
         table.master.wait_window(table)
 
-    @staticmethod
-    @wrap_with_database
-    @refresh_tables()
-    def delete_one_instance_book(db_obj: BookToReader, db: Session = None):
+    @classmethod
+    def delete_one_instance_book(cls, master, db_obj: BookToReader):
         delete_choice = NotificationWindow(
             title="Подтвердите действие",
             message="Вы уверены, что хотите списать данный экземпляр книги?",
@@ -118,21 +119,21 @@ class BooksController:
         )
 
         if delete_choice.get_input():
-            logger.info(f"Writing off book '{db_obj.book.code}'")
+            cls._run_loan_operation(master, async_db.write_off_book(db_obj.id), None)
 
-            db.get(Book, db_obj.book_id).count -= 1
-            db.delete(db_obj)
-            db.commit()
-
-            add_event_to_history(EventType.BOOK_WRITTEN_OFF,
-                                 f"Экземпляр книги '{db_obj.book.code}' был списан с читателя '{db_obj.reader.phone}'")
+    @classmethod
+    def return_book(cls, master, db_obj: BookToReader):
+        cls._run_loan_operation(master, async_db.return_book(db_obj.id), (BookToReader, Reader, TakenBook, History))
 
     @staticmethod
-    @wrap_with_database
-    @refresh_tables((BookToReader, Reader, TakenBook, History))
-    def return_book(db_obj: BookToReader, db: Session = None):
-        db.delete(db_obj)
-        db.commit()
-
-        add_event_to_history(EventType.BOOK_RETURNED,
-                             f"Книга '{db_obj.book.code}' была возвращена читателем '{db_obj.reader.phone}'")
+    def _run_loan_operation(master, coro, tables):
+        """ Операция выполняется в фоне через AsyncBridge, таблицы обновляются после неё, даже если она не удалась """
+
+        def on_error(error: BaseException):
+            TablesController.refresh(tables)
+            if not isinstance(error, OperationError):
+                raise error
+
+            ErrorNotification(str(error))
+
+        AsyncBridge.run(master, coro, on_done=lambda result: TablesController.refresh(tables), on_error=on_error)
@@ -0,0 +1,105 @@
+from collections import defaultdict
+from logging import getLogger
+
+from customtkinter import CTkBaseClass
+
+from .tables_controller import TablesController
+from .prefetch import LoansPrefetcher
+from .. import change_feed, async_db
+from ..async_db import AsyncBridge
+from ..change_feed import ChangeSet, ChangeCursor, TableChanges
+from ..db import TableViewable, Book, Reader, BookToReader, History, TakenBook
+
+
+logger = getLogger(__name__)
+
+CHANGE_POLL_INTERVAL_MS = 3000
+
+# Таблицы интерфейса, в которых видны данные каждой таблицы бд.
+# Выдача и возврат меняют число доступных книг и число взятых читателем книг.
+DEPENDENT_TABLES: dict[str, tuple[type[TableViewable], ...]] = {
+    Book.__tablename__: (Book, BookToReader, TakenBook),
+    Reader.__tablename__: (Reader, BookToReader, TakenBook),
+    BookToReader.__tablename__: (BookToReader, TakenBook, Book, Reader),
+    History.__tablename__: (History,),
+}
+
+
+class ChangeWatcher:
+    """
+    Периодически читает ленту изменений (src.change_feed) и обновляет только те таблицы,
+    данные которых изменились, в том числе на других рабочих местах.
+    Если таблица интерфейса зависит только от одной изменившейся таблицы бд - своей, в ней перечитываются
+    только изменённые строки по их id, иначе она загружается заново.
+    Свои изменения таблицы уже показывают после обновления, поэтому повторно они не перезагружаются.
+    """
+
+    def __init__(self, widget: CTkBaseClass, interval_ms: int = CHANGE_POLL_INTERVAL_MS):
+        self._widget = widget
+        self._interval_ms = interval_ms
+        self._cursor = ChangeCursor()
+        self._running = False
+
+    def start(self) -> "ChangeWatcher":
+        self._cursor = change_feed.get_cursor()
+        self._running = True
+        self._schedule()
+
+        return self
+
+    def stop(self):
+        self._running = False
+
+    def _schedule(self):
+        if self._running:
+            self._widget.after(self._interval_ms, self._poll)
+
+    def _poll(self):
+        if not self._running:
+            return
+
+        if async_db.is_initialized():
+            AsyncBridge.run(self._widget,
+                            async_db.get_changes(self._cursor),
+                            on_done=self._on_changes,
+                            on_error=self._on_error)
+        else:
+            try:
+                self._on_changes(change_feed.get_changes(self._cursor))
+            except Exception as e:
+                self._on_error(e)
+
+    def _on_changes(self, change_set: ChangeSet):
+        since_change_id = self._cursor.last_change_id
+        self._cursor = change_set.cursor
+
+        affected: dict[type[TableViewable], list[TableChanges]] = defaultdict(list)
+        for table_name, changes in change_set.tables.items():
+            logger.debug(f"Table '{table_name}' changed: {len(changes.row_ids)} rows updated, "
+                         f"{len(changes.deleted_row_ids)} rows deleted")
+
+            if TakenBook in DEPENDENT_TABLES.get(table_name, ()):
+                LoansPrefetcher.invalidate()
+
+            for db_class in DEPENDENT_TABLES.get(table_name, ()):
+                affected[db_class].append(changes)
+
+        for db_class, tables_changes in affected.items():
+            changes = tables_changes[0]
+
+            # Запоздавшее изменение старше версии данных таблиц, поэтому по версии его не отличить
+            if any(table_changes.has_late_changes for table_changes in tables_changes):
+                TablesController.refresh(db_class)
+            elif (len(tables_changes) == 1 and changes.table_name == db_class.__tablename__
+                  and not changes.whole_table):
+                TablesController.reload_rows(db_class, changes.row_ids, changes.deleted_row_ids,
+                                             changes.last_change_id, since_change_id)
+            else:
+                TablesController.refresh_outdated(db_class,
+                                                  max(table_changes.last_change_id for table_changes in tables_changes))
+
+        self._schedule()
+
+    def _on_error(self, error: BaseException):
+        logger.warning(f"Unable to read changes: {error!r}")
+        self._schedule()
@@ -0,0 +1,49 @@
+from logging import getLogger
+
+from tkinter import filedialog
+
+from .background import BackgroundTask
+from ..csv_export import export_table, CSV_DIALECT, TSV_DIALECT
+from ..interface import Table, ProgressBarWindow, ErrorNotification
+
+
+logger = getLogger(__name__)
+
+
+class ExportController:
+    @staticmethod
+    def export_table_to_csv(table: Table):
+        """ Экспорт текущего содержимого таблицы (с учётом фильтра, поиска и сортировки) в csv/tsv файл """
+
+        filename = filedialog.asksaveasfilename(title="Export table",
+                                                defaultextension=".csv",
+                                                filetypes=[("CSV file", ".csv"), ("TSV file", ".tsv")])
+        if not filename:
+            return
+
+        db_class = table.get_db_class()
+        dialect = TSV_DIALECT if filename.endswith(".tsv") else CSV_DIALECT
+        where_clauses = table.get_where_clauses()
+        order_by = table.get_order_by()
+
+        progress_window = ProgressBarWindow(table, "Экспорт", [f"Экспорт таблицы '{db_class.get_table_name()}'"],
+                                            modal=False)
+
+        def on_progress(rows_count: int):
+            progress_window.set_stage_progress(0, f"Записано строк: {rows_count}")
+
+        def on_done(rows_count: int):
+            logger.info(f"Exported {rows_count} rows of '{db_class.get_table_name()}' to '{filename}'")
+            progress_window.stop()
+
+        def on_error(e: Exception):
+            progress_window.stop()
+            ErrorNotification(f"Ошибка экспорта: {e}")
+
+        BackgroundTask(
+            progress_window,
+            lambda report: export_table(db_class, filename, where_clauses, order_by, dialect=dialect, progress=report),
+            on_progress=on_progress,
+            on_done=on_done,
+            on_error=on_error
+        ).start()
@@ -0,0 +1,92 @@
+from collections import OrderedDict
+from logging import getLogger
+from typing import Any
+
+from customtkinter import CTkBaseClass
+
+from .. import async_db
+from ..async_db import AsyncBridge
+from ..db import TableViewable, DisplayRow, Book, Reader, TakenBook
+
+
+logger = getLogger(__name__)
+
+# Сколько списков выданных книг хранится одновременно, самые давно использованные вытесняются
+PREFETCH_CACHE_SIZE = 32
+
+
+class LoansPrefetcher:
+    """
+    Заранее загружает списки выданных книг ("Выданные книги", "Взятые книги") для строки,
+    на кнопку которой наведён указатель, чтобы окно со списком открывалось без ожидания запроса.
+    Загрузка идёт в фоне через AsyncBridge, результаты хранятся в небольшом LRU кэше.
+    Любое изменение данных (см. TablesController.refresh и ChangeWatcher) очищает кэш.
+    """
+
+    _cache: OrderedDict[tuple[type[TableViewable], int], tuple[int, list[DisplayRow]]] = OrderedDict()
+    _pending: set[tuple[type[TableViewable], int]] = set()
+
+    # Увеличивается при очистке кэша, чтобы загрузки, начатые до изменения данных, не попали в кэш
+    _generation = 0
+
+    @staticmethod
+    def get_where_clause(owner_class: type[Book | Reader], owner_id: int) -> Any:
+        if owner_class is Book:
+            return TakenBook.book.has(Book.id == owner_id)
+
+        return TakenBook.reader.has(Reader.id == owner_id)
+
+    @staticmethod
+    def get_order_by() -> Any:
+        """ Порядок, который таблица выданных книг использует по умолчанию - первое поле сортировки """
+
+        return next(iter(TakenBook.get_sort_fields().values()))
+
+    @classmethod
+    def prefetch(cls, widget: CTkBaseClass, owner_class: type[Book | Reader], owner_id: int):
+        key = (owner_class, owner_id)
+        if not async_db.is_initialized() or key in cls._cache or key in cls._pending:
+            return
+
+        cls._pending.add(key)
+        generation = cls._generation
+
+        def on_done(result: tuple[int, list[DisplayRow]]):
+            cls._pending.discard(key)
+            if generation == cls._generation:
+                cls._put(key, result)
+
+        def on_error(error: BaseException):
+            cls._pending.discard(key)
+
+        AsyncBridge.run(widget,
+                        async_db.fetch_table_rows(TakenBook,
+                                                  [cls.get_where_clause(owner_class, owner_id)],
+                                                  cls.get_order_by()),
+                        on_done=on_done,
+                        on_error=on_error)
+
+    @classmethod
+    def get(cls, owner_class: type[Book | Reader], owner_id: int) -> tuple[int, list[DisplayRow]] | None:
+        """ Версия данных и строки, если список уже загружен, иначе None """
+
+        key = (owner_class, owner_id)
+        result = cls._cache.get(key)
+        if result is not None:
+            cls._cache.move_to_end(key)
+            logger.debug(f"Using prefetched loans of {owner_class.__name__} {owner_id}")
+
+        return result
+
+    @classmethod
+    def invalidate(cls):
+        cls._cache.clear()
+        cls._generation += 1
+
+    @classmethod
+    def _put(cls, key: tuple[type[TableViewable], int], result: tuple[int, list[DisplayRow]]):
+        cls._cache[key] = result
+        cls._cache.move_to_end(key)
+
+        while len(cls._cache) > PREFETCH_CACHE_SIZE:
+            cls._cache.popitem(last=False)
@@ -2,7 +2,10 @@ from customtkinter import CTkToplevel
 
 from .books import BooksController
 from .tables_controller import TablesController, refresh_tables
-from ..db import BookToReader, Reader, wrap_with_database, Session, add_event_to_history, EventType, History, TakenBook
+from .prefetch import LoansPrefetcher
+from .. import operations
+from ..db import BookToReader, Reader, History, TakenBook
+from ..exc import OperationError
 from ..interface import RowAction, ReaderEditWindow, NotificationWindow, ErrorNotification
 from ..style_models import StyleConfig
 
@@ -15,19 +18,25 @@ class ReadersController:
         table_window.title("Книги читателя")
 
         row_actions = (
-            RowAction(text="Вернуть", command=BooksController.return_book),
-            RowAction(text="Списать", command=BooksController.delete_one_instance_book)
+            RowAction(text="Вернуть", command=lambda loan: BooksController.return_book(table_window, loan)),
+            RowAction(text="Списать",
+                      command=lambda loan: BooksController.delete_one_instance_book(table_window, loan))
         )
 
         table = TablesController.create_table(
             db_class=TakenBook,
             style=style,
             master=table_window,
-            default_where_clause=TakenBook.reader.has(Reader.id == db_obj.id),
+            default_where_clause=LoansPrefetcher.get_where_clause(Reader, db_obj.id),
             row_actions=row_actions
         )
         table.pack(fill="both", expand=True)
-        table.refresh()
+
+        prefetched = LoansPrefetcher.get(Reader, db_obj.id)
+        if prefetched is not None:
+            table.show_rows(*prefetched)
+        else:
+            table.refresh()
         table.grab_set()
         table.master.wait_window(table)
 
@@ -39,8 +48,7 @@ class ReadersController:
 
     @staticmethod
     @refresh_tables((Reader, History))
-    @wrap_with_database
-    def delete_reader(reader: Reader, db: Session = None):
+    def delete_reader(reader: Reader):
         if len(reader.books_associations):
             ErrorNotification("Невозможно удалить читателя, пока на него записана хотя бы одна книга")
             return
@@ -53,6 +61,7 @@ class ReadersController:
         )
 
         if confirmation.get_input():
-            db.delete(reader)
-            db.commit()
-            add_event_to_history(EventType.READER_LEFT, f"Читатель '{reader.phone}' был удалён из базы данных")
+            try:
+                operations.delete_reader(reader.id)
+            except OperationError as e:
+                ErrorNotification(str(e))
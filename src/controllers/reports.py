@@ -0,0 +1,68 @@
+from logging import getLogger
+
+from .background import POLL_INTERVAL_MS
+from ..config_models import ConfigModel
+from ..interface import ProgressBarWindow, ErrorNotification, NotificationWindow
+from ..report_worker import ReportQueue, ReportJob
+
+
+logger = getLogger(__name__)
+
+REPORT_STAGES = ["Ожидание в очереди", "Построение отчёта"]
+
+
+class ReportsController:
+    _queue: ReportQueue | None = None
+    _polling: bool = False
+
+    @classmethod
+    def enqueue(cls, master, config: ConfigModel, filepath: str):
+        """ Ставит отчёт в очередь, прогресс показывается в немодальном окне с кнопкой отмены """
+
+        if cls._queue is None:
+            cls._queue = ReportQueue(config.database)
+
+        job = ReportJob(filepath=filepath)
+        progress_window = ProgressBarWindow(master,
+                                            title=f"Отчёт {job.id}",
+                                            stages=REPORT_STAGES,
+                                            modal=False,
+                                            on_cancel=lambda: cls._queue.cancel(job))
+
+        def on_progress(rows_done: int, rows_total: int):
+            progress_window.set_stage_progress(rows_done / rows_total if rows_total else 1.0,
+                                               f"{rows_done} из {rows_total} строк")
+
+        def on_done():
+            progress_window.stop()
+            NotificationWindow(title="Отчёт готов", message=f"Отчёт сохранён в файл '{filepath}'", wait_input=False)
+
+        def on_error(message: str):
+            progress_window.stop()
+            ErrorNotification(f"Не удалось построить отчёт: {message}")
+
+        job.on_start = progress_window.next
+        job.on_progress = on_progress
+        job.on_done = on_done
+        job.on_error = on_error
+        job.on_cancelled = progress_window.stop
+
+        cls._queue.submit(job)
+        cls._start_polling(master)
+
+    @classmethod
+    def _start_polling(cls, master):
+        if cls._polling:
+            return
+
+        cls._polling = True
+        master.after(POLL_INTERVAL_MS, lambda: cls._poll(master))
+
+    @classmethod
+    def _poll(cls, master):
+        cls._queue.poll()
+
+        if cls._queue.has_jobs():
+            master.after(POLL_INTERVAL_MS, lambda: cls._poll(master))
+        else:
+            cls._polling = False
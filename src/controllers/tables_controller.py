@@ -1,5 +1,9 @@
+from collections import defaultdict
 from typing import Type, Iterable, Callable
+from weakref import WeakSet, ref
 
+from .export import ExportController
+from .prefetch import LoansPrefetcher
 from ..interface import Table, RowAction
 from ..db import TableViewable
 
@@ -16,27 +20,79 @@ def refresh_tables(tables: Iterable[Type[TableViewable]] | Type[TableViewable] |
 
 
 class TablesController:
-    _tables: dict[Type[TableViewable], Table] = dict()
+    """
+    Реестр живых таблиц интерфейса. Таблиц одного класса может быть несколько (например, окна выданных книг),
+    ссылки на них слабые и удаляются при уничтожении таблицы вместе с окном.
+    """
+
+    _tables: dict[Type[TableViewable], WeakSet[Table]] = defaultdict(WeakSet)
 
     @classmethod
-    def create_table(cls, *args, **kwargs) -> Table:
-        new_table = Table(*args, **kwargs)
-        cls._tables[new_table.get_db_class()] = new_table
+    def create_table(cls, *args, table_class: Type[Table] = Table, **kwargs) -> Table:
+        kwargs.setdefault("export_command", ExportController.export_table_to_csv)
+
+        new_table = table_class(*args, **kwargs)
+        cls._tables[new_table.get_db_class()].add(new_table)
+
+        table_ref = ref(new_table)
+        new_table.bind("<Destroy>", lambda event: cls._unregister(table_ref()), add="+")
 
         return new_table
 
+    @classmethod
+    def get_tables(cls, db_class: Type[TableViewable] | None = None) -> list[Table]:
+        """ Живые таблицы класса db_class или все живые таблицы """
+
+        tables_sets = cls._tables.values() if db_class is None else (cls._tables.get(db_class, ()),)
+        return [table for tables in tables_sets for table in list(tables) if table.winfo_exists()]
+
     @classmethod
     def refresh_all(cls):
-        for table in cls._tables.values():
-            table.refresh()
+        for table in cls.get_tables():
+            table.request_refresh()
+
+    @classmethod
+    def refresh_outdated(cls, db_class: Type[TableViewable], change_id: int):
+        """ Обновляет таблицы, только если они показывают данные старее изменения change_id """
+
+        for table in cls.get_tables(db_class):
+            if table.is_outdated(change_id):
+                table.request_refresh()
+
+    @classmethod
+    def reload_rows(cls, db_class: Type[TableViewable], row_ids: set[int], deleted_row_ids: set[int],
+                    change_id: int, since_change_id: int):
+        """
+        Перечитывает в устаревших таблицах только изменённые строки, если таблица была актуальна
+        на момент since_change_id, иначе обновляет её целиком
+        """
+
+        for table in cls.get_tables(db_class):
+            if not table.is_outdated(change_id):
+                continue
+
+            if table.can_reload_rows(since_change_id):
+                table.reload_rows(row_ids, deleted_row_ids, change_id)
+            else:
+                table.request_refresh()
 
     @classmethod
     def refresh(cls, tables: Iterable[Type[TableViewable]] | Type[TableViewable] | None = None):
+        # Вызывается после изменения данных, заранее загруженные списки могли устареть
+        LoansPrefetcher.invalidate()
+
         if tables is None:
             cls.refresh_all()
-        elif isinstance(tables, Iterable):
-            for table in tables:
-                if table in cls._tables:
-                    cls._tables[table].refresh()
-        elif issubclass(tables, TableViewable) and (tables in cls._tables):
-            cls._tables[tables].refresh()
+            return
+
+        if not isinstance(tables, Iterable):
+            tables = (tables,)
+
+        for db_class in tables:
+            for table in cls.get_tables(db_class):
+                table.request_refresh()
+
+    @classmethod
+    def _unregister(cls, table: Table | None):
+        if table is not None:
+            cls._tables[table.get_db_class()].discard(table)
@@ -2,40 +2,98 @@ from logging import getLogger
 
 from tkinter import filedialog
 
-from .tables_controller import refresh_tables
-from ..json_dump import Dumper
-from ..pdf_report import PdfCreator
+from .background import BackgroundTask
+from .reports import ReportsController
+from .tables_controller import TablesController
+from ..interface import ProgressBarWindow, ErrorNotification, ScanPanel
+from ..db import Book, Reader, BookToReader, TakenBook, History
+from ..config_models import ConfigModel
 from ..wrappers import log_it
 
 
 logger = getLogger(__name__)
 
+# Совпадает с json_dump.SNAPSHOT_EXTENSION, сам json_dump импортируется только при первом экспорте/импорте
+SNAPSHOT_EXTENSION = ".lbsnap"
+DUMP_FILETYPES = [("Json file", ".json"), ("Snapshot file", SNAPSHOT_EXTENSION), ("Text file", ".txt")]
+IMPORT_STAGES = ["Импорт книг", "Импорт читателей", "Импорт истории"]
+
 
 class ToolBarController:
     @staticmethod
     @log_it(logger=logger)
     def on_dump():
+        from ..json_dump import Dumper
+
         filename = filedialog.asksaveasfilename(title="Choose file for dump",
                                                 defaultextension=".json",
-                                                filetypes=[("Json file", ".json"), ("Text file", ".txt")])
-        if filename:
-            Dumper.dump_to_file(filename)
+                                                filetypes=DUMP_FILETYPES)
+        # При отмене диалог может вернуть пустой кортеж вместо строки
+        if not filename:
+            return
+
+        progress_window = ProgressBarWindow(None, "Экспорт", ["Сохранение данных в файл"])
+        if filename.endswith(SNAPSHOT_EXTENSION):
+            target = lambda report: Dumper.dump_to_snapshot(filename)
+        else:
+            target = lambda report: Dumper.dump_to_file(filename, parallel=True)
+
+        def on_done(result):
+            progress_window.stop()
+
+        def on_error(e: Exception):
+            progress_window.stop()
+            ErrorNotification(f"Экспорт прерван: {e}")
+
+        BackgroundTask(progress_window, target, on_done=on_done, on_error=on_error).start()
 
     @staticmethod
-    @refresh_tables()
     @log_it(logger=logger)
     def on_load():
+        from ..json_dump import Dumper, ImportProgress
+
         filename = filedialog.askopenfilename(title="Choose dump file to import",
                                               defaultextension=".json",
-                                              filetypes=[("Json file", ".json"), ("Text file", ".txt")])
-        if filename:
-            Dumper.load_from_file(filename)
+                                              filetypes=DUMP_FILETYPES)
+        if not filename:
+            return
+
+        if filename.endswith(SNAPSHOT_EXTENSION):
+            progress_window = ProgressBarWindow(None, "Импорт", ["Восстановление из снимка"])
+            target = lambda report: Dumper.load_from_snapshot(filename)
+        else:
+            progress_window = ProgressBarWindow(None, "Импорт", IMPORT_STAGES)
+            target = lambda report: Dumper.load_from_file(filename, progress=report)
+
+        def on_progress(progress: ImportProgress):
+            progress_window.set_stage(progress.section_index)
+            progress_window.set_stage_progress(
+                progress.fraction,
+                f"{progress.done} из {progress.total} ({progress.records_per_second:.0f} записей/с)"
+            )
+
+        def on_done(result):
+            progress_window.stop()
+            TablesController.refresh()
+
+        def on_error(e: Exception):
+            progress_window.stop()
+            TablesController.refresh()
+            ErrorNotification(f"Импорт прерван: {e}\n"
+                              "Чтобы продолжить импорт с места остановки, выберите тот же файл ещё раз.")
+
+        BackgroundTask(progress_window, target, on_progress=on_progress, on_done=on_done, on_error=on_error).start()
 
     @staticmethod
     @log_it(logger=logger)
-    def on_pdf_report():
+    def on_pdf_report(master, config: ConfigModel):
         filename = filedialog.asksaveasfilename(title="Saving pdf report",
                                                 defaultextension=".pdf",
                                                 filetypes=[("PDF file", ".pdf")])
         if filename:
-            PdfCreator.create_pdf_report(filename)
+            ReportsController.enqueue(master, config, filename)
+
+    @staticmethod
+    @log_it(logger=logger)
+    def on_scan_mode(master):
+        ScanPanel(master, on_changed=lambda: TablesController.refresh((Book, Reader, BookToReader, TakenBook, History)))
@@ -0,0 +1,57 @@
+""" Потоковый экспорт содержимого таблиц в csv/tsv """
+
+import csv
+from typing import Any, Callable, Iterable, Type
+
+from .db import wrap_with_database, Session, TableViewable
+
+
+EXPORT_BATCH_SIZE = 1000
+
+CSV_DIALECT = "excel"
+TSV_DIALECT = "excel-tab"
+
+
+@wrap_with_database
+def export_table(db_class: Type[TableViewable],
+                 filepath: str,
+                 where_clauses: Iterable[Any] = (),
+                 order_by: Any = None,
+                 dialect: str = CSV_DIALECT,
+                 progress: Callable[[int], None] | None = None,
+                 db: Session = None) -> int:
+    """
+    Экспорт строк таблицы в csv файл, строки читаются из бд пачками через серверный курсор,
+    поэтому в памяти одновременно находится только одна пачка.
+
+    :param db_class: Класс таблицы
+    :param filepath: Путь до файла
+    :param where_clauses: Условия отбора строк (например, активный фильтр и поиск таблицы)
+    :param order_by: Поле сортировки
+    :param dialect: Диалект csv модуля, CSV_DIALECT или TSV_DIALECT
+    :param progress: Функция, в которую после каждой пачки передаётся количество записанных строк
+    :param db: Сессия базы данных
+    :return: Количество записанных строк
+    """
+
+    q = db_class.select_display_rows(where_clauses, order_by)
+
+    fields = db_class.get_table_fields()
+    rows_count = 0
+
+    # utf-8-sig, чтобы Excel правильно определил кодировку кириллицы
+    with open(filepath, "w", encoding="utf-8-sig", newline="") as f:
+        writer = csv.writer(f, dialect=dialect)
+        writer.writerow(fields)
+
+        for row in db.execute(q.execution_options(stream_results=True, yield_per=EXPORT_BATCH_SIZE)):
+            writer.writerow(db_class.make_display_row(row).values)
+
+            rows_count += 1
+            if progress and rows_count % EXPORT_BATCH_SIZE == 0:
+                progress(rows_count)
+
+    if progress:
+        progress(rows_count)
+
+    return rows_count
@@ -1,36 +1,102 @@
 import enum
-from typing import Any, Callable
+from typing import Any, Callable, Iterable, Iterator, Sequence
 from abc import abstractmethod, ABC
 from functools import wraps
+from contextlib import contextmanager
+from logging import getLogger
 from datetime import datetime
 
 import sqlalchemy as sql
 from sqlalchemy import (
-    Column, String, BigInteger, Integer, Engine, create_engine, DateTime, ForeignKey, ColumnElement, UniqueConstraint
+    Column, String, BigInteger, Integer, Engine, create_engine, DateTime, ForeignKey, ColumnElement, UniqueConstraint,
+    Boolean, event
 )
-from sqlalchemy.orm import declarative_base, sessionmaker, relationship, Session
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import declarative_base, sessionmaker, relationship, Session, object_session, aliased
 
 from .config_models import DbConfig
 
 
+logger = getLogger(__name__)
+
 _engine: Engine
 
 Base = declarative_base()
 
+# В SQLite автоинкремент работает только у первичного ключа типа INTEGER
+_IdType = BigInteger().with_variant(Integer(), "sqlite")
+
+
+def _enable_sqlite_savepoints(engine: Engine):
+    """
+    Драйвер sqlite3 сам управляет транзакциями и фиксирует их раньше времени, из-за чего не работают SAVEPOINT
+    (см. grouped_transaction_session). Транзакции начинаются явным BEGIN, как рекомендует документация SQLAlchemy.
+    """
+
+    @event.listens_for(engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, "begin")
+    def on_begin(connection):
+        connection.exec_driver_sql("BEGIN")
+
+
+def init_db(db_config: DbConfig | str):
+    """ Вместо конфига можно передать url базы данных, например sqlite:///library.db """
 
-def init_db(db_config: DbConfig):
     global _engine
 
-    _engine = create_engine(db_config.url)
+    _engine = create_engine(db_config if isinstance(db_config, str) else db_config.url)
+    if _engine.dialect.name == "sqlite":
+        _enable_sqlite_savepoints(_engine)
     sessionmaker(bind=_engine, expire_on_commit=False)
     Base.metadata.create_all(bind=_engine)
+    _upgrade_schema()
+
+    # create_all не добавляет индексы в уже существующие таблицы
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=_engine, checkfirst=True)
+
+
+def _upgrade_schema():
+    """ create_all не добавляет новые колонки в уже существующие таблицы, поэтому они добавляются здесь """
+
+    columns = {column["name"] for column in sql.inspect(_engine).get_columns(Book.__tablename__)}
+    missing = [name for name in ("taken_count", "available_count") if name not in columns]
+    if not missing:
+        return
+
+    logger.info(f"Adding columns {missing} to '{Book.__tablename__}' table")
+    with _engine.begin() as connection:
+        for name in missing:
+            connection.exec_driver_sql(f"ALTER TABLE {Book.__tablename__} ADD COLUMN {name} INTEGER NOT NULL DEFAULT 0")
+        recalculate_book_counters(connection)
+
+
+def recalculate_book_counters(db: Session | sql.Connection):
+    """
+    Пересчитывает taken_count и available_count всех книг по записям о выдаче.
+    Нужен после изменений мимо операций выдачи и возврата, например после восстановления из дампа.
+    """
+
+    books, loans = Book.__table__, BookToReader.__table__
+    taken = sql.select(sql.func.count(loans.c.id)).where(loans.c.book_id == books.c.id).scalar_subquery()
+
+    db.execute(sql.update(books).values(taken_count=taken, available_count=books.c.count - taken))
 
 
 def wrap_with_database(f: Callable):
-    """ Декоратор, который подсовывает в аргументы оборачиваемой функции сессию базы данных """
+    """
+    Декоратор, который подсовывает в аргументы оборачиваемой функции сессию базы данных.
+    Если сессия передана явно, функция выполняется в ней, например в рамках уже открытой транзакции.
+    """
 
     @wraps(f)
     def wrapper(*args, **kwargs):
+        if kwargs.get("db") is not None:
+            return f(*args, **kwargs)
 
         with Session(bind=_engine, expire_on_commit=False) as db:
             result = f(*args, **kwargs, db=db)
@@ -40,6 +106,58 @@ def wrap_with_database(f: Callable):
     return wrapper
 
 
+def supports_consistent_snapshot() -> bool:
+    """ Можно ли получить один согласованный снимок данных сразу в нескольких соединениях """
+
+    return _engine.dialect.name == "mysql"
+
+
+@contextmanager
+def consistent_snapshot_sessions(count: int, tables: Iterable[sql.Table]) -> Iterator[list[Session]]:
+    """
+    Открывает count сессий, читающих один и тот же согласованный снимок данных (только для MySQL).
+
+    Пока транзакции с CONSISTENT SNAPSHOT запускаются во всех сессиях, запись в таблицы
+    заблокирована через LOCK TABLES ... READ в отдельном соединении, после чего блокировка сразу снимается.
+    Если заблокировать таблицы не удалось (например, нет прав LOCK TABLES), снимки каждой сессии
+    будут согласованы только по отдельности.
+    """
+
+    sessions = [Session(bind=_engine, expire_on_commit=False) for _ in range(count)]
+    try:
+        with _engine.connect() as lock_connection:
+            try:
+                lock_connection.exec_driver_sql(
+                    "LOCK TABLES " + ", ".join(f"{table.name} READ" for table in tables)
+                )
+            except OperationalError:
+                logger.warning("Unable to lock tables, snapshots of sessions may differ", exc_info=True)
+
+            try:
+                for session in sessions:
+                    session.connection().exec_driver_sql("START TRANSACTION WITH CONSISTENT SNAPSHOT")
+            finally:
+                lock_connection.exec_driver_sql("UNLOCK TABLES")
+
+        yield sessions
+    finally:
+        for session in sessions:
+            session.close()
+
+
+@contextmanager
+def grouped_transaction_session() -> Iterator[Session]:
+    """
+    Сессия для выполнения нескольких операций одной транзакцией.
+    commit и rollback внутри операций затрагивают только SAVEPOINT этой операции, поэтому ошибка
+    одной операции не отменяет остальные. Всё фиксируется при выходе из блока или откатывается при исключении.
+    """
+
+    with _engine.connect() as connection, connection.begin():
+        with Session(bind=connection, join_transaction_mode="create_savepoint", expire_on_commit=False) as db:
+            yield db
+
+
 @wrap_with_database
 def add_event_to_history(event_type: "EventType", comment: str = "", db: Session = None):
     event = History(event_type=event_type, comment=comment)
@@ -48,9 +166,79 @@ def add_event_to_history(event_type: "EventType", comment: str = "", db: Session
     db.commit()
 
 
+def get_data_version(db: Session) -> int:
+    """ Номер последней записи журнала изменений, растёт при любом изменении данных через ORM """
+
+    return db.execute(sql.select(sql.func.max(ChangeLog.id))).scalar() or 0
+
+
+class DisplayRow:
+    """
+    Строка таблицы интерфейса: первичный ключ и готовые к показу значения колонок.
+    Таблицы хранят такие записи вместо ORM объектов, сами объекты загружаются только для действий над строкой.
+    """
+
+    __slots__ = ("id", "values", "sort_keys")
+
+    def __init__(self, row_id: int, values: tuple[str, ...], sort_keys: tuple[Any, ...] | None = None):
+        self.id = row_id
+        self.values = values
+        # Ключи для сортировки без запроса к бд, в порядке get_sort_fields; у строк из локального кэша их нет
+        self.sort_keys = sort_keys
+
+
+def _to_sort_key(value: Any) -> tuple:
+    """
+    Ключ, упорядочивающий значения примерно как ORDER BY в бд: NULL раньше остальных значений,
+    строки без учёта регистра, перечисления в порядке объявления (так MySQL сортирует колонки ENUM).
+    """
+
+    if value is None:
+        return 0,
+    if isinstance(value, str):
+        return 1, value.casefold()
+    if isinstance(value, enum.Enum):
+        return 1, list(type(value)).index(value)
+
+    return 1, value
+
+
 class TableViewable(Base):
     __abstract__ = True
 
+    @staticmethod
+    @abstractmethod
+    def get_display_query() -> sql.Select:
+        """ Запрос колонок для таблицы интерфейса: первая колонка - id, остальные в порядке get_table_fields """
+        ...
+
+    @staticmethod
+    def format_display_values(values: Sequence[Any]) -> tuple[str, ...]:
+        return tuple("" if value is None else str(value) for value in values)
+
+    @classmethod
+    def get_display_sort_columns(cls) -> tuple[Any, ...]:
+        return ()
+
+    @classmethod
+    def select_display_rows(cls, where_clauses: Iterable[Any] = (), order_by: Any = None) -> sql.Select:
+        """ Кроме колонок get_display_query выбираются колонки сортировки для make_display_row """
+
+        q = cls.get_display_query().add_columns(*cls.get_display_sort_columns())
+        for clause in where_clauses:
+            q = q.where(clause)
+        if order_by is not None:
+            q = q.order_by(order_by)
+
+        return q
+
+    @classmethod
+    def make_display_row(cls, row: Sequence[Any]) -> DisplayRow:
+        sort_start = len(row) - len(cls.get_display_sort_columns())
+        sort_keys = tuple(_to_sort_key(value) for value in row[sort_start:]) if sort_start < len(row) else None
+
+        return DisplayRow(row[0], cls.format_display_values(row[1:sort_start]), sort_keys)
+
     @staticmethod
     @abstractmethod
     def get_table_name() -> str:
@@ -79,16 +267,28 @@ class Sortable(TableViewable):
     def get_sort_fields() -> dict[str, Any]:
         ...
 
+    @classmethod
+    def get_display_sort_columns(cls) -> tuple[Any, ...]:
+        return tuple(cls.get_sort_fields().values())
+
+
+def _default_available_count(context) -> int:
+    return context.get_current_parameters().get("count") or 0
+
 
 class Book(Sortable):
     __tablename__ = "books"
 
-    id = Column(BigInteger(), primary_key=True)
+    id = Column(_IdType, primary_key=True)
     code = Column(String(32), unique=True, nullable=False)
     name = Column(String(128), nullable=False)
     author = Column(String(128), nullable=False)
     count = Column(Integer(), default=0, nullable=False)
 
+    # Поддерживаются операциями выдачи, возврата и списания (src.operations), available_count = count - taken_count
+    taken_count = Column(Integer(), default=0, server_default="0", nullable=False)
+    available_count = Column(Integer(), default=_default_available_count, server_default="0", nullable=False)
+
     readers_associations = relationship("BookToReader", back_populates="book", cascade="all, delete")
 
     @staticmethod
@@ -121,11 +321,20 @@ class Book(Sortable):
             "Всего": f"{self.count} шт."
         }
 
+    @staticmethod
+    def get_display_query() -> sql.Select:
+        return sql.select(Book.id, Book.code, Book.name, Book.author, Book.available_count, Book.count)
+
+    @staticmethod
+    def format_display_values(values: Sequence[Any]) -> tuple[str, ...]:
+        code, name, author, available_count, count = values
+        return code, name, author, f"{available_count} шт.", f"{count} шт."
+
     def get_available_count(self) -> int:
-        return self.count - self.get_taken_count()
+        return self.available_count
 
     def get_taken_count(self) -> int:
-        return len(self.readers_associations)
+        return self.taken_count
 
     @staticmethod
     def get_sort_fields() -> dict[str, Any]:
@@ -133,14 +342,15 @@ class Book(Sortable):
             "Код": Book.code,
             "Название": Book.name,
             "Автор": Book.author,
-            "Количество": Book.count
+            "Количество": Book.count,
+            "Доступно": Book.available_count
         }
 
 
 class Reader(Sortable):
     __tablename__ = "readers"
 
-    id = Column(BigInteger(), primary_key=True)
+    id = Column(_IdType, primary_key=True)
     firstname = Column(String(64))
     lastname = Column(String(64))
     phone = Column(String(12), unique=True, nullable=False)
@@ -176,6 +386,19 @@ class Reader(Sortable):
             "Книг взято": f"{len(self.books_associations)} шт.",
         }
 
+    @staticmethod
+    def get_display_query() -> sql.Select:
+        taken = (sql.select(sql.func.count(BookToReader.id))
+                 .where(BookToReader.reader_id == Reader.id)
+                 .scalar_subquery())
+
+        return sql.select(Reader.id, Reader.firstname, Reader.lastname, Reader.phone, taken)
+
+    @staticmethod
+    def format_display_values(values: Sequence[Any]) -> tuple[str, ...]:
+        *reader_values, taken = values
+        return TableViewable.format_display_values(reader_values) + (f"{taken} шт.",)
+
     @staticmethod
     def get_sort_fields() -> dict[str, Any]:
         return {
@@ -187,10 +410,10 @@ class Reader(Sortable):
 class BookToReader(Sortable):
     __tablename__ = "book_to_reader"
 
-    id = Column(BigInteger, primary_key=True)
+    id = Column(_IdType, primary_key=True)
     book_id = Column(BigInteger, ForeignKey("books.id", ondelete="CASCADE"))
     reader_id = Column(BigInteger, ForeignKey("readers.id", ondelete="RESTRICT"))
-    issue_date = Column(DateTime, default=datetime.now(), nullable=False)
+    issue_date = Column(DateTime, default=datetime.now, nullable=False, index=True)
 
     book = relationship("Book", back_populates="readers_associations")
     reader = relationship("Reader", back_populates="books_associations")
@@ -222,6 +445,16 @@ class BookToReader(Sortable):
             "Дата выдачи": self.issue_date
         }
 
+    @staticmethod
+    def get_display_query() -> sql.Select:
+        # Псевдонимы, чтобы подзапросы EXISTS из условий поиска не коррелировали с присоединёнными таблицами
+        book, reader = aliased(Book), aliased(Reader)
+
+        return (sql.select(BookToReader.id, book.code, reader.phone, BookToReader.issue_date)
+                .select_from(BookToReader)
+                .join(book, BookToReader.book)
+                .join(reader, BookToReader.reader))
+
     @staticmethod
     def get_sort_fields() -> dict[str, Any]:
         return {
@@ -240,12 +473,16 @@ class EventType(enum.Enum):
 class History(Sortable):
     __tablename__ = "history"
 
-    id = Column(BigInteger, primary_key=True)
+    id = Column(_IdType, primary_key=True)
 
-    time = Column(DateTime, default=datetime.now())
+    time = Column(DateTime, default=datetime.now)
     event_type = Column(sql.Enum(EventType), nullable=False)
     comment = Column(String(256), default="")
 
+    __table_args__ = (
+        sql.Index("ix_history_time_event_type", "time", "event_type"),
+    )
+
     @staticmethod
     def get_table_name() -> str:
         return "История"
@@ -261,6 +498,15 @@ class History(Sortable):
             "Комментарий": self.comment
         }
 
+    @staticmethod
+    def get_display_query() -> sql.Select:
+        return sql.select(History.id, History.time, History.event_type, History.comment)
+
+    @staticmethod
+    def format_display_values(values: Sequence[Any]) -> tuple[str, ...]:
+        time, event_type, comment = values
+        return TableViewable.format_display_values((time, event_type.value, comment))
+
     @staticmethod
     def get_search_where_clause(str_to_search: str = "") -> ColumnElement | None:
         return None
@@ -290,6 +536,15 @@ class TakenBook(BookToReader):
             "Дата выдачи": self.issue_date
         }
 
+    @staticmethod
+    def get_display_query() -> sql.Select:
+        book, reader = aliased(Book), aliased(Reader)
+
+        return (sql.select(TakenBook.id, book.code, book.name, book.author, reader.phone, TakenBook.issue_date)
+                .select_from(TakenBook)
+                .join(book, TakenBook.book)
+                .join(reader, TakenBook.reader))
+
     @staticmethod
     def get_search_where_clause(str_to_search: str = "") -> ColumnElement | None:
         if not str_to_search:
@@ -303,3 +558,50 @@ class TakenBook(BookToReader):
         )
 
         return clause
+
+
+# ----------- Журнал изменений ------------
+#   Используется для дифференциальных дампов
+
+class ChangeLog(Base):
+    __tablename__ = "change_log"
+
+    id = Column(_IdType, primary_key=True)
+    table_name = Column(String(32), nullable=False)
+    row_id = Column(BigInteger, nullable=False)
+    deleted = Column(Boolean, default=False, nullable=False)
+    time = Column(DateTime, default=datetime.now, nullable=False)
+
+
+# row_id записи журнала, которая означает, что могли измениться все строки таблицы (id строк начинаются с 1)
+WHOLE_TABLE_ROW_ID = 0
+
+
+def log_table_change(table_name: str, db: Session | sql.Connection):
+    """ Для массовых изменений таблицы мимо ORM, записывается в той же транзакции """
+
+    db.execute(sql.insert(ChangeLog.__table__).values(table_name=table_name, row_id=WHOLE_TABLE_ROW_ID))
+
+
+def _log_change(deleted: bool, only_modified: bool = False):
+    def listener(mapper, connection, target):
+        # after_update вызывается и для объектов, у которых изменились только коллекции связей
+        if only_modified and not object_session(target).is_modified(target, include_collections=False):
+            return
+
+        connection.execute(
+            sql.insert(ChangeLog.__table__).values(table_name=mapper.local_table.name,
+                                                   row_id=target.id,
+                                                   deleted=deleted)
+        )
+
+    return listener
+
+
+# Изменения записываются в той же транзакции, что и сами изменения строк.
+# Массовые операции (query.delete(), insert() по таблице) мимо ORM в журнал не попадают,
+# после них вызывается log_table_change.
+for _tracked_model in (Book, Reader, BookToReader, History):
+    event.listen(_tracked_model, "after_insert", _log_change(deleted=False), propagate=True)
+    event.listen(_tracked_model, "after_update", _log_change(deleted=False, only_modified=True), propagate=True)
+    event.listen(_tracked_model, "after_delete", _log_change(deleted=True), propagate=True)
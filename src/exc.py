@@ -8,3 +8,12 @@ class EmptyFieldError(ModelEditError):
 
 class FieldValidationError(ModelEditError):
     pass
+
+
+class OperationError(Exception):
+    """ Операцию с библиотекой нельзя выполнить, текст ошибки можно показать пользователю """
+    pass
+
+
+class ObjectNotFoundError(OperationError):
+    pass
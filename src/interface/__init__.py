@@ -1,5 +1,7 @@
 from .table import Table, RowAction
+from .canvas_table import CanvasTable
 from .input_dialog import CustomInputDialog
 from .notificate import NotificationWindow, ErrorNotification
 from .edit_windows import BookEditWindow, ReaderEditWindow
 from .progress_bar_window import ProgressBarWindow
+from .scan_panel import ScanPanel
@@ -0,0 +1,229 @@
+from math import ceil
+from tkinter import Canvas, Menu, Event
+
+from customtkinter import CTkFrame, CTkFont, CTkScrollbar, ThemeManager
+
+from .table import Table, RowAction
+from ..db import DisplayRow
+
+
+ROW_HEIGHT = 28
+HEADER_HEIGHT = 32
+ACTIONS_COLUMN_WIDTH = 36
+CELL_PADDING = 8
+
+# Сколько строк прокручивается одним движением колеса мыши
+WHEEL_SCROLL_ROWS = 3
+
+ACTIONS_ICON = "⋮"
+
+# Подписи в контекстном меню для действий, у которых на кнопке только картинка
+ACTION_TITLES = {
+    "edit": "Изменить",
+    "delete": "Удалить",
+}
+
+
+class CanvasTable(Table):
+    """
+    Таблица, которая рисует заголовки и только видимые строки на одном Canvas вместо отдельных
+    виджетов для каждой ячейки и кнопки, поэтому тысячи строк показываются почти без затрат Tk.
+    Действия над строкой доступны из контекстного меню: правый клик по строке или клик по значку в конце строки.
+    Загрузка, поиск, сортировка и кэш строк работают так же, как в Table.
+    """
+
+    def _create_table_area(self):
+        self._hovered_index: int | None = None
+        self._redraw_scheduled = False
+
+        self._font = CTkFont()
+        self._header_font = CTkFont(weight="bold")
+
+        area = CTkFrame(self)
+        area.pack(padx=4, pady=(2, 4), fill="both", expand=True)
+
+        self._canvas = Canvas(area, highlightthickness=0, borderwidth=0, yscrollincrement=ROW_HEIGHT)
+        self._scrollbar = CTkScrollbar(area, command=self._yview)
+        self._scrollbar.pack(side="right", fill="y")
+        self._canvas.pack(side="left", fill="both", expand=True)
+        self._canvas.configure(yscrollcommand=self._scrollbar.set)
+
+        self._canvas.bind("<Configure>", lambda event: self._schedule_redraw())
+        self._canvas.bind("<Motion>", self._on_motion)
+        self._canvas.bind("<Leave>", lambda event: self._set_hovered(None))
+        self._canvas.bind("<Button-1>", self._on_click)
+        self._canvas.bind("<Button-3>", self._on_context_menu)
+        self._canvas.bind("<MouseWheel>", self._on_mouse_wheel)
+        self._canvas.bind("<Button-4>", self._on_mouse_wheel)
+        self._canvas.bind("<Button-5>", self._on_mouse_wheel)
+
+    def _print_headers(self):
+        # Заголовки рисуются вместе со строками в _redraw
+        self._schedule_redraw()
+
+    def _add_row(self, row: DisplayRow):
+        self._rows.append(row)
+        self._schedule_redraw()
+
+    def _replace_rows(self, rows: list[DisplayRow], changed_ids: set[int]):
+        self._rows = list(rows)
+        self._hovered_index = None
+        self._schedule_redraw()
+
+    def clear(self):
+        self._rows.clear()
+        self._hovered_index = None
+        self._schedule_redraw()
+
+    # ----------- Отрисовка ------------
+
+    def _schedule_redraw(self):
+        """ Несколько изменений подряд (например, добавление всех строк) приводят к одной перерисовке """
+
+        if not self._redraw_scheduled:
+            self._redraw_scheduled = True
+            self.after_idle(self._redraw)
+
+    def _redraw(self):
+        self._redraw_scheduled = False
+        if not self._canvas.winfo_exists():
+            return
+
+        canvas = self._canvas
+        width = max(canvas.winfo_width(), 1)
+        height = canvas.winfo_height()
+
+        canvas.configure(bg=self._color("CTkFrame", "top_fg_color"),
+                         scrollregion=(0, 0, width, max(HEADER_HEIGHT + len(self._rows) * ROW_HEIGHT, height)))
+        canvas.delete("all")
+
+        columns = self._get_columns_x(width)
+        top = canvas.canvasy(0)
+
+        # Рисуются только строки, попадающие в видимую под заголовками часть
+        first = max(int(top // ROW_HEIGHT), 0)
+        last = min(ceil((top + height - HEADER_HEIGHT) / ROW_HEIGHT), len(self._rows))
+        for index in range(first, last):
+            self._draw_row(index, columns, width)
+
+        self._draw_headers(top, columns, width)
+
+    def _draw_headers(self, top: float, columns: list[float], width: int):
+        self._canvas.create_rectangle(0, top, width, top + HEADER_HEIGHT,
+                                      fill=self._color("CTkFrame", "fg_color"), width=0)
+
+        for field, x, next_x in zip(self._db_class.get_table_fields(), columns, columns[1:]):
+            self._draw_text(x, top + HEADER_HEIGHT / 2, field, next_x - x, self._header_font,
+                            self._color("CTkLabel", "text_color"))
+
+    def _draw_row(self, index: int, columns: list[float], width: int):
+        y = HEADER_HEIGHT + index * ROW_HEIGHT
+        row = self._rows[index]
+
+        if index == self._hovered_index:
+            self._canvas.create_rectangle(0, y, width, y + ROW_HEIGHT,
+                                          fill=self._color("CTkFrame", "border_color"), width=0)
+
+        # Строки из кэша могли устареть, действия над ними недоступны до загрузки из бд
+        if self._is_stale:
+            text_color = self._color("CTkButton", "text_color_disabled")
+        else:
+            text_color = self._color("CTkLabel", "text_color")
+
+        for value, x, next_x in zip(row.values, columns, columns[1:]):
+            self._draw_text(x, y + ROW_HEIGHT / 2, value, next_x - x, self._font, text_color)
+
+        if self._row_actions:
+            self._canvas.create_text(width - ACTIONS_COLUMN_WIDTH / 2, y + ROW_HEIGHT / 2,
+                                     text=ACTIONS_ICON, font=self._header_font,
+                                     fill=self._color("CTkButton", "fg_color"))
+
+    def _draw_text(self, x: float, y: float, text: str, max_width: float, font: CTkFont, color: str):
+        self._canvas.create_text(x + CELL_PADDING, y, text=self._fit_text(text, max_width - 2 * CELL_PADDING, font),
+                                 anchor="w", font=font, fill=color)
+
+    @staticmethod
+    def _fit_text(text: str, max_width: float, font: CTkFont) -> str:
+        """ Обрезает текст, не помещающийся в ячейку, Canvas сам этого не делает """
+
+        if font.measure(text) <= max_width:
+            return text
+
+        while text and font.measure(text + "…") > max_width:
+            text = text[:-1]
+
+        return text + "…"
+
+    def _get_columns_x(self, width: int) -> list[float]:
+        """ Левые границы колонок и правая граница последней, колонки одинаковой ширины """
+
+        fields_count = len(self._db_class.get_table_fields())
+        actions_width = ACTIONS_COLUMN_WIDTH if self._row_actions else 0
+        column_width = max(width - actions_width, 0) / fields_count
+
+        return [column * column_width for column in range(fields_count + 1)]
+
+    def _color(self, widget_name: str, color_name: str) -> str:
+        return self._apply_appearance_mode(ThemeManager.theme[widget_name][color_name])
+
+    # ----------- События ------------
+
+    def _yview(self, *args):
+        self._canvas.yview(*args)
+        self._redraw()
+
+    def _on_mouse_wheel(self, event: Event):
+        direction = -1 if event.num == 4 or event.delta > 0 else 1
+        self._canvas.yview_scroll(direction * WHEEL_SCROLL_ROWS, "units")
+        self._redraw()
+
+    def _get_row_index(self, event: Event) -> int | None:
+        """ Номер строки под указателем, None для заголовков и пустого места под строками """
+
+        if event.y < HEADER_HEIGHT:
+            return None
+
+        index = int((self._canvas.canvasy(event.y) - HEADER_HEIGHT) // ROW_HEIGHT)
+        return index if 0 <= index < len(self._rows) else None
+
+    def _on_motion(self, event: Event):
+        self._set_hovered(self._get_row_index(event))
+
+    def _set_hovered(self, index: int | None):
+        if index == self._hovered_index:
+            return
+
+        self._hovered_index = index
+        self._schedule_redraw()
+
+        if index is not None and self._row_actions:
+            for action in self._row_actions:
+                if action.on_hover is not None:
+                    action.on_hover(self._rows[index].id)
+
+    def _on_click(self, event: Event):
+        if self._row_actions and event.x >= self._canvas.winfo_width() - ACTIONS_COLUMN_WIDTH:
+            self._on_context_menu(event)
+
+    def _on_context_menu(self, event: Event):
+        index = self._get_row_index(event)
+        if index is None or not self._row_actions:
+            return
+
+        row_id = self._rows[index].id
+        menu = Menu(self, tearoff=0)
+        for action in self._row_actions:
+            menu.add_command(label=self._get_action_title(action),
+                             command=lambda action=action: action.run(
+                                 lambda: self._load_db_obj(row_id, action.load_relationships)
+                             ),
+                             state="disabled" if self._is_stale else "normal")
+
+        try:
+            menu.tk_popup(event.x_root, event.y_root)
+        finally:
+            menu.grab_release()
+
+    @staticmethod
+    def _get_action_title(action: RowAction) -> str:
+        return action.text or ACTION_TITLES.get(action.image_name, action.image_name or "")
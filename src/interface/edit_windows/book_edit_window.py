@@ -1,11 +1,11 @@
 from customtkinter import CTkFrame, CTkButton
-from sqlalchemy.exc import IntegrityError, DatabaseError, DataError
+from sqlalchemy.exc import DatabaseError
 
 from .basic_edit_window import BaseEditWindow
-from src.db import wrap_with_database, Book, Session
+from src import operations
+from src.db import Book
 from src.exc import ModelEditError
 from src.config_models import ConfigModel
-from src.validators import Validator
 
 
 class BookEditWindow(BaseEditWindow):
@@ -26,22 +26,15 @@ class BookEditWindow(BaseEditWindow):
         self.add_bottom_buttons()
         self.grab_set()
 
-    @wrap_with_database
-    def save(self, db: Session):
+    def save(self):
+        values = {
+            "code": self.process_field(self._code_entry),
+            "name": self.process_field(self._name_entry),
+            "author": self.process_field(self._author_entry),
+            "count": self.process_field(self._count_entry),
+        }
+
         try:
-            self._book.code = self.process_field(self._code_entry)
-            self._book.name = self.process_field(self._name_entry)
-            self._book.author = self.process_field(self._author_entry)
-            count = self.process_field(self._count_entry)
-
-            Validator.validate_book_count(count, self._book.get_taken_count())
-            self._book.count = count
-
-            db.add(self._book)
-            db.commit()
-        except IntegrityError:
-            raise ModelEditError("Ошибка, код книги дублируется")
-        except DataError as e:
-            raise ModelEditError(e.args[0])
+            self._book = operations.save_book(values, self._book.id)
         except DatabaseError as e:
             raise ModelEditError(e.args[0])
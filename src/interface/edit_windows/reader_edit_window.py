@@ -1,10 +1,9 @@
-from sqlalchemy.exc import IntegrityError, DatabaseError
+from sqlalchemy.exc import DatabaseError
 
 from .basic_edit_window import BaseEditWindow
-from src.db import wrap_with_database, Reader, Session, EventType, add_event_to_history
+from src import operations
+from src.db import Reader
 from src.exc import ModelEditError
-from src.config_models import ConfigModel
-from src.validators import Validator
 
 
 class ReaderEditWindow(BaseEditWindow):
@@ -25,20 +24,14 @@ class ReaderEditWindow(BaseEditWindow):
 
         self.after(50, self.grab_set)
 
-    @wrap_with_database
-    def save(self, db: Session):
-        try:
-            self._reader.firstname = self.process_field(self._firstname_entry)
-            self._reader.lastname = self.process_field(self._lastname_entry)
-            self._reader.phone = self.process_field(self._phone_entry)
-
-            Validator.validate_phone_number(self._reader.phone)
+    def save(self):
+        values = {
+            "firstname": self.process_field(self._firstname_entry),
+            "lastname": self.process_field(self._lastname_entry),
+            "phone": self.process_field(self._phone_entry),
+        }
 
-            db.add(self._reader)
-            db.commit()
-        except IntegrityError:
-            raise ModelEditError("Ошибка, номер телефона уже был зарегистрирован ранее")
+        try:
+            self._reader = operations.save_reader(values, self._reader.id)
         except DatabaseError as e:
             raise ModelEditError(e.args)
-
-        add_event_to_history(EventType.NEW_READER, f"Новый читатель '{self._reader.phone}'")
@@ -1,9 +1,16 @@
-from typing import Any
-from customtkinter import CTkToplevel, CTkLabel, CTk, CTkProgressBar
+from typing import Any, Callable
+from customtkinter import CTkToplevel, CTkLabel, CTk, CTkProgressBar, CTkButton
+
+from .. import profiler
 
 
 class ProgressBarWindow(CTkToplevel):
-    def __init__(self, master: Any, title: str, stages: list[str] | None):
+    def __init__(self,
+                 master: Any,
+                 title: str,
+                 stages: list[str] | None,
+                 modal: bool = True,
+                 on_cancel: Callable[[], None] | None = None):
         super().__init__(master)
 
         self.resizable(False, False)
@@ -12,8 +19,11 @@ class ProgressBarWindow(CTkToplevel):
         if not stages:
             stages = [title]
 
+        self._window_title = title
         self._stages = stages
         self._cur_stage = 0
+        self._stage_timer = profiler.StageTimer()
+        self._stage_timer.start(f"{title}: {stages[0]}")
 
         self._label = CTkLabel(self, text=stages[0])
         self._label.pack(side="top", pady=20, padx=20)
@@ -22,9 +32,17 @@ class ProgressBarWindow(CTkToplevel):
         self._progress_bar.set(0)
         self._progress_bar.pack(side="top", pady=20, padx=20)
         self._progress_bar.start()
-        self.master.grab_release()
-        self.wait_visibility()
-        self.grab_set()
+
+        if on_cancel:
+            self._cancel_button = CTkButton(self, text="Отменить", command=on_cancel)
+            self._cancel_button.pack(side="top", pady=(0, 20), padx=20)
+            self.protocol("WM_DELETE_WINDOW", on_cancel)
+
+        self._modal = modal
+        if modal:
+            self.master.grab_release()
+            self.wait_visibility()
+            self.grab_set()
         self.lift()
 
     def next(self):
@@ -34,10 +52,27 @@ class ProgressBarWindow(CTkToplevel):
         else:
             self.stop()
 
+    def set_stage(self, stage: int):
+        self._cur_stage = min(stage, len(self._stages) - 1)
+        self._update()
+
+    def set_stage_progress(self, fraction: float, details: str = ""):
+        """ Прогресс внутри текущего этапа, fraction - доля от 0 до 1 """
+
+        text = self._stages[self._cur_stage]
+        if details:
+            text = f"{text}\n{details}"
+
+        self._label.configure(text=text)
+        self._progress_bar.set((self._cur_stage + fraction) / len(self._stages))
+
     def stop(self):
-        self.grab_release()
+        self._stage_timer.finish()
+        if self._modal:
+            self.grab_release()
         self.destroy()
 
     def _update(self):
+        self._stage_timer.start(f"{self._window_title}: {self._stages[self._cur_stage]}")
         self._label.configure(text=self._stages[self._cur_stage])
         self._progress_bar.set(self._cur_stage / len(self._stages))
@@ -0,0 +1,104 @@
+from typing import Any, Callable
+
+from customtkinter import CTkToplevel, CTkEntry, CTkLabel, CTkButton, CTkFrame, CTkTextbox
+
+from ..scan_queue import ScanQueue, ScanResult
+
+
+# Как часто окно забирает результаты из очереди
+SCAN_POLL_INTERVAL_MS = 100
+
+# Сколько последних строк журнала показывается
+SCAN_LOG_MAX_LINES = 500
+
+NO_READER_TEXT = "Читатель не выбран, коды книг оформляются как возврат"
+
+
+class ScanPanel(CTkToplevel):
+    """
+    Окно режима сканирования: коды из поля ввода (сканер штрихкодов завершает код клавишей Enter)
+    ставятся в очередь src.scan_queue, а результаты их применения дописываются в журнал.
+    on_changed вызывается, если после очередной порции кодов данные в бд изменились.
+    """
+
+    def __init__(self, master: Any, on_changed: Callable[[], None] | None = None):
+        super().__init__(master)
+
+        self.title("Режим сканирования")
+        self.minsize(600, 400)
+
+        self._on_changed = on_changed
+        self._queue = ScanQueue().start()
+
+        self._create_widgets()
+
+        self.protocol("WM_DELETE_WINDOW", self._on_close)
+        self.after(SCAN_POLL_INTERVAL_MS, self._poll)
+        self.after(100, self._entry.focus_set)
+
+    def _create_widgets(self):
+        top_frame = CTkFrame(self)
+        top_frame.pack(padx=10, pady=(10, 4), fill="x")
+
+        self._entry = CTkEntry(top_frame, placeholder_text="Телефон читателя или код книги", width=260)
+        self._entry.pack(padx=4, pady=4, side="left")
+        self._entry.bind("<Return>", self._on_scan)
+
+        reset_button = CTkButton(top_frame, text="Сбросить читателя", command=self._queue.reset_reader)
+        reset_button.pack(padx=4, pady=4, side="left")
+
+        self._pending_label = CTkLabel(top_frame, text="")
+        self._pending_label.pack(padx=4, pady=4, side="right")
+
+        self._reader_label = CTkLabel(self, text=NO_READER_TEXT)
+        self._reader_label.pack(padx=14, pady=2, anchor="w")
+
+        self._log = CTkTextbox(self, state="disabled")
+        self._log.pack(padx=10, pady=(4, 10), fill="both", expand=True)
+
+    def _on_scan(self, event=None):
+        self._queue.put(self._entry.get())
+        self._entry.delete(0, "end")
+        self._update_pending()
+
+    def _poll(self):
+        if not self.winfo_exists():
+            return
+
+        results = self._queue.get_results()
+        if results:
+            self._show_results(results)
+
+            if self._on_changed and any(result.changed for result in results):
+                self._on_changed()
+
+        self._update_pending()
+        self.after(SCAN_POLL_INTERVAL_MS, self._poll)
+
+    def _show_results(self, results: list[ScanResult]):
+        lines = [f"{result.time:%H:%M:%S}  {'OK' if result.ok else 'Ошибка'}  {result.message}\n"
+                 for result in results]
+
+        self._log.configure(state="normal")
+        self._log.insert("end", "".join(lines))
+
+        extra_lines = int(self._log.index("end-1c").split(".")[0]) - 1 - SCAN_LOG_MAX_LINES
+        if extra_lines > 0:
+            self._log.delete("1.0", f"{extra_lines + 1}.0")
+
+        self._log.configure(state="disabled")
+        self._log.see("end")
+
+        phone = results[-1].current_phone
+        if phone:
+            self._reader_label.configure(text=f"Читатель: {phone}, коды книг оформляются как выдача или возврат")
+        else:
+            self._reader_label.configure(text=NO_READER_TEXT)
+
+    def _update_pending(self):
+        pending = self._queue.pending_count()
+        self._pending_label.configure(text=f"В очереди: {pending}" if pending else "")
+
+    def _on_close(self):
+        self._queue.stop()
+        self.destroy()
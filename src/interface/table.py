@@ -1,15 +1,21 @@
 from typing import Type, TypeVar, Callable, Any
 from logging import getLogger
+from tkinter import Misc
 
 import sqlalchemy as sql
+from sqlalchemy.orm import selectinload
 from customtkinter import (
     CTkScrollableFrame, CTkButton, CTkFrame, CTkBaseClass, CTkLabel, CTkFont, CTkEntry, CTkOptionMenu,
     CTkSwitch
 )
 
-from ..db import TableViewable, Session, wrap_with_database, Sortable
+from .notificate import ErrorNotification
+from ..db import TableViewable, Session, wrap_with_database, Sortable, get_data_version, DisplayRow
 from ..style_models import StyleConfig, ButtonStyle
 from ..image_manager import ImagesManager
+from ..table_cache import TableCache, CachedTable
+from .. import async_db
+from ..async_db import AsyncBridge
 
 
 _RowType = TypeVar("_RowType", Type[TableViewable | Sortable], None)
@@ -21,31 +27,47 @@ class RowAction:
     def __init__(self,
                  command: Callable[[TableViewable], None] | Callable,
                  text: str = "",
-                 image_name: str = None):
+                 image_name: str = None,
+                 on_hover: Callable[[int], None] = None,
+                 load_relationships: tuple[Any, ...] = ()):
 
         self.text = text
         self.command = command
+        # Вызывается с id строки при наведении на кнопку, например для предзагрузки данных
+        self.on_hover = on_hover
+        # Связи объекта строки, которые нужны команде: объект передаётся в неё уже без сессии
+        self.load_relationships = load_relationships
 
         self.image_name = image_name
 
-    def get_action_button(self, master: CTkScrollableFrame,
-                          button_style: ButtonStyle,
-                          db_obj: TableViewable = None) -> CTkButton:
+    def run(self, get_db_obj: Callable[[], TableViewable | None] = None):
+        """ Объект строки получается через get_db_obj только при выполнении действия """
 
-        def command():
-            if db_obj:
-                self.command(db_obj)
-            else:
-                self.command()
+        if get_db_obj is None:
+            self.command()
+            return
 
-        return CTkButton(
+        db_obj = get_db_obj()
+        if db_obj is not None:
+            self.command(db_obj)
+
+    def get_action_button(self, master: CTkScrollableFrame,
+                          button_style: ButtonStyle,
+                          get_db_obj: Callable[[], TableViewable | None] = None,
+                          row_id: int | None = None) -> CTkButton:
+        button = CTkButton(
             master=master,
             text=self.text,
-            command=command,
+            command=lambda: self.run(get_db_obj),
             image=ImagesManager.get(self.image_name, size=button_style.height - 8) if self.image_name else None,
             **button_style.dict()
         )
 
+        if self.on_hover is not None and row_id is not None:
+            button.bind("<Enter>", lambda event: self.on_hover(row_id))
+
+        return button
+
 
 class Table(CTkFrame):
     def __init__(self,
@@ -56,15 +78,19 @@ class Table(CTkFrame):
                  searchable: bool = True,
                  row_actions: list[RowAction] = None,
                  add_command: Callable = None,
+                 export_command: Callable[["Table"], None] = None,
                  default_where_clause: Any = None,
+                 cache_key: str = None,
                  **kwargs):
 
         super().__init__(*args, master=master, **kwargs)
 
         self._db_class = db_class
         self._add_command = add_command
+        self._export_command = export_command
         self._row_actions = row_actions
         self._default_where_clause = default_where_clause
+        self._search_where_clause = None
         self._searchable = searchable
         self._style = style
         self._in_table_buttons_style = style.in_table_buttons
@@ -73,17 +99,65 @@ class Table(CTkFrame):
         self._sortable = issubclass(db_class, Sortable)
         self._sort_with_desc = False
 
-        self._rows: list[db_class] = list()
-        self._rows_widgets: list[CTkBaseClass] = list()
+        self._rows: list[DisplayRow] = list()
+        # Виджеты строк по id строки, чтобы при частичном обновлении пересоздавать только изменённые строки
+        self._rows_widgets: dict[int, list[CTkBaseClass]] = dict()
+
+        # Для сохранения показанных строк в локальный кэш (см. show_cached и save_cache)
+        self._cache_key = cache_key
+        self._data_version = 0
+        self._is_stale = False
+        self._refresh_id = 0
+        self._shown_refresh_id = 0
+
+        # Обновление скрытой таблицы откладывается до её появления на экране (см. request_refresh)
+        self._needs_refresh = False
 
         self._create_widgets()
 
+        # Таблица становится видимой при показе её самой, её вкладки или окна.
+        # Misc.bind, так как bind виджетов customtkinter привязывает события к внутреннему canvas
+        for widget in {self, self.master, self.winfo_toplevel()}:
+            Misc.bind(widget, "<Map>", self._on_map, add="+")
+
     def get_db_class(self):
         return self._db_class
 
     def set_default_where_clause(self, where_clause: Any):
         self._default_where_clause = where_clause
 
+    def get_where_clauses(self) -> list[Any]:
+        """ Активные условия отбора строк: фильтр таблицы и поиск """
+
+        return [clause for clause in (self._default_where_clause, self._search_where_clause) if clause is not None]
+
+    def get_order_by(self) -> Any:
+        return self._get_order_field() if self._sortable else None
+
+    def is_outdated(self, change_id: int) -> bool:
+        """
+        Таблица устарела, если изменение новее версии данных, с которой были прочитаны её строки.
+        Ещё не загруженные и обновляющиеся прямо сейчас таблицы устаревшими не считаются.
+        """
+
+        is_loaded = self._shown_refresh_id and self._shown_refresh_id == self._refresh_id
+        return bool(is_loaded) and self._data_version < change_id
+
+    def is_viewable(self) -> bool:
+        return bool(self.winfo_exists() and self.winfo_viewable())
+
+    def request_refresh(self):
+        """ Обновляет таблицу, если она на экране, иначе обновит её при показе """
+
+        if self.is_viewable():
+            self.refresh()
+        else:
+            self._needs_refresh = True
+
+    def _on_map(self, event=None):
+        if self._needs_refresh and self.is_viewable():
+            self.refresh()
+
     def _create_widgets(self):
         buttons_frame = CTkFrame(self)
         buttons_frame.pack(pady=(4, 2), padx=4, side="top", fill="x")
@@ -107,12 +181,27 @@ class Table(CTkFrame):
                                    height=self._other_buttons_style.height)
             add_button.pack(padx=4, pady=2, side="left")
 
+        if self._export_command:
+            export_button = CTkButton(buttons_frame,
+                                      text="CSV",
+                                      command=lambda: self._export_command(self),
+                                      width=self._other_buttons_style.height,
+                                      height=self._other_buttons_style.height)
+            export_button.pack(padx=4, pady=2, side="left")
+
+        self._stale_label = CTkLabel(buttons_frame, text="Данные из кэша, идёт обновление...")
+
         if self._searchable:
             self._create_search_frame(buttons_frame)
 
         if self._sortable:
             self._create_sort_frame(buttons_frame)
 
+        self._create_table_area()
+
+    def _create_table_area(self):
+        """ Область со строками таблицы, переопределяется другими способами отрисовки (см. CanvasTable) """
+
         self._table_frame = CTkScrollableFrame(self)
         self._table_frame.pack(padx=4, pady=(2, 4), fill="both", expand=True)
 
@@ -167,25 +256,73 @@ class Table(CTkFrame):
                                     text="Сортировать по:")
         self._sort_label.pack(padx=(16, 4), pady=4, side="right")
 
-    def _add_row(self, row: TableViewable):
-        row_elements: list[CTkBaseClass] = [CTkLabel(self._table_frame, text=value)
-                                            for value in row.get_values().values()]
+    def _add_row(self, row: DisplayRow):
+        row_elements = self._create_row_widgets(row)
+        self._grid_row(row_elements, len(self._rows))
+
+        self._rows.append(row)
+        self._rows_widgets[row.id] = row_elements
+
+    def _create_row_widgets(self, row: DisplayRow) -> list[CTkBaseClass]:
+        row_elements: list[CTkBaseClass] = [CTkLabel(self._table_frame, text=value) for value in row.values]
 
         if self._row_actions:
             for action in self._row_actions:
-                row_elements.append(
-                    action.get_action_button(
-                        self._table_frame,
-                        db_obj=row,
-                        button_style=self._in_table_buttons_style
-                    )
+                button = action.get_action_button(
+                    self._table_frame,
+                    get_db_obj=lambda row_id=row.id, action=action: self._load_db_obj(
+                        row_id, action.load_relationships
+                    ),
+                    row_id=row.id,
+                    button_style=self._in_table_buttons_style
                 )
+                # Строки из кэша могли устареть, действия над ними недоступны до загрузки из бд
+                if self._is_stale:
+                    button.configure(state="disabled")
+                row_elements.append(button)
 
+        return row_elements
+
+    @staticmethod
+    def _grid_row(row_elements: list[CTkBaseClass], index: int):
+        # Нулевая строка сетки занята заголовками
         for column, element in enumerate(row_elements):
-            element.grid(row=len(self._rows) + 1, column=column, padx=4, pady=4)
+            element.grid(row=index + 1, column=column, padx=4, pady=4)
+
+    def _replace_rows(self, rows: list[DisplayRow], changed_ids: set[int]):
+        """
+        Показывает rows, виджеты создаются заново только для изменённых и новых строк,
+        остальные переставляются в сетке, если их место изменилось
+        """
+
+        shown_ids = {row.id for row in rows}
+        for row_id in list(self._rows_widgets):
+            if row_id in changed_ids or row_id not in shown_ids:
+                for widget in self._rows_widgets.pop(row_id):
+                    widget.destroy()
+
+        old_indexes = {row.id: index for index, row in enumerate(self._rows)}
+        for index, row in enumerate(rows):
+            row_elements = self._rows_widgets.get(row.id)
+            if row_elements is None:
+                row_elements = self._rows_widgets[row.id] = self._create_row_widgets(row)
+            elif old_indexes.get(row.id) == index:
+                continue
+            self._grid_row(row_elements, index)
+
+        self._rows = list(rows)
 
-        self._rows.append(row)
-        self._rows_widgets.extend(row_elements)
+    @wrap_with_database
+    def _load_db_obj(self, row_id: int, relationships: tuple[Any, ...] = (),
+                     db: Session = None) -> TableViewable | None:
+        """ Объект строки загружается только для выполнения действия над ней, вместе со связями, нужными действию """
+
+        db_obj = db.get(self._db_class, row_id, options=[selectinload(relationship) for relationship in relationships])
+        if db_obj is None:
+            ErrorNotification("Запись уже удалена, таблица будет обновлена")
+            self.refresh()
+
+        return db_obj
 
     def _print_headers(self):
         header_font = CTkFont(weight="bold")
@@ -197,41 +334,200 @@ class Table(CTkFrame):
     def clear(self):
         self._rows.clear()
 
-        for widget in self._rows_widgets:
-            widget.destroy()
+        for row_elements in self._rows_widgets.values():
+            for widget in row_elements:
+                widget.destroy()
         self._rows_widgets.clear()
 
+    def show_cached(self) -> bool:
+        """ Показывает строки из локального кэша до первой загрузки из бд, возвращает False, если кэша нет """
+
+        if not self._cache_key:
+            return False
+
+        cached = TableCache().load(self._cache_key, self._db_class.get_table_fields())
+        if cached is None:
+            return False
+
+        self.clear()
+        self._set_stale(True)
+        for row_id, values in cached.rows:
+            self._add_row(DisplayRow(row_id, tuple(values)))
+
+        logger.info(f"Shown {len(cached.rows)} cached rows of '{self._db_class.get_table_name()}' table")
+
+        return True
+
+    def save_cache(self):
+        """ Сохраняет показанные строки, если они были загружены из бд без поиска и фильтров """
+
+        if not self._cache_key or self._is_stale or self.get_where_clauses():
+            return
+
+        cached = CachedTable(fields=self._db_class.get_table_fields(),
+                             rows=[(row.id, list(row.values)) for row in self._rows])
+        TableCache().save(self._cache_key, cached)
+
     def refresh(self, where_clause: Any = None):
         logger.info(f"Refreshing '{self._db_class.get_table_name()}' table with where_clause='{where_clause}'")
-        self.clear()
+        self._needs_refresh = False
 
-        self.after(5, lambda: self._fill_from_database(where_clause))
+        # Строки из кэша остаются на экране, пока не загрузятся актуальные
+        if not self._is_stale:
+            self.clear()
 
-    @wrap_with_database
-    def _fill_from_database(self, where_clause: Any = None, db: Session = None):
-        q = db.query(self._db_class)
-        if self._default_where_clause is not None:
-            q = q.where(self._default_where_clause)
+        where_clauses = self.get_where_clauses()
         if where_clause is not None:
-            q = q.where(where_clause)
+            where_clauses.append(where_clause)
+
+        # Показывается результат только последнего обновления, даже если предыдущие завершатся позже
+        self._refresh_id += 1
+        refresh_id = self._refresh_id
+
+        self._load_rows(where_clauses, self.get_order_by(),
+                        on_done=lambda result: self._show_rows(*result, refresh_id=refresh_id))
+
+    def can_reload_rows(self, since_change_id: int) -> bool:
+        """
+        Отдельные строки можно перечитать, если таблица на экране и показывает актуальные данные
+        не старее since_change_id: тогда все более поздние изменения её строк известны по id.
+        """
+
+        is_loaded = self._shown_refresh_id and self._shown_refresh_id == self._refresh_id
+        return (bool(is_loaded) and not self._is_stale and self.is_viewable()
+                and self._data_version >= since_change_id)
+
+    def reload_rows(self, row_ids: set[int], deleted_row_ids: set[int], change_id: int):
+        """
+        Перечитывает только изменённые строки (см. can_reload_rows), остальные строки остаются на экране.
+        Строки, которые больше не подходят под условия отбора, убираются, новые подходящие - добавляются.
+        change_id - последнее изменение, после которого таблица становится актуальной.
+        """
+
+        refresh_id = self._refresh_id
+        changed_ids = row_ids | deleted_row_ids
+        logger.info(f"Reloading {len(changed_ids)} rows of '{self._db_class.get_table_name()}' table")
+
+        row_ids = row_ids - deleted_row_ids
+        if not row_ids:
+            self._apply_changed_rows([], changed_ids, change_id, refresh_id)
+            return
+
+        where_clauses = self.get_where_clauses() + [self._db_class.id.in_(row_ids)]
+        self._load_rows(where_clauses, None,
+                        on_done=lambda result: self._apply_changed_rows(result[1], changed_ids, change_id, refresh_id))
+
+    def _apply_changed_rows(self, rows: list[DisplayRow], changed_ids: set[int], change_id: int, refresh_id: int):
+        # Полное обновление, начатое после запроса строк, покажет их само
+        if refresh_id != self._refresh_id:
+            return
+
+        new_rows = {row.id: row for row in rows}
+        merged = [new_rows.pop(row.id, None) if row.id in changed_ids else row for row in self._rows]
+        merged = [row for row in merged if row is not None] + list(new_rows.values())
+
+        if self._sortable and self._can_sort_locally() and all(row.sort_keys is not None for row in merged):
+            merged = self._sort_rows(merged)
+
+        self._replace_rows(merged, changed_ids)
+        self._data_version = max(self._data_version, change_id)
+
+    def _load_rows(self, where_clauses: list[Any], order_by: Any,
+                   on_done: Callable[[tuple[int, list[DisplayRow]]], None]):
+        if async_db.is_initialized():
+            AsyncBridge.run(self,
+                            async_db.fetch_table_rows(self._db_class, where_clauses, order_by),
+                            on_done=on_done,
+                            on_error=self._on_load_error)
+        else:
+            # Импорт здесь, так как пакет controllers сам импортирует interface
+            from ..controllers.background import BackgroundTask
+
+            BackgroundTask(self,
+                           lambda report: self._fetch_rows(where_clauses, order_by),
+                           on_done=on_done,
+                           on_error=self._on_load_error).start()
+
+    def _on_load_error(self, error: BaseException):
+        logger.error(f"Unable to load rows of '{self._db_class.get_table_name()}' table: {error!r}")
+        ErrorNotification(f"Не удалось загрузить таблицу '{self._db_class.get_table_name()}'.\n"
+                          f"Ошибка: {error}")
+
+    def show_rows(self, data_version: int, rows: list[DisplayRow]):
+        """ Показывает строки, загруженные заранее (например, см. controllers.prefetch), без запроса к бд """
+
+        self._refresh_id += 1
+        self._show_rows(data_version, rows, self._refresh_id)
+
+    def _set_stale(self, is_stale: bool):
+        self._is_stale = is_stale
+
+        if is_stale:
+            self._stale_label.pack(padx=4, pady=2, side="left")
+        else:
+            self._stale_label.pack_forget()
 
-        if self._sortable:
-            q = q.order_by(self._get_order_field())
+    @wrap_with_database
+    def _fetch_rows(self, where_clauses: list[Any], order_by: Any,
+                    db: Session = None) -> tuple[int, list[DisplayRow]]:
+        """ Выполняется в фоновом потоке, поэтому не обращается к виджетам """
+
+        q = self._db_class.select_display_rows(where_clauses, order_by)
+
+        # Версия читается до строк, чтобы изменения между запросами не потерялись при проверке is_outdated
+        data_version = get_data_version(db)
+        return data_version, [self._db_class.make_display_row(row) for row in db.execute(q)]
 
-        for row in q.all():
+    def _show_rows(self, data_version: int, rows: list[DisplayRow], refresh_id: int):
+        if refresh_id != self._refresh_id:
+            return
+
+        self.clear()
+        self._set_stale(False)
+        for row in rows:
             self._add_row(row)
 
+        self._data_version = data_version
+        self._shown_refresh_id = refresh_id
+
     def _on_search(self, event=None):
-        where_clause = self._db_class.get_search_where_clause(self._search_entry.get())
-        self._default_where_clause = where_clause
-        self.refresh(where_clause=where_clause)
+        self._search_where_clause = self._db_class.get_search_where_clause(self._search_entry.get())
+        self.refresh()
 
     def _on_sort_field_select(self, event=None):
-        self.refresh()
+        self._resort()
 
     def _on_sort_desc_switch(self):
         self._sort_with_desc = self._desc_switch.get()
-        self.refresh()
+        self._resort()
+
+    def _can_sort_locally(self) -> bool:
+        """
+        Показанные строки можно пересортировать без запроса к бд, если это полный актуальный результат:
+        строки загружены последним обновлением (не из кэша и не в процессе загрузки) и у них есть ключи сортировки.
+        Постраничной загрузки нет, поэтому загруженный результат всегда полный.
+        """
+
+        is_loaded = self._shown_refresh_id and self._shown_refresh_id == self._refresh_id
+        return bool(is_loaded) and not self._is_stale and all(row.sort_keys is not None for row in self._rows)
+
+    def _resort(self):
+        if not self._can_sort_locally():
+            self.refresh()
+            return
+
+        rows = self._sort_rows(self._rows)
+
+        logger.debug(f"Sorting {len(rows)} rows of '{self._db_class.get_table_name()}' table locally")
+
+        # Существующие виджеты строк только переставляются в сетке
+        self._replace_rows(rows, changed_ids=set())
+
+    def _sort_rows(self, rows: list[DisplayRow]) -> list[DisplayRow]:
+        """ Сортирует строки по их ключам сортировки так же, как отсортировал бы запрос с get_order_by """
+
+        key_index = list(self._db_class.get_sort_fields()).index(self._sort_box.get())
+        return sorted(rows, key=lambda row: row.sort_keys[key_index], reverse=bool(self._sort_with_desc))
 
     def _get_order_field(self) -> Any:
         sort_box_choice = self._sort_box.get()
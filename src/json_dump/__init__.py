@@ -1 +1,2 @@
-from .dumper import Dumper
+from .dumper import Dumper, SNAPSHOT_EXTENSION
+from .checkpoint import ImportProgress
@@ -0,0 +1,85 @@
+""" Контрольные точки и прогресс импорта дампа """
+
+import json
+import os
+import time
+from dataclasses import dataclass, asdict, field
+from logging import getLogger
+from pathlib import Path
+
+
+logger = getLogger(__name__)
+
+CHECKPOINT_SUFFIX = ".checkpoint"
+
+
+@dataclass
+class ImportProgress:
+    section: str
+    section_index: int
+    sections_count: int
+    done: int
+    total: int
+    started_from: int = 0
+    started_at: float = field(default_factory=time.monotonic)
+
+    @property
+    def fraction(self) -> float:
+        return self.done / self.total if self.total else 1.0
+
+    @property
+    def records_per_second(self) -> float:
+        elapsed = time.monotonic() - self.started_at
+        return (self.done - self.started_from) / elapsed if elapsed > 0 else 0.0
+
+
+@dataclass
+class ImportCheckpoint:
+    """
+    Позиция, с которой можно продолжить импорт: секция и количество уже сохранённых в бд записей.
+    Размер и время изменения файла дампа сохраняются, чтобы не продолжить импорт другого файла.
+    """
+
+    source_size: int
+    source_mtime: float
+    section: str = ""
+    offset: int = 0
+
+    @staticmethod
+    def get_path(dump_filepath: str) -> Path:
+        return Path(dump_filepath + CHECKPOINT_SUFFIX)
+
+    @classmethod
+    def for_file(cls, dump_filepath: str) -> "ImportCheckpoint":
+        """ Возвращает сохранённую контрольную точку для файла, или новую, если её нет или она устарела """
+
+        stat = os.stat(dump_filepath)
+        new_checkpoint = cls(source_size=stat.st_size, source_mtime=stat.st_mtime)
+
+        path = cls.get_path(dump_filepath)
+        if not path.exists():
+            return new_checkpoint
+
+        try:
+            saved_checkpoint = cls(**json.loads(path.read_text(encoding="UTF-8")))
+        except (ValueError, TypeError):
+            logger.warning(f"Ignoring broken checkpoint '{path}'")
+            return new_checkpoint
+
+        if (saved_checkpoint.source_size, saved_checkpoint.source_mtime) != (stat.st_size, stat.st_mtime):
+            logger.info(f"Dump file was changed, ignoring checkpoint '{path}'")
+            return new_checkpoint
+
+        logger.info(f"Resuming import from section '{saved_checkpoint.section}', offset {saved_checkpoint.offset}")
+        return saved_checkpoint
+
+    def save(self, dump_filepath: str):
+        path = self.get_path(dump_filepath)
+        tmp_path = path.with_suffix(path.suffix + ".tmp")
+
+        tmp_path.write_text(json.dumps(asdict(self)), encoding="UTF-8")
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def remove(cls, dump_filepath: str):
+        cls.get_path(dump_filepath).unlink(missing_ok=True)
@@ -1,32 +1,97 @@
+from typing import Callable
 from logging import getLogger
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import replace
 
-from . import pydantic_models
-from .. import db as database
-from ..interface import ErrorNotification
+import sqlalchemy as sql
+from sqlalchemy.orm import selectinload
+
+from . import pydantic_models, snapshot
+from .checkpoint import ImportCheckpoint, ImportProgress
+from .. import db as database, change_feed
 
 
 logger = getLogger(__name__)
 
+SNAPSHOT_EXTENSION = ".lbsnap"
+INSERT_BATCH_SIZE = 1000
+IMPORT_BATCH_SIZE = 500
+
+_SNAPSHOT_TABLES = {
+    "books": database.Book.__table__,
+    "readers": database.Reader.__table__,
+    "book_to_reader": database.BookToReader.__table__,
+    "history": database.History.__table__,
+}
+
+
+def _chunks(items: list, size: int):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
 
 class Dumper:
     """ Класс для взаимодействия с файлами дампов """
 
-    @staticmethod
-    @database.wrap_with_database
-    def dump_to_file(filepath: str, db: database.Session = None):
+    @classmethod
+    def dump_to_file(cls, filepath: str, parallel: bool = False):
         """
         Экспорт данных их бд в файл в формате json.
 
         :param filepath: Путь до файла
-        :param db: Сессия базы данных
+        :param parallel: Читать секции дампа параллельно, каждую в своём соединении
         """
 
         logger.debug("Collect dump data")
-        books = [pydantic_models.Book(**vars(db_book)) for db_book in db.query(database.Book).all()]
+        if parallel and database.supports_consistent_snapshot():
+            books, readers, events = cls._collect_sections_parallel()
+        else:
+            books, readers, events = cls._collect_sections()
+
+        file_model = pydantic_models.FileModel(books=books, readers=readers, history=events)
+
+        logger.debug(f"Saving dump data to file '{filepath}'")
+        with open(filepath, "w", encoding="UTF-8") as f:
+            f.write(file_model.json(indent=4, ensure_ascii=False))
+
+    @classmethod
+    @database.wrap_with_database
+    def _collect_sections(cls, db: database.Session = None) -> tuple[list, ...]:
+        return tuple(collect(db) for collect in cls._get_section_collectors())
+
+    @classmethod
+    def _collect_sections_parallel(cls) -> tuple[list, ...]:
+        """
+        Каждая секция читается в отдельном соединении из пула,
+        все соединения видят один и тот же согласованный снимок данных
+        """
+
+        collectors = cls._get_section_collectors()
+
+        with database.consistent_snapshot_sessions(len(collectors), _SNAPSHOT_TABLES.values()) as sessions:
+            with ThreadPoolExecutor(max_workers=len(collectors)) as executor:
+                futures = [executor.submit(collect, db) for collect, db in zip(collectors, sessions)]
+
+                return tuple(future.result() for future in futures)
+
+    @classmethod
+    def _get_section_collectors(cls) -> list[Callable[[database.Session], list]]:
+        return [cls._collect_books, cls._collect_readers, cls._collect_history]
+
+    @staticmethod
+    def _collect_books(db: database.Session) -> list[pydantic_models.Book]:
+        return [pydantic_models.Book(**vars(db_book)) for db_book in db.query(database.Book).all()]
+
+    @staticmethod
+    def _collect_readers(db: database.Session) -> list[pydantic_models.Reader]:
+        db_readers = db.query(
+            database.Reader
+        ).options(
+            selectinload(database.Reader.books_associations).selectinload(database.BookToReader.book)
+        ).all()
 
-        db_readers = db.query(database.Reader).all()
         pydantic_readers = list()
-        for i, db_reader in enumerate(db_readers):
+        for db_reader in db_readers:
             reader_books = [pydantic_models.BookIssue(book_code=association.book.code, issue_date=association.issue_date)
                             for association in db_reader.books_associations]
             pydantic_reader = pydantic_models.Reader(firstname=db_reader.firstname,
@@ -35,46 +100,102 @@ class Dumper:
                                                      books=reader_books)
             pydantic_readers.append(pydantic_reader)
 
-        events = [pydantic_models.Event(**vars(event))
-                  for event in db.query(database.History).all()]
+        return pydantic_readers
 
-        file_model = pydantic_models.FileModel(books=books, readers=pydantic_readers, history=events)
-
-        logger.debug(f"Saving dump data to file '{filepath}'")
-        with open(filepath, "w", encoding="UTF-8") as f:
-            f.write(file_model.json(indent=4, ensure_ascii=False))
+    @staticmethod
+    def _collect_history(db: database.Session) -> list[pydantic_models.Event]:
+        return [pydantic_models.Event(**vars(event)) for event in db.query(database.History).all()]
 
     @classmethod
     @database.wrap_with_database
-    def load_from_file(cls, filepath: str, db: database.Session = None):
+    def load_from_file(cls,
+                       filepath: str,
+                       progress: Callable[[ImportProgress], None] | None = None,
+                       db: database.Session = None):
         """
-        Импорт данных в бд из json файла
+        Импорт данных в бд из json файла.
+        Данные сохраняются пачками, после каждой пачки записывается контрольная точка,
+        поэтому прерванный импорт того же файла продолжится с места остановки.
+        Контрольная точка записывается после коммита пачки, поэтому при сбое между ними пачка будет
+        импортирована повторно: книги и читатели обновляются по коду и телефону, а позиция в истории
+        при продолжении берётся из бд (см. _get_imported_history_count).
 
         :param filepath: Путь до файла
+        :param progress: Функция, в которую передаётся прогресс импорта
         :param db: Сессия базы данных
         """
 
         file_model = pydantic_models.FileModel.parse_file(filepath)
+        checkpoint = ImportCheckpoint.for_file(filepath)
+
+        sections = [
+            ("books", file_model.books, cls._import_books),
+            ("readers", file_model.readers, cls._import_readers),
+            ("history", file_model.history, cls._import_history),
+        ]
+        section_names = [name for name, _, _ in sections]
+        start_section = section_names.index(checkpoint.section) if checkpoint.section in section_names else 0
+
+        for section_index, (name, records, import_batch) in enumerate(sections[start_section:], start=start_section):
+            offset = checkpoint.offset if name == checkpoint.section else 0
+            if name == "history" and offset:
+                offset = cls._get_imported_history_count(checkpoint.offset, db)
+            section_progress = ImportProgress(section=name,
+                                              section_index=section_index,
+                                              sections_count=len(sections),
+                                              done=offset,
+                                              started_from=offset,
+                                              total=len(records))
+            logger.debug(f"Importing section '{name}' from offset {offset}")
+
+            for batch_start in range(offset, len(records), IMPORT_BATCH_SIZE):
+                if progress:
+                    progress(replace(section_progress))
 
-        # Заносим книги в базу данных
-        for book in file_model.books:
-            # Проверяем, есть ли в базе книга с таким кодом
-            db_book: database.Book = db.query(database.Book).where(database.Book.code == book.code).first()
+                batch = records[batch_start:batch_start + IMPORT_BATCH_SIZE]
+                import_batch(batch, batch_start, db)
+                db.commit()
+
+                checkpoint.section, checkpoint.offset = name, batch_start + len(batch)
+                checkpoint.save(filepath)
+                section_progress.done = checkpoint.offset
+
+            if progress:
+                progress(replace(section_progress))
+
+        # Записи о выдаче вставлялись напрямую, поэтому счётчики книг пересчитываются по ним
+        database.recalculate_book_counters(db)
+        db.commit()
+
+        ImportCheckpoint.remove(filepath)
+
+    @staticmethod
+    def _import_books(books: list[pydantic_models.Book], offset: int, db: database.Session):
+        # Книги, которые уже есть в базе, просто обновляем
+        db_books = {db_book.code: db_book
+                    for db_book in db.query(database.Book).where(database.Book.code.in_([book.code for book in books]))}
+
+        for book in books:
+            db_book = db_books.get(book.code)
             if not db_book:
-                # Если книги в бд нет, создаём
-                db_book = database.Book(**book.dict())
-                db.add(db_book)
+                db.add(database.Book(**book.dict()))
             else:
-                # Если есть, просто обновляем
                 db_book.name = book.name
                 db_book.author = book.author
                 db_book.count = book.count
 
-        db.commit()
+    @staticmethod
+    def _import_readers(readers: list[pydantic_models.Reader], offset: int, db: database.Session):
+        db_readers = {
+            db_reader.phone: db_reader
+            for db_reader in db.query(database.Reader).where(database.Reader.phone.in_([r.phone for r in readers]))
+        }
+
+        book_codes = {issue.book_code for reader in readers for issue in reader.books}
+        book_ids = dict(db.query(database.Book.code, database.Book.id).where(database.Book.code.in_(book_codes)).all())
 
-        # Заносим читателей в базу данных
-        for reader in file_model.readers:
-            db_reader = db.query(database.Reader).where(database.Reader.phone == reader.phone).first()
+        for reader in readers:
+            db_reader = db_readers.get(reader.phone)
 
             if not db_reader:
                 db_reader = database.Reader(firstname=reader.firstname,
@@ -87,29 +208,249 @@ class Dumper:
                 for assoc in db_reader.books_associations:
                     db.delete(assoc)
 
-            db.commit()
+            for book_issue in reader.books:
+                db_reader.books_associations.append(
+                    database.BookToReader(book_id=book_ids[book_issue.book_code], issue_date=book_issue.issue_date)
+                )
+
+    @staticmethod
+    def _import_history(events: list[pydantic_models.Event], offset: int, db: database.Session):
+        # Историю из дампа заносим вместо текущей
+        if offset == 0:
+            db.query(database.History).delete()
+            database.log_table_change(database.History.__tablename__, db)
+
+        db.add_all(database.History(**event.dict()) for event in events)
 
-            cls._add_books_to_reader(db_reader, reader.books, db)
+    @staticmethod
+    def _get_imported_history_count(checkpoint_offset: int, db: database.Session) -> int:
+        # История очищается перед первой пачкой, поэтому все события в таблице уже импортированы из дампа
+        imported = db.query(sql.func.count(database.History.id)).scalar()
+        if imported != checkpoint_offset:
+            logger.warning(f"Checkpoint history offset {checkpoint_offset} differs from {imported} imported events")
 
-        db.query(database.History).delete()
+        return imported
 
-        for event in file_model.history:
-            db_event = database.History(**event.dict())
-            db.add(db_event)
+    @classmethod
+    @database.wrap_with_database
+    def dump_to_snapshot(cls, filepath: str, since_dump_id: int | None = None, db: database.Session = None):
+        """
+        Экспорт данных из бд в бинарный снимок (см. модуль snapshot).
+        Если указан since_dump_id, то снимок будет дифференциальным: в него попадут
+        только строки, изменённые после снимка с этим идентификатором, и отметки об удалённых строках.
 
+        :param filepath: Путь до файла
+        :param since_dump_id: Идентификатор снимка, относительно которого делается дифференциальный снимок
+        :param db: Сессия базы данных
+        """
+
+        # Журнал изменений хранится ограниченное время (см. change_feed.prune_change_log)
+        if since_dump_id is not None and since_dump_id + 1 < change_feed.get_oldest_change_id(db=db):
+            raise snapshot.SnapshotChainError(f"Changes after dump {since_dump_id} were pruned from the change log, "
+                                              f"make a full snapshot")
+
+        dump_id = cls._get_dump_id(db)
+
+        file_snapshot = snapshot.Snapshot(meta={snapshot.META_DUMP_ID: dump_id})
+        if since_dump_id is not None:
+            file_snapshot.meta[snapshot.META_BASE_DUMP_ID] = since_dump_id
+
+        logger.debug(f"Collect snapshot data, dump_id={dump_id}, since_dump_id={since_dump_id}")
+        tombstones = list()
+        for name, table in _SNAPSHOT_TABLES.items():
+            if since_dump_id is None:
+                rows = cls._select_snapshot_rows(name, db)
+            elif database.WHOLE_TABLE_ROW_ID in (changed_ids := cls._get_changed_ids(name, since_dump_id, db)):
+                # Удалённые при массовом изменении строки неизвестны, поэтому в снимок идёт вся таблица
+                # с отметкой, что строк, которых в нём нет, быть не должно
+                rows = cls._select_snapshot_rows(name, db)
+                tombstones.append((name, database.WHOLE_TABLE_ROW_ID))
+            else:
+                rows = list()
+                for ids in _chunks(changed_ids, INSERT_BATCH_SIZE):
+                    rows.extend(cls._select_snapshot_rows(name, db, table.c.id.in_(ids)))
+
+                existing_ids = {row[0] for row in rows}
+                tombstones.extend((name, row_id) for row_id in changed_ids if row_id not in existing_ids)
+
+            file_snapshot.sections[name] = snapshot.Section.from_rows(name, rows)
+
+        if since_dump_id is not None:
+            file_snapshot.sections[snapshot.TOMBSTONES_SECTION] = snapshot.Section.from_rows(
+                snapshot.TOMBSTONES_SECTION, tombstones
+            )
+
+        logger.debug(f"Saving snapshot to file '{filepath}'")
+        with open(filepath, "wb") as f:
+            snapshot.write_snapshot(file_snapshot, f)
+
+        return dump_id
+
+    @classmethod
+    @database.wrap_with_database
+    def load_from_snapshot(cls, filepath: str, *delta_filepaths: str, db: database.Session = None):
+        """
+        Восстановление бд из бинарного снимка.
+        Текущее содержимое таблиц полностью заменяется содержимым снимка,
+        строки вставляются пачками без построения ORM и pydantic объектов.
+        Затем по порядку применяются дифференциальные снимки, всё в одной транзакции.
+
+        :param filepath: Путь до полного снимка
+        :param delta_filepaths: Пути до дифференциальных снимков
+        :param db: Сессия базы данных
+        """
+
+        base = cls._read_snapshot(filepath)
+        if base.is_delta:
+            raise snapshot.SnapshotChainError(f"'{filepath}' is a differential snapshot, full snapshot expected")
+
+        cls._restore_full(base, db)
+
+        dump_id = base.meta.get(snapshot.META_DUMP_ID, 0)
+        for delta_filepath in delta_filepaths:
+            delta = cls._read_snapshot(delta_filepath)
+            if not delta.is_delta:
+                raise snapshot.SnapshotChainError(f"'{delta_filepath}' is not a differential snapshot")
+            if delta.meta[snapshot.META_BASE_DUMP_ID] > dump_id:
+                raise snapshot.SnapshotChainError(
+                    f"'{delta_filepath}' is based on dump {delta.meta[snapshot.META_BASE_DUMP_ID]}, "
+                    f"but restored data is from dump {dump_id}"
+                )
+
+            cls._apply_delta(delta, db)
+            dump_id = delta.meta[snapshot.META_DUMP_ID]
+
+        database.recalculate_book_counters(db)
         db.commit()
 
     @staticmethod
-    def _add_books_to_reader(reader: database.Reader,
-                             books: list[pydantic_models.BookIssue],
-                             db: database.Session):
+    def _read_snapshot(filepath: str) -> snapshot.Snapshot:
+        with open(filepath, "rb") as f:
+            return snapshot.read_snapshot(f)
 
-        for book_issue in books:
-            db_book = db.query(database.Book).where(database.Book.code == book_issue.book_code).first()
-            association = database.BookToReader(book_id=db_book.id,
-                                                reader_id=reader.id,
-                                                issue_date=book_issue.issue_date)
+    @staticmethod
+    def _select_snapshot_rows(name: str, db: database.Session, where_clause=None) -> list[tuple]:
+        table = _SNAPSHOT_TABLES[name]
+        q = sql.select(*[table.c[column] for column in snapshot.SECTIONS_SCHEMA[name]]).order_by(table.c.id)
+        if where_clause is not None:
+            q = q.where(where_clause)
 
-            reader.books_associations.append(association)
+        rows = db.execute(q).all()
+        if name == "history":
+            rows = [(event_id, time, snapshot.EVENT_TYPE_CODES[event_type], comment)
+                    for event_id, time, event_type, comment in rows]
 
-        db.commit()
+        return rows
+
+    @staticmethod
+    def _get_dump_id(db: database.Session) -> int:
+        """
+        Наибольший id журнала изменений, до которого включительно все изменения уже видны в транзакции снимка
+        (см. change_feed.ChangeCursor). Изменения с большими id, уже попавшие в снимок, повторно войдут
+        в следующий дифференциальный снимок: строки в нём берутся в текущем состоянии,
+        поэтому повторное применение ничего не портит.
+        """
+
+        cursor = change_feed.get_cursor(db=db)
+        if cursor.gaps:
+            logger.info(f"Change {min(cursor.gaps)} is not committed yet, dump_id={cursor.settled_change_id}")
+
+        return cursor.settled_change_id
+
+    @staticmethod
+    def _get_changed_ids(name: str, since_dump_id: int, db: database.Session) -> list[int]:
+        """ Все видимые изменения после since_dump_id, в том числе выше dump_id текущего снимка """
+
+        q = sql.select(
+            database.ChangeLog.row_id
+        ).where(
+            database.ChangeLog.table_name == name,
+            database.ChangeLog.id > since_dump_id
+        ).distinct()
+
+        return list(db.execute(q).scalars())
+
+    @staticmethod
+    def _get_section_rows(file_snapshot: snapshot.Snapshot, name: str) -> list[dict]:
+        section = file_snapshot.sections.get(name)
+        if section is None:
+            return list()
+
+        if name == "history":
+            section.columns["event_type"] = [snapshot.EVENT_TYPES_BY_CODE[code]
+                                             for code in section.columns["event_type"]]
+
+        return list(section.iter_rows())
+
+    @classmethod
+    def _restore_full(cls, file_snapshot: snapshot.Snapshot, db: database.Session):
+        # Удаляем в порядке, обратном зависимостям внешних ключей
+        for table in reversed(_SNAPSHOT_TABLES.values()):
+            db.execute(sql.delete(table))
+
+        for name, table in _SNAPSHOT_TABLES.items():
+            rows = cls._get_section_rows(file_snapshot, name)
+            logger.debug(f"Restoring {len(rows)} rows of '{name}'")
+            for batch in _chunks(rows, INSERT_BATCH_SIZE):
+                db.execute(sql.insert(table), batch)
+
+            database.log_table_change(name, db)
+
+    @classmethod
+    def _apply_delta(cls, delta: snapshot.Snapshot, db: database.Session):
+        connection = db.connection()
+        changed_tables = set()
+        section_ids = dict()
+
+        for name, table in _SNAPSHOT_TABLES.items():
+            rows = cls._get_section_rows(delta, name)
+            logger.debug(f"Applying {len(rows)} changed rows of '{name}'")
+            section_ids[name] = {row["id"] for row in rows}
+            if rows:
+                changed_tables.add(name)
+
+            for batch in _chunks(rows, INSERT_BATCH_SIZE):
+                ids = [row["id"] for row in batch]
+                existing_ids = set(connection.execute(sql.select(table.c.id).where(table.c.id.in_(ids))).scalars())
+
+                # Существующие строки обновляем, а не пересоздаём, чтобы не сработали каскадные удаления
+                updated = [{**row, "_id": row["id"]} for row in batch if row["id"] in existing_ids]
+                inserted = [row for row in batch if row["id"] not in existing_ids]
+
+                if updated:
+                    connection.execute(sql.update(table).where(table.c.id == sql.bindparam("_id")), updated)
+                if inserted:
+                    connection.execute(sql.insert(table), inserted)
+
+        tombstones = cls._get_section_rows(delta, snapshot.TOMBSTONES_SECTION)
+        for name, table in reversed(_SNAPSHOT_TABLES.items()):
+            ids = [tombstone["row_id"] for tombstone in tombstones if tombstone["table_name"] == name]
+            if database.WHOLE_TABLE_ROW_ID in ids:
+                # Таблица в снимке целиком, удаляются все строки, которых в нём нет
+                ids = [row_id for row_id in connection.execute(sql.select(table.c.id)).scalars()
+                       if row_id not in section_ids[name]]
+
+            logger.debug(f"Deleting {len(ids)} rows of '{name}'")
+            for batch in _chunks(ids, INSERT_BATCH_SIZE):
+                connection.execute(sql.delete(table).where(table.c.id.in_(batch)))
+            if ids:
+                changed_tables.add(name)
+
+        for name in _SNAPSHOT_TABLES:
+            if name in changed_tables:
+                database.log_table_change(name, connection)
+
+    @staticmethod
+    def convert_snapshot_to_json(snapshot_path: str, json_path: str):
+        with open(snapshot_path, "rb") as f:
+            file_model = snapshot.snapshot_to_file_model(snapshot.read_snapshot(f))
+
+        with open(json_path, "w", encoding="UTF-8") as f:
+            f.write(file_model.json(indent=4, ensure_ascii=False))
+
+    @staticmethod
+    def convert_json_to_snapshot(json_path: str, snapshot_path: str):
+        file_model = pydantic_models.FileModel.parse_file(json_path)
+
+        with open(snapshot_path, "wb") as f:
+            snapshot.write_snapshot(snapshot.file_model_to_snapshot(file_model), f)
@@ -0,0 +1,319 @@
+"""
+Компактный бинарный формат снимка базы данных.
+
+Структура файла (все числа little-endian)::
+
+    magic (6 байт) | версия (u16)
+    meta:    количество (u16), далее пары (строка ключа, i64 значение)
+    секции:  количество (u16), далее для каждой секции:
+             имя (строка) | число строк (u32) | число колонок (u16)
+             колонки: имя (строка) | тип (u8) | длина данных (u32) | данные
+
+Данные колонки - битовая маска NULL значений, затем сами не-NULL значения.
+Строки хранятся как u32 длина + UTF-8, даты - как i64 микросекунды от эпохи.
+"""
+
+import enum
+import struct
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Any, BinaryIO, Iterator
+
+from . import pydantic_models
+from ..db import EventType
+
+
+MAGIC = b"LBSNAP"
+FORMAT_VERSION = 1
+
+# Ключи meta заголовка
+META_DUMP_ID = "dump_id"
+META_BASE_DUMP_ID = "base_dump_id"  # есть только у дифференциальных снимков
+
+# Отметки об удалённых строках дифференциального снимка, row_id = db.WHOLE_TABLE_ROW_ID означает,
+# что таблица в снимке целиком и строки, которых в нём нет, удаляются
+TOMBSTONES_SECTION = "tombstones"
+
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+class ColumnType(enum.IntEnum):
+    INT = 1
+    STR = 2
+    DATETIME = 3
+
+
+# Коды типов событий фиксированы, чтобы снимок не зависел от порядка членов EventType
+EVENT_TYPE_CODES: dict[EventType, int] = {
+    EventType.BOOK_TAKEN: 1,
+    EventType.BOOK_RETURNED: 2,
+    EventType.NEW_READER: 3,
+    EventType.READER_LEFT: 4,
+    EventType.BOOK_WRITTEN_OFF: 5,
+}
+EVENT_TYPES_BY_CODE: dict[int, EventType] = {code: event_type for event_type, code in EVENT_TYPE_CODES.items()}
+
+# Набор секций и колонок снимка, секции перечислены в порядке восстановления
+SECTIONS_SCHEMA: dict[str, dict[str, ColumnType]] = {
+    "books": {
+        "id": ColumnType.INT,
+        "code": ColumnType.STR,
+        "name": ColumnType.STR,
+        "author": ColumnType.STR,
+        "count": ColumnType.INT,
+    },
+    "readers": {
+        "id": ColumnType.INT,
+        "firstname": ColumnType.STR,
+        "lastname": ColumnType.STR,
+        "phone": ColumnType.STR,
+    },
+    "book_to_reader": {
+        "id": ColumnType.INT,
+        "book_id": ColumnType.INT,
+        "reader_id": ColumnType.INT,
+        "issue_date": ColumnType.DATETIME,
+    },
+    "history": {
+        "id": ColumnType.INT,
+        "time": ColumnType.DATETIME,
+        "event_type": ColumnType.INT,
+        "comment": ColumnType.STR,
+    },
+    TOMBSTONES_SECTION: {
+        "table_name": ColumnType.STR,
+        "row_id": ColumnType.INT,
+    },
+}
+
+
+class SnapshotFormatError(Exception):
+    pass
+
+
+class SnapshotChainError(Exception):
+    pass
+
+
+@dataclass
+class Section:
+    """ Секция снимка, данные хранятся по колонкам """
+
+    name: str
+    columns: dict[str, list[Any]] = field(default_factory=dict)
+
+    @classmethod
+    def empty(cls, name: str) -> "Section":
+        return cls(name=name, columns={column: list() for column in SECTIONS_SCHEMA[name]})
+
+    @classmethod
+    def from_rows(cls, name: str, rows: Iterator[tuple]) -> "Section":
+        """ Собирает секцию из строк, порядок значений в строке совпадает со схемой секции """
+
+        section = cls.empty(name)
+        columns = list(section.columns.values())
+        for row in rows:
+            for column, value in zip(columns, row):
+                column.append(value)
+
+        return section
+
+    def __len__(self) -> int:
+        return len(next(iter(self.columns.values()), ()))
+
+    def iter_rows(self) -> Iterator[dict[str, Any]]:
+        names = list(self.columns)
+        for values in zip(*self.columns.values()):
+            yield dict(zip(names, values))
+
+
+@dataclass
+class Snapshot:
+    sections: dict[str, Section] = field(default_factory=dict)
+    meta: dict[str, int] = field(default_factory=dict)
+
+    def __getitem__(self, name: str) -> Section:
+        return self.sections[name]
+
+    @property
+    def is_delta(self) -> bool:
+        return META_BASE_DUMP_ID in self.meta
+
+
+# ----------- Запись ------------
+
+def _pack_str(value: str) -> bytes:
+    encoded = value.encode("UTF-8")
+    return struct.pack("<I", len(encoded)) + encoded
+
+
+def _encode_values(column_type: ColumnType, values: list[Any]) -> bytes:
+    if column_type == ColumnType.INT:
+        return struct.pack(f"<{len(values)}q", *values)
+    if column_type == ColumnType.DATETIME:
+        return struct.pack(f"<{len(values)}q", *((value - _EPOCH) // _MICROSECOND for value in values))
+    if column_type == ColumnType.STR:
+        return b"".join(_pack_str(value) for value in values)
+
+    raise SnapshotFormatError(f"Unknown column type {column_type}")
+
+
+def _encode_column(column_type: ColumnType, values: list[Any]) -> bytes:
+    null_mask = bytearray((len(values) + 7) // 8)
+    not_null = list()
+    for i, value in enumerate(values):
+        if value is None:
+            null_mask[i // 8] |= 1 << (i % 8)
+        else:
+            not_null.append(value)
+
+    return bytes(null_mask) + _encode_values(column_type, not_null)
+
+
+def write_snapshot(snapshot: Snapshot, f: BinaryIO):
+    f.write(MAGIC + struct.pack("<H", FORMAT_VERSION))
+
+    f.write(struct.pack("<H", len(snapshot.meta)))
+    for key, value in snapshot.meta.items():
+        f.write(_pack_str(key) + struct.pack("<q", value))
+
+    f.write(struct.pack("<H", len(snapshot.sections)))
+    for section in snapshot.sections.values():
+        schema = SECTIONS_SCHEMA[section.name]
+
+        f.write(_pack_str(section.name))
+        f.write(struct.pack("<IH", len(section), len(section.columns)))
+        for name, values in section.columns.items():
+            data = _encode_column(schema[name], values)
+            f.write(_pack_str(name) + struct.pack("<BI", schema[name], len(data)))
+            f.write(data)
+
+
+# ----------- Чтение ------------
+
+class _Reader:
+    def __init__(self, f: BinaryIO):
+        self._f = f
+
+    def read(self, size: int) -> bytes:
+        data = self._f.read(size)
+        if len(data) != size:
+            raise SnapshotFormatError("Unexpected end of snapshot file")
+        return data
+
+    def unpack(self, fmt: str) -> tuple:
+        return struct.unpack(fmt, self.read(struct.calcsize(fmt)))
+
+    def read_str(self) -> str:
+        size, = self.unpack("<I")
+        return self.read(size).decode("UTF-8")
+
+
+def _decode_values(column_type: ColumnType, data: memoryview, count: int) -> list[Any]:
+    if column_type == ColumnType.INT:
+        return list(struct.unpack_from(f"<{count}q", data))
+    if column_type == ColumnType.DATETIME:
+        return [_EPOCH + value * _MICROSECOND for value in struct.unpack_from(f"<{count}q", data)]
+    if column_type == ColumnType.STR:
+        values = list()
+        offset = 0
+        for _ in range(count):
+            size, = struct.unpack_from("<I", data, offset)
+            offset += 4
+            values.append(bytes(data[offset:offset + size]).decode("UTF-8"))
+            offset += size
+        return values
+
+    raise SnapshotFormatError(f"Unknown column type {column_type}")
+
+
+def _decode_column(column_type: ColumnType, data: bytes, rows: int) -> list[Any]:
+    mask_size = (rows + 7) // 8
+    null_mask = data[:mask_size]
+    nulls = [bool(null_mask[i // 8] & (1 << (i % 8))) for i in range(rows)]
+
+    not_null = iter(_decode_values(column_type, memoryview(data)[mask_size:], rows - sum(nulls)))
+
+    return [None if is_null else next(not_null) for is_null in nulls]
+
+
+def read_snapshot(f: BinaryIO) -> Snapshot:
+    reader = _Reader(f)
+
+    if reader.read(len(MAGIC)) != MAGIC:
+        raise SnapshotFormatError("File is not a library snapshot")
+    version, = reader.unpack("<H")
+    if version > FORMAT_VERSION:
+        raise SnapshotFormatError(f"Unsupported snapshot version {version}")
+
+    snapshot = Snapshot()
+
+    meta_count, = reader.unpack("<H")
+    for _ in range(meta_count):
+        key = reader.read_str()
+        snapshot.meta[key], = reader.unpack("<q")
+
+    sections_count, = reader.unpack("<H")
+    for _ in range(sections_count):
+        section = Section(name=reader.read_str())
+        rows, columns_count = reader.unpack("<IH")
+        for _ in range(columns_count):
+            name = reader.read_str()
+            column_type, size = reader.unpack("<BI")
+            section.columns[name] = _decode_column(ColumnType(column_type), reader.read(size), rows)
+
+        snapshot.sections[section.name] = section
+
+    return snapshot
+
+
+# ----------- Преобразование в json модель дампа и обратно ------------
+
+def snapshot_to_file_model(snapshot: Snapshot) -> pydantic_models.FileModel:
+    if snapshot.is_delta:
+        raise SnapshotChainError("Differential snapshot can't be converted to a full dump")
+
+    books = snapshot["books"]
+    book_codes = dict(zip(books.columns["id"], books.columns["code"]))
+
+    loans: dict[int, list[pydantic_models.BookIssue]] = dict()
+    for loan in snapshot["book_to_reader"].iter_rows():
+        loans.setdefault(loan["reader_id"], list()).append(
+            pydantic_models.BookIssue(book_code=book_codes[loan["book_id"]], issue_date=loan["issue_date"])
+        )
+
+    return pydantic_models.FileModel(
+        books=[pydantic_models.Book(**book) for book in books.iter_rows()],
+        readers=[pydantic_models.Reader(**reader, books=loans.get(reader["id"], list()))
+                 for reader in snapshot["readers"].iter_rows()],
+        history=[pydantic_models.Event(time=event["time"],
+                                       event_type=EVENT_TYPES_BY_CODE[event["event_type"]],
+                                       comment=event["comment"])
+                 for event in snapshot["history"].iter_rows()]
+    )
+
+
+def file_model_to_snapshot(file_model: pydantic_models.FileModel) -> Snapshot:
+    """ Идентификаторы строк в json дампе не хранятся, поэтому они назначаются заново по порядку """
+
+    book_ids = {book.code: book_id for book_id, book in enumerate(file_model.books, start=1)}
+
+    def loans() -> Iterator[tuple]:
+        loan_id = 0
+        for reader_id, reader in enumerate(file_model.readers, start=1):
+            for issue in reader.books:
+                loan_id += 1
+                yield loan_id, book_ids[issue.book_code], reader_id, issue.issue_date
+
+    sections = [
+        Section.from_rows("books", ((book_ids[book.code], book.code, book.name, book.author, book.count)
+                                    for book in file_model.books)),
+        Section.from_rows("readers", ((reader_id, reader.firstname, reader.lastname, reader.phone)
+                                      for reader_id, reader in enumerate(file_model.readers, start=1))),
+        Section.from_rows("book_to_reader", loans()),
+        Section.from_rows("history", ((event_id, event.time, EVENT_TYPE_CODES[event.event_type], event.comment)
+                                      for event_id, event in enumerate(file_model.history, start=1))),
+    ]
+
+    return Snapshot(sections={section.name: section for section in sections})
@@ -0,0 +1,310 @@
+"""
+Операции с библиотекой без привязки к интерфейсу.
+
+Используются контроллерами графического интерфейса и сервисом (src.service).
+Ошибки, которые нужно показать пользователю, выбрасываются как OperationError с текстом на русском.
+Событие истории записывается в той же транзакции, что и сама операция.
+
+Счётчики выданных и доступных экземпляров книги меняются одним UPDATE с проверкой в WHERE,
+поэтому две выдачи последнего экземпляра с разных рабочих мест не пройдут обе.
+"""
+
+from logging import getLogger
+from typing import Any
+
+import sqlalchemy as sql
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import selectinload, joinedload
+
+from .db import wrap_with_database, Session, Book, Reader, BookToReader, History, EventType, ChangeLog
+from .exc import OperationError, ObjectNotFoundError, ModelEditError, EmptyFieldError
+from .validators import Validator
+
+
+logger = getLogger(__name__)
+
+BOOK_FIELDS = ("code", "name", "author", "count")
+REQUIRED_BOOK_FIELDS = ("code", "name", "author")
+READER_FIELDS = ("firstname", "lastname", "phone")
+
+
+def _get_or_raise(db: Session, db_class: type, object_id: int, options: tuple = ()) -> Any:
+    db_obj = db.get(db_class, object_id, options=options)
+    if db_obj is None:
+        raise ObjectNotFoundError(f"Запись {object_id} в таблице '{db_class.get_table_name()}' не найдена")
+
+    return db_obj
+
+
+def _loan_options() -> tuple:
+    return joinedload(BookToReader.book), joinedload(BookToReader.reader)
+
+
+# ----------- Выборки ------------
+
+@wrap_with_database
+def list_books(search: str = "", db: Session = None) -> list[Book]:
+    q = db.query(Book).order_by(Book.code)
+
+    where_clause = Book.get_search_where_clause(search)
+    if where_clause is not None:
+        q = q.where(where_clause)
+
+    return q.all()
+
+
+@wrap_with_database
+def get_book(book_id: int, db: Session = None) -> Book:
+    return _get_or_raise(db, Book, book_id)
+
+
+@wrap_with_database
+def list_readers(search: str = "", db: Session = None) -> list[Reader]:
+    q = db.query(Reader).options(selectinload(Reader.books_associations)).order_by(Reader.phone)
+
+    where_clause = Reader.get_search_where_clause(search)
+    if where_clause is not None:
+        q = q.where(where_clause)
+
+    return q.all()
+
+
+@wrap_with_database
+def get_reader(reader_id: int, db: Session = None) -> Reader:
+    return _get_or_raise(db, Reader, reader_id, options=(selectinload(Reader.books_associations),))
+
+
+@wrap_with_database
+def find_reader_by_phone(phone: str, db: Session = None) -> Reader | None:
+    return db.query(Reader).where(Reader.phone == phone).first()
+
+
+@wrap_with_database
+def list_loans(book_id: int | None = None, reader_id: int | None = None, db: Session = None) -> list[BookToReader]:
+    q = db.query(BookToReader).options(*_loan_options()).order_by(BookToReader.issue_date)
+
+    if book_id is not None:
+        q = q.where(BookToReader.book_id == book_id)
+    if reader_id is not None:
+        q = q.where(BookToReader.reader_id == reader_id)
+
+    return q.all()
+
+
+@wrap_with_database
+def list_history(limit: int = 100, db: Session = None) -> list[History]:
+    return db.query(History).order_by(History.time.desc(), History.id.desc()).limit(limit).all()
+
+
+# ----------- Выдача и возврат ------------
+
+def _update_book_counters(db: Session, book_id: int, taken_delta: int, count_delta: int = 0,
+                          only_if_available: bool = False) -> bool:
+    """ Возвращает False, если книги нет или (при only_if_available) нет доступных экземпляров """
+
+    q = sql.update(Book).where(Book.id == book_id)
+    if only_if_available:
+        q = q.where(Book.available_count > 0)
+
+    result = db.execute(q.values(count=Book.count + count_delta,
+                                 taken_count=Book.taken_count + taken_delta,
+                                 available_count=Book.available_count + count_delta - taken_delta))
+    if result.rowcount == 0:
+        return False
+
+    # UPDATE мимо ORM не попадает в журнал изменений, а счётчики нужны другим рабочим местам и снимкам
+    db.add(ChangeLog(table_name=Book.__tablename__, row_id=book_id))
+    return True
+
+
+def _delete_loan(db: Session, loan: BookToReader):
+    """
+    Удаляет запись о выдаче до изменения счётчиков: если одну выдачу одновременно возвращают
+    с двух рабочих мест, DELETE второго не найдёт строку, и счётчики книги не изменятся дважды.
+    """
+
+    # Книга и читатель нужны вызывающему коду уже после того, как запись будет отсоединена от сессии
+    book, reader = loan.book, loan.reader
+
+    result = db.execute(sql.delete(BookToReader).where(BookToReader.id == loan.id))
+    if result.rowcount != 1:
+        raise OperationError(f"Книга '{book.code}' уже возвращена или списана")
+
+    db.add(ChangeLog(table_name=BookToReader.__tablename__, row_id=loan.id, deleted=True))
+    # Удалённая мимо ORM запись не должна остаться в сессии как существующая
+    db.expunge(loan)
+
+
+def _issue_book(db: Session, book: Book, phone: str) -> BookToReader:
+    reader = db.query(Reader).where(Reader.phone == phone).first()
+    if reader is None:
+        raise ObjectNotFoundError(f"Не существует читателя с номером телефона '{phone}'")
+
+    if not _update_book_counters(db, book.id, taken_delta=1, only_if_available=True):
+        raise OperationError("Невозможно выдать книгу, так как она отсутствует на складе")
+
+    loan = BookToReader(book=book, reader=reader)
+    db.add(loan)
+    db.add(History(event_type=EventType.BOOK_TAKEN, comment=f"Книга '{book.code}' была выдана читателю '{phone}'"))
+    db.commit()
+
+    logger.info(f"Book '{book.code}' was given to reader '{phone}'")
+    return loan
+
+
+@wrap_with_database
+def issue_book(book_id: int, phone: str, db: Session = None) -> BookToReader:
+    return _issue_book(db, _get_or_raise(db, Book, book_id), phone)
+
+
+@wrap_with_database
+def issue_book_by_code(book_code: str, phone: str, db: Session = None) -> BookToReader:
+    book = db.query(Book).where(Book.code == book_code).first()
+    if book is None:
+        raise ObjectNotFoundError(f"Не существует книги с кодом '{book_code}'")
+
+    return _issue_book(db, book, phone)
+
+
+@wrap_with_database
+def return_book(loan_id: int, db: Session = None) -> BookToReader:
+    loan = _get_or_raise(db, BookToReader, loan_id, options=_loan_options())
+
+    _delete_loan(db, loan)
+    _update_book_counters(db, loan.book_id, taken_delta=-1)
+    db.add(History(event_type=EventType.BOOK_RETURNED,
+                   comment=f"Книга '{loan.book.code}' была возвращена читателем '{loan.reader.phone}'"))
+    db.commit()
+
+    return loan
+
+
+@wrap_with_database
+def return_book_by_code(book_code: str, phone: str | None = None, db: Session = None) -> BookToReader:
+    """ Возвращает самый давно выданный экземпляр книги, если phone задан - выданный этому читателю """
+
+    q = (db.query(BookToReader)
+         .join(BookToReader.book)
+         .where(Book.code == book_code)
+         .order_by(BookToReader.issue_date, BookToReader.id))
+    if phone is not None:
+        q = q.join(BookToReader.reader).where(Reader.phone == phone)
+
+    loan = q.first()
+    if loan is None:
+        reader_text = f" читателю '{phone}'" if phone is not None else ""
+        raise ObjectNotFoundError(f"Книга с кодом '{book_code}' не выдавалась{reader_text}")
+
+    return return_book(loan.id, db=db)
+
+
+@wrap_with_database
+def write_off_book(loan_id: int, db: Session = None) -> BookToReader:
+    """ Списывает выданный экземпляр: запись о выдаче удаляется, а общее количество книг уменьшается """
+
+    loan = _get_or_raise(db, BookToReader, loan_id, options=_loan_options())
+    logger.info(f"Writing off book '{loan.book.code}'")
+
+    _delete_loan(db, loan)
+    _update_book_counters(db, loan.book_id, taken_delta=-1, count_delta=-1)
+    db.add(History(event_type=EventType.BOOK_WRITTEN_OFF,
+                   comment=f"Экземпляр книги '{loan.book.code}' был списан с читателя '{loan.reader.phone}'"))
+    db.commit()
+
+    return loan
+
+
+# ----------- Книги и читатели ------------
+
+@wrap_with_database
+def save_book(values: dict[str, Any], book_id: int | None = None, db: Session = None) -> Book:
+    """ Создаёт книгу или изменяет существующую, в values передаются поля из BOOK_FIELDS """
+
+    if book_id is None:
+        book = Book(taken_count=0)
+        db.add(book)
+    else:
+        book = _get_or_raise(db, Book, book_id)
+
+    for name in BOOK_FIELDS:
+        if name in values:
+            setattr(book, name, values[name])
+
+    if any(not getattr(book, name) for name in REQUIRED_BOOK_FIELDS):
+        raise EmptyFieldError("Ошибка, пропущено обязательное поле")
+
+    if book.count is None:
+        book.count = 0
+    Validator.validate_book_count(book.count, book.get_taken_count())
+    book.count = int(book.count)
+    # Число выданных могло измениться с момента чтения книги, поэтому доступное считается в бд
+    book.available_count = book.count - Book.taken_count if book_id is not None else book.count
+
+    code = book.code
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        # Кроме уникальности кода могут нарушаться и другие ограничения, их ошибки не подменяются
+        if _is_book_code_taken(db, code, book_id):
+            raise ModelEditError("Ошибка, код книги дублируется")
+        raise
+
+    # available_count был задан выражением SQL, поэтому его значение нужно прочитать до закрытия сессии
+    db.refresh(book)
+    return book
+
+
+def _is_book_code_taken(db: Session, code: str, book_id: int | None) -> bool:
+    q = sql.select(Book.id).where(Book.code == code)
+    if book_id is not None:
+        q = q.where(Book.id != book_id)
+
+    return db.execute(q.limit(1)).first() is not None
+
+
+@wrap_with_database
+def delete_book(book_id: int, db: Session = None):
+    """ Вместе с книгой удаляются и записи о её выдаче """
+
+    db.delete(_get_or_raise(db, Book, book_id))
+    db.commit()
+
+
+@wrap_with_database
+def save_reader(values: dict[str, Any], reader_id: int | None = None, db: Session = None) -> Reader:
+    """ Создаёт читателя или изменяет существующего, в values передаются поля из READER_FIELDS """
+
+    is_new = reader_id is None
+    if is_new:
+        reader = Reader()
+        db.add(reader)
+    else:
+        reader = _get_or_raise(db, Reader, reader_id)
+
+    for name in READER_FIELDS:
+        if name in values:
+            setattr(reader, name, values[name])
+
+    Validator.validate_phone_number(reader.phone or "")
+
+    if is_new:
+        db.add(History(event_type=EventType.NEW_READER, comment=f"Новый читатель '{reader.phone}'"))
+
+    try:
+        db.commit()
+    except IntegrityError:
+        raise ModelEditError("Ошибка, номер телефона уже был зарегистрирован ранее")
+
+    return reader
+
+
+@wrap_with_database
+def delete_reader(reader_id: int, db: Session = None):
+    reader = _get_or_raise(db, Reader, reader_id, options=(selectinload(Reader.books_associations),))
+    if reader.books_associations:
+        raise OperationError("Невозможно удалить читателя, пока на него записана хотя бы одна книга")
+
+    db.delete(reader)
+    db.add(History(event_type=EventType.READER_LEFT, comment=f"Читатель '{reader.phone}' был удалён из базы данных"))
+    db.commit()
@@ -1,17 +1,51 @@
+import os
 from dataclasses import dataclass
 from datetime import datetime, timedelta
+from decimal import Decimal
+from functools import lru_cache
+from itertools import islice
+from logging import getLogger
+from typing import Callable, Iterable, Iterator, Sequence
 
-from transliterate import translit
-from borb.pdf import SingleColumnLayout, PageLayout, FlexibleColumnWidthTable, Paragraph, Document, Page, PDF
+import sqlalchemy as sql
+from borb.pdf import SingleColumnLayout, PageLayout, FixedColumnWidthTable, Paragraph, Document, Page
+from borb.pdf.canvas.font.glyph_line import GlyphLine
+from borb.pdf.canvas.font.simple_font.font_type_1 import StandardType1Font
 from borb.license.usage_statistics import UsageStatistics
 
-from .db import wrap_with_database, Session, BookToReader, History, EventType, Reader
+from .db import wrap_with_database, Session, BookToReader, EventType, Reader, Book
+from . import transliteration, statistics
+from .pdf_writer import PdfPageWriter
+from .report_cache import ReportCache, DataFingerprint, make_cache_key, get_database_id
 
 
 DAYS_IN_MONTH = 30
+LOANS_FETCH_BATCH_SIZE = 1000
+
+MONTH_REPORT_TYPE = "month"
+
+TREND_MONTHS = 12
+TOP_LIMIT = 10
+
+# На первой странице над таблицей выводится статистика, поэтому строк на ней меньше.
+# Значения в таблицах с названиями и авторами обрезаются до одной строки, поэтому страница из ROWS_PER_PAGE строк
+# всегда помещается на лист и число строк на странице известно заранее
+FIRST_PAGE_ROWS = 15
+ROWS_PER_PAGE = 25
+
+LOANS_TABLE_HEADER = ("Code", "Name", "Author", "Phone number")
+LOANS_TABLE_COLUMN_WIDTHS = [Decimal(2), Decimal(4), Decimal(3), Decimal(2)]
+
+# Ширина колонки SingleColumnLayout на листе A4 и отступы текста внутри ячейки таблицы
+LAYOUT_WIDTH = Decimal(476)
+CELL_PADDING = Decimal(4)
+FONT_SIZE = Decimal(12)
+ELLIPSIS = "..."
 
 UsageStatistics.disable()
 
+logger = getLogger(__name__)
+
 
 @dataclass
 class MonthStat:
@@ -22,60 +56,224 @@ class MonthStat:
 
 @wrap_with_database
 def _get_month_stat(db: Session = None) -> MonthStat:
-    events = db.query(
-        History
-    ).where(
-        History.time >= (datetime.now() - timedelta(days=DAYS_IN_MONTH))
-    ).all()
+    now = datetime.now()
+    totals = statistics.get_event_totals(now - timedelta(days=DAYS_IN_MONTH), now)
+
+    return MonthStat(new_readers=totals.get(EventType.NEW_READER, 0),
+                     books_taken=totals.get(EventType.BOOK_TAKEN, 0),
+                     total_readers=db.query(sql.func.count(Reader.id)).scalar())
+
+
+def _make_table(header: Sequence[str],
+                rows: list[Sequence],
+                column_widths: list[Decimal] | None = None) -> FixedColumnWidthTable:
+    table = FixedColumnWidthTable(number_of_rows=len(rows) + 1,
+                                  number_of_columns=len(header),
+                                  column_widths=column_widths or [])
+
+    for field in header:
+        table = table.add(Paragraph(field, font="Helvetica-Bold"))
+    for line in rows:
+        for field in line:
+            table = table.add(Paragraph(transliteration.to_latin(str(field))))
+
+    return table
+
+
+def _iter_pages(rows: Iterable[Sequence[str]]) -> Iterator[list[Sequence[str]]]:
+    """ Разбивает строки на страницы, одновременно в памяти хранятся строки только одной страницы """
+
+    rows = iter(rows)
+    page_rows = list(islice(rows, FIRST_PAGE_ROWS))
+    while True:
+        yield page_rows
+
+        page_rows = list(islice(rows, ROWS_PER_PAGE))
+        if not page_rows:
+            return
+
+
+@lru_cache(maxsize=4096)
+def _fit_to_line(text: str, width: Decimal) -> str:
+    """ Обрезает текст, чтобы он занимал одну строку ячейки заданной ширины """
+
+    font = StandardType1Font("Helvetica")
+
+    def fits(value: str) -> bool:
+        return GlyphLine.from_str(value, font, FONT_SIZE).get_width_in_text_space() <= width
+
+    if fits(text):
+        return text
+
+    # Наибольшая длина, при которой обрезанный текст с многоточием ещё помещается
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if fits(text[:middle].rstrip() + ELLIPSIS):
+            low = middle
+        else:
+            high = middle - 1
+
+    return text[:low].rstrip() + ELLIPSIS
+
 
-    month_stat = MonthStat()
-    for event in events:
-        if event.event_type == EventType.NEW_READER:
-            month_stat.new_readers += 1
-        if event.event_type == EventType.BOOK_TAKEN:
-            month_stat.books_taken += 1
+def _make_single_line_table(header: Sequence[str],
+                            rows: list[Sequence],
+                            column_widths: list[Decimal]) -> FixedColumnWidthTable:
+    """ Таблица, в которой каждая строка занимает ровно одну строку текста, её высота известна заранее """
 
-    month_stat.total_readers = db.query(Reader).count()
+    total = sum(column_widths)
+    cell_widths = [LAYOUT_WIDTH * width / total - CELL_PADDING for width in column_widths]
 
-    return month_stat
+    return _make_table(
+        header,
+        [[_fit_to_line(transliteration.to_latin(str(field)), width) for field, width in zip(line, cell_widths)]
+         for line in rows],
+        column_widths
+    )
 
 
-def _export_to_pdf(data: list[list[str]], filename: str):
+def _add_trend_sections(layout: PageLayout):
+    now = datetime.now()
+    start = statistics.get_months_start(TREND_MONTHS, now)
+
+    trend = statistics.get_event_counts(start, now, statistics.Granularity.MONTH)
+    layout.add(Paragraph(f"Trend for the last {TREND_MONTHS} months"))
+    layout.add(_make_table(
+        ("Month", "New readers", "Taken books", "Returned books", "Written off"),
+        [(stat.period, stat.get(EventType.NEW_READER), stat.get(EventType.BOOK_TAKEN),
+          stat.get(EventType.BOOK_RETURNED), stat.get(EventType.BOOK_WRITTEN_OFF)) for stat in trend]
+    ))
+
+    top_books = statistics.get_top_books_on_loan(start, now, limit=TOP_LIMIT)
+    layout.add(Paragraph(f"Books most on loan now (issued in the last {TREND_MONTHS} months)"))
+    layout.add(_make_single_line_table(
+        ("Code", "Name", "Author", "On loan"),
+        [(book.code, book.name, book.author, book.loans) for book in top_books],
+        LOANS_TABLE_COLUMN_WIDTHS
+    ))
+
+    top_authors = statistics.get_top_authors_on_loan(start, now, limit=TOP_LIMIT)
+    layout.add(Paragraph(f"Authors most on loan now (issued in the last {TREND_MONTHS} months)"))
+    layout.add(_make_single_line_table(
+        ("Author", "On loan"),
+        [(author.author, author.loans) for author in top_authors],
+        [Decimal(3), Decimal(1)]
+    ))
+
+
+def _new_document() -> tuple[Document, PageLayout]:
     doc: Document = Document()
 
     page: Page = Page()
 
     doc.add_page(page)
 
-    layout: PageLayout = SingleColumnLayout(page)
+    return doc, SingleColumnLayout(page)
 
-    layout.add(Paragraph("Library month report\n\n", font_size=20))
 
-    month_stat = _get_month_stat()
-    layout.add(Paragraph(f"Count of new readers: {month_stat.new_readers}\n"))
-    layout.add(Paragraph(f"Count of taken books: {month_stat.books_taken}\n"))
-    layout.add(Paragraph(f"Total count of readers: {month_stat.total_readers}\n"))
+def _write_pages(writer: PdfPageWriter, doc: Document):
+    # Вёрстка могла перенести содержимое на следующие листы, они записываются все
+    for page_number in range(int(doc.get_document_info().get_number_of_pages())):
+        writer.add_page(doc.get_page(page_number))
 
-    layout.add(Paragraph(f"Taken instances of books"))
 
-    table = FlexibleColumnWidthTable(number_of_rows=len(data),
-                                     number_of_columns=len(data[0]))
-    for line in data:
-        for field in line:
-            table = table.add(Paragraph(translit(field, "ru", reversed=True)))
-    layout.add(table)
+def _export_to_pdf(rows: Iterable[Sequence[str]],
+                   filename: str,
+                   rows_total: int = 0,
+                   progress: Callable[[int, int], None] | None = None):
+    """
+    Каждая страница таблицы выданных книг верстается в отдельном документе и сразу записывается в файл,
+    поэтому в памяти одновременно находятся строки и вёрстка только одной страницы.
+    При ошибке, в том числе из progress, недописанный файл удаляется.
+    """
 
     with open(filename, "wb") as pdf_file:
-        PDF.dumps(pdf_file, doc)
+        try:
+            writer = PdfPageWriter(pdf_file)
+
+            doc, layout = _new_document()
+            layout.add(Paragraph("Library month report\n\n", font_size=20))
+
+            month_stat = _get_month_stat()
+            layout.add(Paragraph(f"Count of new readers: {month_stat.new_readers}\n"))
+            layout.add(Paragraph(f"Count of taken books: {month_stat.books_taken}\n"))
+            layout.add(Paragraph(f"Total count of readers: {month_stat.total_readers}\n"))
+
+            _add_trend_sections(layout)
+
+            layout.add(Paragraph(f"Taken instances of books"))
+
+            # Статистика посчитана, дальше вёрстка таблицы
+            if progress:
+                progress(0, rows_total)
+
+            rows_done = 0
+            for page_number, page_rows in enumerate(_iter_pages(rows)):
+                if page_number > 0:
+                    doc, layout = _new_document()
+
+                layout.add(_make_single_line_table(LOANS_TABLE_HEADER, page_rows, LOANS_TABLE_COLUMN_WIDTHS))
+                _write_pages(writer, doc)
+
+                rows_done += len(page_rows)
+                if progress:
+                    progress(rows_done, rows_total)
+
+            writer.close()
+        except BaseException:
+            pdf_file.close()
+            os.remove(filename)
+            raise
+
+    stats = transliteration.get_stats()
+    logger.debug(f"Transliteration cache: {stats.hits} hits, {stats.misses} misses, hit rate {stats.hit_rate:.0%}")
 
 
 class PdfCreator:
     @staticmethod
     @wrap_with_database
-    def create_pdf_report(filepath: str, db: Session = None):
-        data = [("Code", "Name", "Author", "Phone number")]
-        for book_to_reader in db.query(BookToReader).all():
-            fields = [book_to_reader.book.code, book_to_reader.book.name,
-                      book_to_reader.book.author, book_to_reader.reader.phone]
-            data.append(fields)
-        _export_to_pdf(data, filepath)
+    def create_pdf_report(filepath: str,
+                          progress: Callable[[int, int], None] | None = None,
+                          use_cache: bool = True,
+                          db: Session = None):
+        """
+        Создание pdf отчёта о работе библиотеки.
+
+        :param filepath: Путь до файла
+        :param progress: Функция, в которую после каждой страницы передаётся число готовых и всего строк таблицы.
+            Перед этапами построения (статистика, таблица) она вызывается с нулём готовых строк.
+            Исключение из неё прерывает построение отчёта, файл при этом не создаётся.
+        :param use_cache: Взять отчёт из кэша, если данные не изменились с момента его построения
+        :param db: Сессия базы данных
+        """
+
+        # Статистика считается за последние DAYS_IN_MONTH дней, поэтому отчёт зависит и от текущей даты
+        cache = ReportCache()
+        cache_key = make_cache_key(get_database_id(db), MONTH_REPORT_TYPE, datetime.now().date().isoformat(),
+                                   DataFingerprint.collect(db))
+
+        if use_cache and (cached_report := cache.get(cache_key)) is not None:
+            with open(filepath, "wb") as pdf_file:
+                pdf_file.write(cached_report)
+            return
+
+        loans_count = db.query(sql.func.count(BookToReader.id)).scalar()
+        loans = db.query(
+            Book.code, Book.name, Book.author, Reader.phone
+        ).select_from(
+            BookToReader
+        ).join(
+            BookToReader.book
+        ).join(
+            BookToReader.reader
+        ).yield_per(LOANS_FETCH_BATCH_SIZE)
+
+        # Отпечаток данных и число строк посчитаны, дальше статистика
+        if progress:
+            progress(0, loans_count)
+
+        _export_to_pdf(loans, filepath, rows_total=loans_count, progress=progress)
+
+        with open(filepath, "rb") as pdf_file:
+            cache.put(cache_key, pdf_file.read())
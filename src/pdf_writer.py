@@ -0,0 +1,92 @@
+"""
+Запись pdf по одной странице.
+
+borb хранит все страницы документа в памяти до PDF.dumps. Для больших отчётов страницы верстаются borb,
+но каждая готовая страница сразу записывается в файл и больше не хранится: в памяти остаются только
+смещения объектов для таблицы xref и номера объектов страниц.
+
+Поддерживаются страницы, на которых используются только стандартные шрифты Type1 (текст и линии таблиц),
+этого достаточно для отчётов.
+"""
+
+from typing import BinaryIO
+
+from borb.pdf import Page
+
+
+PDF_HEADER = b"%PDF-1.7\n%\xe2\xe3\xcf\xd3\n"
+
+
+class PdfPageWriter:
+    def __init__(self, file: BinaryIO):
+        self._file = file
+        # Смещение каждого объекта в файле, номер объекта = индекс + 1
+        self._offsets: list[int | None] = []
+        self._page_ids: list[int] = []
+        # Шрифт (BaseFont, Encoding) -> номер объекта, шрифты общие для всех страниц
+        self._font_ids: dict[tuple[str, str], int] = dict()
+
+        self._file.write(PDF_HEADER)
+        self._pages_id = self._reserve_object()
+        self._catalog_id = self._reserve_object()
+
+    def _reserve_object(self) -> int:
+        self._offsets.append(None)
+        return len(self._offsets)
+
+    def _write_object(self, object_id: int, body: bytes):
+        self._offsets[object_id - 1] = self._file.tell()
+        self._file.write(f"{object_id} 0 obj\n".encode("latin1") + body + b"\nendobj\n")
+
+    def _get_font_id(self, font) -> int:
+        key = (str(font["BaseFont"]), str(font["Encoding"]))
+        if key not in self._font_ids:
+            font_id = self._reserve_object()
+            self._write_object(
+                font_id,
+                f"<< /Type /Font /Subtype /Type1 /BaseFont /{key[0]} /Encoding /{key[1]} >>".encode("latin1")
+            )
+            self._font_ids[key] = font_id
+
+        return self._font_ids[key]
+
+    def add_page(self, page: Page):
+        """ Записывает свёрстанную страницу, после этого страницу можно не хранить """
+
+        resources = page["Resources"]
+        unsupported = {str(name) for name in resources.keys()} - {"Font"}
+        if unsupported:
+            raise ValueError(f"Unsupported page resources: {', '.join(sorted(unsupported))}")
+
+        fonts = " ".join(f"/{name} {self._get_font_id(font)} 0 R" for name, font in resources.get("Font", {}).items())
+
+        content = page["Contents"]["Bytes"]
+        content_id = self._reserve_object()
+        self._write_object(
+            content_id,
+            f"<< /Length {len(content)} /Filter /FlateDecode >>\nstream\n".encode("latin1") + content + b"\nendstream"
+        )
+
+        media_box = " ".join(str(value) for value in page["MediaBox"])
+        page_id = self._reserve_object()
+        self._write_object(
+            page_id,
+            (f"<< /Type /Page /Parent {self._pages_id} 0 R /MediaBox [{media_box}] "
+             f"/Resources << /Font << {fonts} >> >> /Contents {content_id} 0 R >>").encode("latin1")
+        )
+        self._page_ids.append(page_id)
+
+    def close(self):
+        """ Записывает дерево страниц, каталог и таблицу xref. Файл закрывает вызывающий код """
+
+        kids = " ".join(f"{page_id} 0 R" for page_id in self._page_ids)
+        self._write_object(self._pages_id,
+                           f"<< /Type /Pages /Kids [{kids}] /Count {len(self._page_ids)} >>".encode("latin1"))
+        self._write_object(self._catalog_id, f"<< /Type /Catalog /Pages {self._pages_id} 0 R >>".encode("latin1"))
+
+        xref_offset = self._file.tell()
+        xref = [f"xref\n0 {len(self._offsets) + 1}\n", "0000000000 65535 f \n"]
+        xref.extend(f"{offset:010d} 00000 n \n" for offset in self._offsets)
+        xref.append(f"trailer\n<< /Size {len(self._offsets) + 1} /Root {self._catalog_id} 0 R >>\n")
+        xref.append(f"startxref\n{xref_offset}\n%%EOF\n")
+        self._file.write("".join(xref).encode("latin1"))
@@ -0,0 +1,109 @@
+"""
+Профилировщик запуска приложения.
+
+Включается переменной окружения LIBRARY_PROFILE_STARTUP=1, записывает время импорта каждого модуля
+(вместе с вложенными импортами) и длительность каждого этапа окон ProgressBarWindow (см. StageTimer).
+Итог выводится в лог вызовом log_report().
+"""
+
+import os
+import sys
+from importlib.abc import MetaPathFinder, Loader
+from logging import getLogger
+from time import perf_counter
+
+
+logger = getLogger(__name__)
+
+ENABLE_ENV_VARIABLE = "LIBRARY_PROFILE_STARTUP"
+REPORT_TOP_IMPORTS = 20
+
+_import_durations: list[tuple[str, float]] = list()
+_stage_durations: list[tuple[str, float]] = list()
+
+
+def is_enabled() -> bool:
+    return os.environ.get(ENABLE_ENV_VARIABLE, "") not in ("", "0")
+
+
+class _TimingLoader(Loader):
+    def __init__(self, loader: Loader):
+        self._loader = loader
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        start = perf_counter()
+        try:
+            self._loader.exec_module(module)
+        finally:
+            _import_durations.append((module.__name__, perf_counter() - start))
+
+            # После загрузки возвращаем модулю настоящий загрузчик
+            module.__loader__ = self._loader
+            if module.__spec__ is not None:
+                module.__spec__.loader = self._loader
+
+    def __getattr__(self, name):
+        return getattr(self._loader, name)
+
+
+class _ImportTimer(MetaPathFinder):
+    def find_spec(self, fullname, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+
+            spec = finder.find_spec(fullname, path, target)
+            if spec is not None:
+                if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+                    spec.loader = _TimingLoader(spec.loader)
+                return spec
+
+        return None
+
+
+def install_import_hook():
+    if is_enabled() and not any(isinstance(finder, _ImportTimer) for finder in sys.meta_path):
+        sys.meta_path.insert(0, _ImportTimer())
+
+
+class StageTimer:
+    """ Замеряет этапы одного окна, поэтому окна, открытые одновременно, не завершают этапы друг друга """
+
+    def __init__(self):
+        self._current: tuple[str, float] | None = None
+
+    def start(self, name: str):
+        """ Завершает предыдущий этап, повторный вызов с тем же названием продолжает текущий этап """
+
+        if not is_enabled() or (self._current is not None and self._current[0] == name):
+            return
+
+        self.finish()
+        self._current = (name, perf_counter())
+
+    def finish(self):
+        if self._current is None:
+            return
+
+        name, start = self._current
+        _stage_durations.append((name, perf_counter() - start))
+        self._current = None
+
+
+def log_report():
+    """ В отчёт попадают только завершённые этапы """
+
+    if not is_enabled():
+        return
+
+    lines = ["Startup profile", "Stages:"]
+    lines.extend(f"  {duration * 1000:8.1f} ms  {name}" for name, duration in _stage_durations)
+
+    lines.append(f"Slowest imports (including nested imports), top {REPORT_TOP_IMPORTS}:")
+    slowest_imports = sorted(_import_durations, key=lambda item: item[1], reverse=True)[:REPORT_TOP_IMPORTS]
+    lines.extend(f"  {duration * 1000:8.1f} ms  {name}" for name, duration in slowest_imports)
+
+    logger.info("\n".join(lines))
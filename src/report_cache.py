@@ -0,0 +1,106 @@
+"""
+Дисковый кэш готовых отчётов.
+
+Ключ кэша строится из типа отчёта, периода и отпечатка данных - нескольких агрегатов,
+которые меняются при любом изменении данных, попадающих в отчёт.
+Если данные не менялись, отчёт берётся из кэша без запросов к таблицам и без вёрстки.
+
+Кэш лежит в каталоге пользователя (см. user_dirs), доступном только владельцу, так как в отчётах
+есть телефоны читателей. Один каталог используется для всех баз данных, поэтому в ключ входит и адрес бд.
+"""
+
+import hashlib
+import os
+from dataclasses import dataclass, astuple
+from logging import getLogger
+from pathlib import Path
+
+import sqlalchemy as sql
+
+from .db import Session, History, BookToReader, Reader, ChangeLog
+from .user_dirs import get_cache_dir, make_private_dir
+
+
+logger = getLogger(__name__)
+
+REPORTS_CACHE_DIR = get_cache_dir("reports")
+REPORTS_CACHE_MAX_BYTES = 100 * 1024 * 1024
+
+
+@dataclass(frozen=True)
+class DataFingerprint:
+    max_change_id: int
+    max_history_id: int
+    loans_count: int
+    max_loan_id: int
+    readers_count: int
+
+    @classmethod
+    def collect(cls, db: Session) -> "DataFingerprint":
+        """ Все агрегаты считаются одним запросом по индексам первичных ключей """
+
+        row = db.execute(sql.select(
+            sql.select(sql.func.max(ChangeLog.id)).scalar_subquery(),
+            sql.select(sql.func.max(History.id)).scalar_subquery(),
+            sql.select(sql.func.count(BookToReader.id)).scalar_subquery(),
+            sql.select(sql.func.max(BookToReader.id)).scalar_subquery(),
+            sql.select(sql.func.count(Reader.id)).scalar_subquery(),
+        )).one()
+
+        return cls(*(value or 0 for value in row))
+
+
+def get_database_id(db: Session) -> str:
+    """ Адрес бд без пароля """
+
+    return db.get_bind().url.render_as_string(hide_password=True)
+
+
+def make_cache_key(database_id: str, report_type: str, period: str, fingerprint: DataFingerprint) -> str:
+    raw_key = "|".join(map(str, (database_id, report_type, period, *astuple(fingerprint))))
+    return hashlib.sha256(raw_key.encode()).hexdigest()
+
+
+class ReportCache:
+    """ Кэш ограничен по суммарному размеру файлов, при переполнении удаляются давно не использованные отчёты """
+
+    def __init__(self, directory: str | Path = REPORTS_CACHE_DIR, max_bytes: int = REPORTS_CACHE_MAX_BYTES):
+        self._directory = Path(directory)
+        self._max_bytes = max_bytes
+
+    def get(self, key: str) -> bytes | None:
+        path = self._get_path(key)
+        try:
+            data = path.read_bytes()
+        except FileNotFoundError:
+            return None
+
+        # Время изменения файла используется как время последнего использования
+        path.touch()
+        logger.debug(f"Report cache hit '{key}'")
+        return data
+
+    def put(self, key: str, data: bytes):
+        make_private_dir(self._directory)
+
+        path = self._get_path(key)
+        tmp_path = path.with_suffix(".tmp")
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, path)
+
+        self._evict()
+
+    def _get_path(self, key: str) -> Path:
+        return self._directory.joinpath(f"{key}.pdf")
+
+    def _evict(self):
+        files = sorted(self._directory.glob("*.pdf"), key=lambda file: file.stat().st_mtime)
+        total_size = sum(file.stat().st_size for file in files)
+
+        for file in files:
+            if total_size <= self._max_bytes:
+                break
+
+            total_size -= file.stat().st_size
+            file.unlink(missing_ok=True)
+            logger.debug(f"Report '{file.name}' evicted from cache")
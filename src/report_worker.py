@@ -0,0 +1,199 @@
+"""
+Построение отчётов в отдельном процессе.
+
+Вёрстка pdf нагружает процессор, поэтому отчёт строится в дочернем процессе со своим подключением к бд,
+а интерфейс только забирает из очереди сообщения о прогрессе (см. ReportQueue.poll).
+
+Отмена сначала просит процесс остановиться: он проверяет флаг отмены между этапами построения и после каждой
+страницы. Если за CANCEL_TIMEOUT секунд процесс не остановился (например, ждёт долгий запрос к бд), он завершается
+принудительно, а недописанный файл удаляется.
+"""
+
+import multiprocessing
+import os
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from itertools import count
+from logging import getLogger
+from queue import Empty
+from typing import Callable
+
+from .config_models import DbConfig
+
+
+logger = getLogger(__name__)
+
+CANCEL_TIMEOUT = 5.0
+
+_job_ids = count(1)
+
+
+class ReportCancelled(Exception):
+    pass
+
+
+@dataclass
+class ReportJob:
+    filepath: str
+
+    on_start: Callable[[], None] | None = None
+    on_progress: Callable[[int, int], None] | None = None
+    on_done: Callable[[], None] | None = None
+    on_error: Callable[[str], None] | None = None
+    on_cancelled: Callable[[], None] | None = None
+
+    id: int = field(default_factory=lambda: next(_job_ids))
+
+
+def _run_report(db_config: DbConfig | str, filepath: str, events: multiprocessing.Queue, cancel_event):
+    # Дочерний процесс spawn заново импортирует главный модуль программы (test.py, а с ним src.app и customtkinter),
+    # поэтому отдельный процесс не экономит память. Импорты внутри только откладывают загрузку borb
+    # в процессе интерфейса до первого отчёта
+    from .db import init_db
+    from .pdf_report import PdfCreator
+
+    def progress(rows_done: int, rows_total: int):
+        if cancel_event.is_set():
+            raise ReportCancelled()
+        events.put(("progress", rows_done, rows_total))
+
+    try:
+        init_db(db_config)
+        PdfCreator.create_pdf_report(filepath, progress=progress)
+        events.put(("done",))
+    except ReportCancelled:
+        events.put(("cancelled",))
+    except Exception as e:
+        events.put(("error", str(e)))
+
+
+class ReportQueue:
+    """ Очередь отчётов, отчёты строятся по одному в отдельном процессе """
+
+    def __init__(self, db_config: DbConfig | str, cancel_timeout: float = CANCEL_TIMEOUT):
+        self._db_config = db_config
+        self._cancel_timeout = cancel_timeout
+
+        # spawn, а не fork, чтобы дочерний процесс не наследовал состояние Tk и соединения с бд
+        self._context = multiprocessing.get_context("spawn")
+
+        self._pending: deque[ReportJob] = deque()
+        self._current: ReportJob | None = None
+        self._process: multiprocessing.Process | None = None
+        self._events: multiprocessing.Queue | None = None
+        self._cancel_event = None
+        self._cancel_deadline: float | None = None
+
+    def submit(self, job: ReportJob):
+        logger.info(f"Report job {job.id} '{job.filepath}' queued")
+        self._pending.append(job)
+
+    def cancel(self, job: ReportJob):
+        if job is self._current:
+            logger.info(f"Cancelling running report job {job.id}")
+            self._cancel_event.set()
+            if self._cancel_deadline is None:
+                self._cancel_deadline = time.monotonic() + self._cancel_timeout
+        elif job in self._pending:
+            logger.info(f"Cancelling queued report job {job.id}")
+            self._pending.remove(job)
+            self._notify(job.on_cancelled)
+
+    def has_jobs(self) -> bool:
+        return self._current is not None or bool(self._pending)
+
+    def poll(self):
+        """ Обрабатывает сообщения текущего процесса и запускает следующий отчёт. Вызывается из потока интерфейса """
+
+        if self._current is not None:
+            self._process_events()
+
+        if self._current is None and self._pending:
+            self._start(self._pending.popleft())
+
+    def _start(self, job: ReportJob):
+        logger.info(f"Starting report job {job.id}")
+
+        self._current = job
+        self._events = self._context.Queue()
+        self._cancel_event = self._context.Event()
+        self._process = self._context.Process(
+            target=_run_report,
+            args=(self._db_config, job.filepath, self._events, self._cancel_event),
+            daemon=True
+        )
+        self._process.start()
+
+        self._notify(job.on_start)
+
+    def _process_events(self):
+        if self._handle_events():
+            return
+
+        if not self._process.is_alive():
+            # Процесс мог отправить результат и завершиться уже после прошлой проверки очереди
+            if self._handle_events():
+                return
+
+            self._notify(self._current.on_error,
+                         f"Процесс построения отчёта завершился с кодом {self._process.exitcode}")
+            self._finish()
+        elif self._cancel_deadline is not None and time.monotonic() >= self._cancel_deadline:
+            self._terminate()
+
+    def _terminate(self):
+        """ Принудительно завершает процесс, который не остановился после отмены """
+
+        job = self._current
+        logger.warning(f"Report job {job.id} did not stop after cancel, terminating the process")
+
+        self._process.terminate()
+        self._process.join()
+
+        # Процесс не успел удалить недописанный файл сам
+        if os.path.exists(job.filepath):
+            os.remove(job.filepath)
+
+        self._notify(job.on_cancelled)
+        self._finish()
+
+    def _handle_events(self) -> bool:
+        """ Обрабатывает накопившиеся события, возвращает True, если задача завершилась """
+
+        job = self._current
+
+        try:
+            while True:
+                kind, *args = self._events.get_nowait()
+
+                if kind == "progress":
+                    self._notify(job.on_progress, *args)
+                    continue
+
+                if kind == "done":
+                    self._notify(job.on_done)
+                elif kind == "cancelled":
+                    self._notify(job.on_cancelled)
+                elif kind == "error":
+                    self._notify(job.on_error, *args)
+
+                self._finish()
+                return True
+        except Empty:
+            return False
+
+    def _finish(self):
+        logger.info(f"Report job {self._current.id} finished")
+
+        self._process.join()
+        self._current = None
+        self._process = None
+        self._events = None
+        self._cancel_event = None
+        self._cancel_deadline = None
+
+    @staticmethod
+    def _notify(callback: Callable | None, *args):
+        if callback:
+            callback(*args)
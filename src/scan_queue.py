@@ -0,0 +1,173 @@
+"""
+Очередь сканирования для быстрой выдачи и возврата книг сканером штрихкодов.
+
+Сканер вводит коды как клавиатура, каждый код попадает в очередь и обрабатывается по порядку в фоновом потоке:
+- номер телефона делает читателя текущим;
+- код книги при выбранном читателе возвращает книгу, если она у него, иначе выдаёт её ему;
+- код книги без выбранного читателя возвращает самый давно выданный экземпляр.
+
+Накопившиеся коды применяются небольшими группами в одной транзакции (см. db.grouped_transaction_session),
+ошибка одного кода откатывает только его изменения.
+"""
+
+from dataclasses import dataclass, field
+from datetime import datetime
+from logging import getLogger
+from queue import Queue, Empty
+from threading import Thread
+
+from . import operations
+from .db import Session, grouped_transaction_session
+from .exc import OperationError, ObjectNotFoundError
+from .validators import Validator
+
+
+logger = getLogger(__name__)
+
+# Сколько кодов применяется одной транзакцией
+SCAN_BATCH_SIZE = 20
+
+# Как долго поток ждёт новый код, прежде чем проверить, не остановлена ли очередь
+SCAN_WAIT_TIMEOUT = 0.2
+
+
+@dataclass
+class ScanResult:
+    text: str
+    ok: bool
+    message: str
+    current_phone: str | None = None
+    changed: bool = False
+    time: datetime = field(default_factory=datetime.now)
+
+
+class ScanQueue:
+    """ Результаты забираются из потока интерфейса через get_results """
+
+    def __init__(self, batch_size: int = SCAN_BATCH_SIZE):
+        self._batch_size = batch_size
+
+        # None в очереди - сброс текущего читателя, чтобы он выполнился по порядку с кодами
+        self._entries: Queue[str | None] = Queue()
+        self._results: Queue[ScanResult] = Queue()
+
+        self._current_phone: str | None = None
+        self._running = False
+        self._stopping = False
+        self._thread = Thread(target=self._run, name="scan-queue", daemon=True)
+
+    def start(self) -> "ScanQueue":
+        self._running = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """ Уже отсканированные коды применяются, после чего поток завершается """
+
+        self._stopping = True
+
+    def join(self, timeout: float | None = None):
+        """ Ждёт завершения потока после stop """
+
+        self._thread.join(timeout)
+
+    def put(self, text: str):
+        text = text.strip()
+        if text:
+            self._entries.put(text)
+
+    def reset_reader(self):
+        self._entries.put(None)
+
+    def pending_count(self) -> int:
+        return self._entries.qsize()
+
+    def get_results(self) -> list[ScanResult]:
+        results = []
+        while True:
+            try:
+                results.append(self._results.get_nowait())
+            except Empty:
+                return results
+
+    def _run(self):
+        while self._running:
+            batch = self._take_batch()
+            if batch:
+                self._apply_batch(batch)
+            elif self._stopping:
+                self._running = False
+
+    def _take_batch(self) -> list[str | None]:
+        try:
+            batch = [self._entries.get(timeout=SCAN_WAIT_TIMEOUT)]
+        except Empty:
+            return []
+
+        while len(batch) < self._batch_size:
+            try:
+                batch.append(self._entries.get_nowait())
+            except Empty:
+                break
+
+        return batch
+
+    def _apply_batch(self, batch: list[str | None]):
+        logger.debug(f"Applying {len(batch)} scanned codes")
+        start_phone = self._current_phone
+
+        try:
+            with grouped_transaction_session() as db:
+                results = [self._apply(entry, db) for entry in batch]
+        except Exception as e:
+            # Любая ошибка отменяет всю группу, но поток продолжает обрабатывать следующие коды
+            logger.exception("Unable to apply scanned codes")
+            self._current_phone = start_phone
+            results = [ScanResult(entry or "", False, f"Ошибка, изменения отменены: {e!r}",
+                                  current_phone=start_phone)
+                       for entry in batch]
+
+        for result in results:
+            self._results.put(result)
+
+    def _apply(self, entry: str | None, db: Session) -> ScanResult:
+        if entry is None:
+            self._current_phone = None
+            return ScanResult("", True, "Читатель сброшен")
+
+        if Validator.is_phone_number(entry):
+            return self._set_reader(entry, db)
+
+        try:
+            result = self._apply_book(entry, db)
+        except OperationError as e:
+            db.rollback()
+            result = ScanResult(entry, False, str(e))
+
+        result.current_phone = self._current_phone
+        return result
+
+    def _set_reader(self, phone: str, db: Session) -> ScanResult:
+        if operations.find_reader_by_phone(phone, db=db) is None:
+            return ScanResult(phone, False, f"Не существует читателя с номером телефона '{phone}'",
+                              current_phone=self._current_phone)
+
+        self._current_phone = phone
+        return ScanResult(phone, True, f"Текущий читатель: '{phone}'", current_phone=phone)
+
+    def _apply_book(self, code: str, db: Session) -> ScanResult:
+        phone = self._current_phone
+
+        if phone is None:
+            loan = operations.return_book_by_code(code, db=db)
+            return ScanResult(code, True, f"Книга '{code}' возвращена читателем '{loan.reader.phone}'", changed=True)
+
+        try:
+            operations.return_book_by_code(code, phone, db=db)
+            return ScanResult(code, True, f"Книга '{code}' возвращена читателем '{phone}'", changed=True)
+        except ObjectNotFoundError:
+            # Книги нет у читателя - значит, её нужно выдать
+            db.rollback()
+
+        operations.issue_book_by_code(code, phone, db=db)
+        return ScanResult(code, True, f"Книга '{code}' выдана читателю '{phone}'", changed=True)
@@ -0,0 +1 @@
+from .app import LibraryService, run_service, DEFAULT_HOST, DEFAULT_PORT
@@ -0,0 +1,318 @@
+"""
+Сервис, предоставляющий операции библиотеки по HTTP с JSON телами запросов и ответов.
+
+Все рабочие места обращаются к одному процессу сервиса, поэтому в бд открыт один пул соединений,
+а результаты чтения и готовые отчёты кэшируются для всех клиентов сразу.
+Синхронные операции с бд выполняются в потоках через asyncio.to_thread, их число ограничено размером пула.
+
+    GET    /health
+    GET    /books?search=...            POST /books           PUT /books/{id}     DELETE /books/{id}
+    GET    /readers?search=...          POST /readers         PUT /readers/{id}   DELETE /readers/{id}
+    GET    /loans?book_id=&reader_id=   POST /loans           {"book_code": ..., "phone": ...}
+    POST   /loans/{id}/return           POST /loans/{id}/write-off
+    GET    /history?limit=100
+    GET    /report                      pdf отчёт за месяц
+
+Экспорт и импорт дампов через сервис недоступны: они работают с файлами на сервере и заменяют
+все данные, поэтому выполняются только локально через cli.py dump/load.
+"""
+
+import asyncio
+import os
+import tempfile
+from http import HTTPStatus
+from logging import getLogger
+from typing import Any, Callable
+
+from .cache import TTLCache
+from .http import Router, Request, Response, HttpError, handle_connection
+from .. import operations
+from ..db import Book, Reader, BookToReader, History
+from ..exc import OperationError, ObjectNotFoundError, ModelEditError
+
+
+logger = getLogger(__name__)
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8085
+
+# Совпадает с размером пула соединений SQLAlchemy по умолчанию
+DB_CONCURRENCY = 5
+
+READ_CACHE_TTL = 5.0
+READ_CACHE_SIZE = 256
+
+PDF_CONTENT_TYPE = "application/pdf"
+
+MAX_HISTORY_LIMIT = 1000
+
+# Допустимые типы полей JSON тел запросов
+BOOK_FIELD_TYPES = {"code": str, "name": str, "author": str, "count": int}
+READER_FIELD_TYPES = {"firstname": (str, type(None)), "lastname": (str, type(None)), "phone": str}
+LOAN_FIELD_TYPES = {"book_code": str, "phone": str}
+
+
+# ----------- Представление записей в JSON ------------
+
+def book_to_dict(book: Book) -> dict[str, Any]:
+    return {
+        "id": book.id,
+        "code": book.code,
+        "name": book.name,
+        "author": book.author,
+        "count": book.count,
+        "available": book.get_available_count(),
+    }
+
+
+def reader_to_dict(reader: Reader) -> dict[str, Any]:
+    return {
+        "id": reader.id,
+        "firstname": reader.firstname,
+        "lastname": reader.lastname,
+        "phone": reader.phone,
+        "taken": len(reader.books_associations),
+    }
+
+
+def loan_to_dict(loan: BookToReader) -> dict[str, Any]:
+    return {
+        "id": loan.id,
+        "book_id": loan.book_id,
+        "book_code": loan.book.code,
+        "reader_id": loan.reader_id,
+        "phone": loan.reader.phone,
+        "issue_date": loan.issue_date.isoformat(),
+    }
+
+
+def event_to_dict(event: History) -> dict[str, Any]:
+    return {
+        "id": event.id,
+        "time": event.time.isoformat(),
+        "event_type": event.event_type.name,
+        "comment": event.comment,
+    }
+
+
+def _get_int_param(request: Request,
+                   name: str,
+                   default: int | None = None,
+                   min_value: int | None = None,
+                   max_value: int | None = None) -> int | None:
+    value = request.query.get(name)
+    if value is None:
+        return default
+
+    try:
+        value = int(value)
+    except ValueError:
+        raise HttpError(HTTPStatus.BAD_REQUEST, f"Параметр '{name}' должен быть целым числом")
+
+    if min_value is not None and value < min_value:
+        raise HttpError(HTTPStatus.BAD_REQUEST, f"Параметр '{name}' должен быть не меньше {min_value}")
+    if max_value is not None and value > max_value:
+        raise HttpError(HTTPStatus.BAD_REQUEST, f"Параметр '{name}' должен быть не больше {max_value}")
+
+    return value
+
+
+def _get_fields(request: Request, field_types: dict[str, type | tuple[type, ...]],
+                required: tuple[str, ...] = ()) -> dict[str, Any]:
+    """ Поля тела запроса из field_types, проверенные до вызова операций, остальные поля отбрасываются """
+
+    values = request.json()
+
+    for name in required:
+        if values.get(name) in (None, ""):
+            raise HttpError(HTTPStatus.BAD_REQUEST, f"Не заполнено поле '{name}'")
+
+    fields = dict()
+    for name, field_type in field_types.items():
+        if name not in values:
+            continue
+
+        value = values[name]
+        # bool в Python - подкласс int, но количеством книг быть не может
+        if not isinstance(value, field_type) or isinstance(value, bool):
+            raise HttpError(HTTPStatus.BAD_REQUEST, f"Некорректный тип поля '{name}'")
+
+        fields[name] = value
+
+    return fields
+
+
+class LibraryService:
+    def __init__(self, cache_ttl: float = READ_CACHE_TTL, db_concurrency: int = DB_CONCURRENCY):
+        self._cache = TTLCache(ttl=cache_ttl, max_size=READ_CACHE_SIZE)
+        self._db_semaphore = asyncio.Semaphore(db_concurrency)
+        # Отчёты тяжёлые, поэтому строятся по одному
+        self._maintenance_lock = asyncio.Lock()
+        self._server: asyncio.Server | None = None
+
+        self._router = Router()
+        self._add_routes()
+
+    async def start(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT) -> int:
+        """ Возвращает порт, на котором запущен сервис (при port=0 он выбирается системой) """
+
+        self._server = await asyncio.start_server(
+            lambda reader, writer: handle_connection(self._router, reader, writer), host, port
+        )
+        port = self._server.sockets[0].getsockname()[1]
+        logger.info(f"Library service is listening on {host}:{port}")
+
+        return port
+
+    async def serve_forever(self):
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def stop(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+    def _add_routes(self):
+        routes = (
+            ("GET", "/health", self._health),
+            ("GET", "/books", self._list_books),
+            ("POST", "/books", self._create_book),
+            ("PUT", "/books/{book_id}", self._update_book),
+            ("DELETE", "/books/{book_id}", self._delete_book),
+            ("GET", "/readers", self._list_readers),
+            ("POST", "/readers", self._create_reader),
+            ("PUT", "/readers/{reader_id}", self._update_reader),
+            ("DELETE", "/readers/{reader_id}", self._delete_reader),
+            ("GET", "/loans", self._list_loans),
+            ("POST", "/loans", self._issue_book),
+            ("POST", "/loans/{loan_id}/return", self._return_book),
+            ("POST", "/loans/{loan_id}/write-off", self._write_off_book),
+            ("GET", "/history", self._list_history),
+            ("GET", "/report", self._create_report),
+        )
+        for method, path, handler in routes:
+            self._router.add(method, path, handler)
+
+    # ----------- Выполнение операций ------------
+
+    async def _run(self, f: Callable, *args) -> Any:
+        """ Выполняет синхронную функцию в потоке и превращает ошибки операций в ошибки HTTP """
+
+        async with self._db_semaphore:
+            try:
+                return await asyncio.to_thread(f, *args)
+            except ObjectNotFoundError as e:
+                raise HttpError(HTTPStatus.NOT_FOUND, str(e))
+            except OperationError as e:
+                raise HttpError(HTTPStatus.CONFLICT, str(e))
+            except ModelEditError as e:
+                raise HttpError(HTTPStatus.BAD_REQUEST, str(e.args[0]))
+
+    async def _read(self, request: Request, f: Callable, *args) -> Response:
+        key = (request.path, tuple(sorted(request.query.items())))
+
+        data = self._cache.get(key)
+        if data is None:
+            data = await self._run(f, *args)
+            self._cache.put(key, data)
+
+        return Response.json(data)
+
+    async def _write(self, f: Callable, *args, status: HTTPStatus = HTTPStatus.OK) -> Response:
+        try:
+            data = await self._run(f, *args)
+        finally:
+            self._cache.clear()
+
+        return Response.json(data, status)
+
+    # ----------- Обработчики ------------
+
+    async def _health(self, request: Request) -> Response:
+        return Response.json({"status": "ok", "cache_hits": self._cache.hits, "cache_misses": self._cache.misses})
+
+    async def _list_books(self, request: Request) -> Response:
+        search = request.query.get("search", "")
+        return await self._read(request, lambda: [book_to_dict(book) for book in operations.list_books(search)])
+
+    async def _create_book(self, request: Request) -> Response:
+        values = _get_fields(request, BOOK_FIELD_TYPES, required=("code", "name", "author"))
+        return await self._write(lambda: book_to_dict(operations.save_book(values)), status=HTTPStatus.CREATED)
+
+    async def _update_book(self, request: Request) -> Response:
+        values, book_id = _get_fields(request, BOOK_FIELD_TYPES), request.path_params["book_id"]
+        return await self._write(lambda: book_to_dict(operations.save_book(values, book_id)))
+
+    async def _delete_book(self, request: Request) -> Response:
+        book_id = request.path_params["book_id"]
+        return await self._write(lambda: operations.delete_book(book_id) or {"id": book_id})
+
+    async def _list_readers(self, request: Request) -> Response:
+        search = request.query.get("search", "")
+        return await self._read(request, lambda: [reader_to_dict(reader) for reader in operations.list_readers(search)])
+
+    async def _create_reader(self, request: Request) -> Response:
+        values = _get_fields(request, READER_FIELD_TYPES, required=("phone",))
+        return await self._write(lambda: reader_to_dict(operations.get_reader(operations.save_reader(values).id)),
+                                 status=HTTPStatus.CREATED)
+
+    async def _update_reader(self, request: Request) -> Response:
+        values, reader_id = _get_fields(request, READER_FIELD_TYPES), request.path_params["reader_id"]
+        return await self._write(
+            lambda: reader_to_dict(operations.get_reader(operations.save_reader(values, reader_id).id))
+        )
+
+    async def _delete_reader(self, request: Request) -> Response:
+        reader_id = request.path_params["reader_id"]
+        return await self._write(lambda: operations.delete_reader(reader_id) or {"id": reader_id})
+
+    async def _list_loans(self, request: Request) -> Response:
+        book_id = _get_int_param(request, "book_id", min_value=1)
+        reader_id = _get_int_param(request, "reader_id", min_value=1)
+        return await self._read(request, lambda: [loan_to_dict(loan) for loan in operations.list_loans(book_id,
+                                                                                                     reader_id)])
+
+    async def _issue_book(self, request: Request) -> Response:
+        values = _get_fields(request, LOAN_FIELD_TYPES, required=("book_code", "phone"))
+
+        return await self._write(lambda: loan_to_dict(operations.issue_book_by_code(values["book_code"],
+                                                                                    values["phone"])),
+                                 status=HTTPStatus.CREATED)
+
+    async def _return_book(self, request: Request) -> Response:
+        loan_id = request.path_params["loan_id"]
+        return await self._write(lambda: loan_to_dict(operations.return_book(loan_id)))
+
+    async def _write_off_book(self, request: Request) -> Response:
+        loan_id = request.path_params["loan_id"]
+        return await self._write(lambda: loan_to_dict(operations.write_off_book(loan_id)))
+
+    async def _list_history(self, request: Request) -> Response:
+        limit = _get_int_param(request, "limit", 100, min_value=1, max_value=MAX_HISTORY_LIMIT)
+        return await self._read(request, lambda: [event_to_dict(event) for event in operations.list_history(limit)])
+
+    async def _create_report(self, request: Request) -> Response:
+        """ Отчёт строится во временный файл, повторные запросы без изменений данных берутся из кэша отчётов """
+
+        def create_report() -> bytes:
+            from ..pdf_report import PdfCreator
+
+            fd, filepath = tempfile.mkstemp(suffix=".pdf")
+            os.close(fd)
+            try:
+                PdfCreator.create_pdf_report(filepath)
+                with open(filepath, "rb") as f:
+                    return f.read()
+            finally:
+                os.remove(filepath)
+
+        async with self._maintenance_lock:
+            data = await self._run(create_report)
+
+        return Response(data, content_type=PDF_CONTENT_TYPE)
+
+
+async def run_service(host: str = DEFAULT_HOST, port: int = DEFAULT_PORT):
+    service = LibraryService()
+    await service.start(host, port)
+    await service.serve_forever()
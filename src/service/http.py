@@ -0,0 +1,178 @@
+"""
+Минимальный HTTP/1.1 сервер поверх asyncio.start_server.
+
+Поддерживается ровно то, что нужно сервису: запросы с Content-Length (без chunked),
+keep-alive соединения, JSON тела запросов и ответов, маршруты вида /books/{id}.
+"""
+
+import asyncio
+import json
+import re
+from dataclasses import dataclass, field
+from http import HTTPStatus
+from logging import getLogger
+from typing import Any, Awaitable, Callable
+from urllib.parse import urlsplit, parse_qsl
+
+
+logger = getLogger(__name__)
+
+MAX_HEADERS_COUNT = 100
+MAX_BODY_SIZE = 10 * 1024 * 1024
+JSON_CONTENT_TYPE = "application/json; charset=utf-8"
+
+
+class HttpError(Exception):
+    def __init__(self, status: HTTPStatus, message: str = ""):
+        super().__init__(message or status.phrase)
+        self.status = status
+        self.message = message or status.phrase
+
+
+@dataclass
+class Request:
+    method: str
+    path: str
+    query: dict[str, str] = field(default_factory=dict)
+    headers: dict[str, str] = field(default_factory=dict)
+    body: bytes = b""
+    path_params: dict[str, Any] = field(default_factory=dict)
+
+    def json(self) -> dict[str, Any]:
+        """ Тело запроса - JSON объект, пустое тело считается пустым объектом """
+
+        if not self.body:
+            return {}
+        try:
+            data = json.loads(self.body)
+        except ValueError:
+            raise HttpError(HTTPStatus.BAD_REQUEST, "Тело запроса не является корректным JSON")
+
+        if not isinstance(data, dict):
+            raise HttpError(HTTPStatus.BAD_REQUEST, "Тело запроса должно быть JSON объектом")
+
+        return data
+
+    @property
+    def keep_alive(self) -> bool:
+        return self.headers.get("connection", "").lower() != "close"
+
+
+@dataclass
+class Response:
+    body: bytes = b""
+    status: HTTPStatus = HTTPStatus.OK
+    content_type: str = JSON_CONTENT_TYPE
+
+    @classmethod
+    def json(cls, data: Any, status: HTTPStatus = HTTPStatus.OK) -> "Response":
+        return cls(json.dumps(data, ensure_ascii=False, default=str).encode("UTF-8"), status)
+
+    def encode(self, keep_alive: bool) -> bytes:
+        headers = [
+            f"HTTP/1.1 {self.status.value} {self.status.phrase}",
+            f"Content-Type: {self.content_type}",
+            f"Content-Length: {len(self.body)}",
+            f"Connection: {'keep-alive' if keep_alive else 'close'}",
+        ]
+        return ("\r\n".join(headers) + "\r\n\r\n").encode("latin-1") + self.body
+
+
+Handler = Callable[[Request], Awaitable[Response]]
+
+
+class Router:
+    """ В шаблоне пути {name} совпадает с целым числом и передаётся в request.path_params """
+
+    def __init__(self):
+        self._routes: list[tuple[re.Pattern, dict[str, Handler]]] = list()
+
+    def add(self, method: str, path_template: str, handler: Handler):
+        pattern = re.compile("^" + re.sub(r"\{(\w+)}", r"(?P<\1>\\d+)", path_template) + "$")
+        for route_pattern, handlers in self._routes:
+            if route_pattern.pattern == pattern.pattern:
+                handlers[method] = handler
+                return
+
+        self._routes.append((pattern, {method: handler}))
+
+    def resolve(self, request: Request) -> Handler:
+        for pattern, handlers in self._routes:
+            match = pattern.match(request.path)
+            if not match:
+                continue
+
+            if request.method not in handlers:
+                raise HttpError(HTTPStatus.METHOD_NOT_ALLOWED)
+
+            request.path_params = {name: int(value) for name, value in match.groupdict().items()}
+            return handlers[request.method]
+
+        raise HttpError(HTTPStatus.NOT_FOUND)
+
+
+async def _read_request(reader: asyncio.StreamReader) -> Request | None:
+    request_line = await reader.readline()
+    if not request_line:
+        return None
+
+    try:
+        method, target, _ = request_line.decode("latin-1").split()
+    except ValueError:
+        raise HttpError(HTTPStatus.BAD_REQUEST, "Некорректная строка запроса")
+
+    headers = dict()
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        if len(headers) >= MAX_HEADERS_COUNT:
+            raise HttpError(HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE)
+
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    try:
+        content_length = int(headers.get("content-length", 0) or 0)
+    except ValueError:
+        raise HttpError(HTTPStatus.BAD_REQUEST, "Некорректный заголовок Content-Length")
+    if content_length < 0:
+        raise HttpError(HTTPStatus.BAD_REQUEST, "Некорректный заголовок Content-Length")
+    if content_length > MAX_BODY_SIZE:
+        raise HttpError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE)
+    body = await reader.readexactly(content_length) if content_length else b""
+
+    url = urlsplit(target)
+    return Request(method=method.upper(),
+                   path=url.path.rstrip("/") or "/",
+                   query=dict(parse_qsl(url.query)),
+                   headers=headers,
+                   body=body)
+
+
+async def handle_connection(router: Router, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        while True:
+            keep_alive = False
+            try:
+                request = await _read_request(reader)
+                if request is None:
+                    break
+
+                keep_alive = request.keep_alive
+                response = await router.resolve(request)(request)
+            except HttpError as e:
+                response = Response.json({"error": e.message}, e.status)
+            except Exception:
+                logger.exception("Unhandled exception while processing request")
+                response = Response.json({"error": "Внутренняя ошибка сервиса"}, HTTPStatus.INTERNAL_SERVER_ERROR)
+
+            writer.write(response.encode(keep_alive))
+            await writer.drain()
+
+            if not keep_alive:
+                break
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
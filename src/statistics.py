@@ -0,0 +1,193 @@
+"""
+Статистика работы библиотеки.
+
+Все подсчёты выполняются в бд агрегирующими запросами (GROUP BY по типу события и периоду),
+поэтому стоимость отчёта не зависит от количества событий в истории.
+"""
+
+import enum
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from typing import Iterable, Iterator
+
+import sqlalchemy as sql
+
+from .db import wrap_with_database, Session, History, EventType, Book, BookToReader
+
+
+class Granularity(enum.Enum):
+    DAY = "day"
+    WEEK = "week"
+    MONTH = "month"
+    YEAR = "year"
+
+
+@dataclass
+class PeriodStat:
+    period: str
+    counts: dict[EventType, int] = field(default_factory=dict)
+
+    def get(self, event_type: EventType) -> int:
+        return self.counts.get(event_type, 0)
+
+
+@dataclass
+class TopBook:
+    code: str
+    name: str
+    author: str
+    loans: int
+
+
+@dataclass
+class TopAuthor:
+    author: str
+    loans: int
+
+
+def _period_label(day: date, granularity: Granularity) -> str:
+    if granularity == Granularity.DAY:
+        return day.isoformat()
+    if granularity == Granularity.WEEK:
+        iso_year, iso_week, _ = day.isocalendar()
+        return f"{iso_year}-W{iso_week:02d}"
+    if granularity == Granularity.MONTH:
+        return f"{day.year}-{day.month:02d}"
+    return str(day.year)
+
+
+def _iter_period_labels(start: datetime, end: datetime, granularity: Granularity) -> Iterator[str]:
+    """ Метки всех периодов диапазона по порядку, чтобы в результате были и периоды без событий """
+
+    last_label = None
+    day = start.date()
+    while datetime.combine(day, datetime.min.time()) < end:
+        label = _period_label(day, granularity)
+        if label != last_label:
+            yield label
+            last_label = label
+        day += timedelta(days=1)
+
+
+def _bucket_columns(granularity: Granularity) -> list[sql.ColumnElement]:
+    # Недели группируются по дням и собираются в недели уже в python:
+    # нумерация недель в MySQL и SQLite различается, а дней в диапазоне немного
+    if granularity in (Granularity.DAY, Granularity.WEEK):
+        return [sql.func.date(History.time)]
+    if granularity == Granularity.MONTH:
+        return [sql.extract("year", History.time), sql.extract("month", History.time)]
+    return [sql.extract("year", History.time)]
+
+
+def _bucket_to_label(bucket: tuple, granularity: Granularity) -> str:
+    if granularity in (Granularity.DAY, Granularity.WEEK):
+        # MySQL возвращает date, SQLite - строку
+        return _period_label(date.fromisoformat(str(bucket[0])[:10]), granularity)
+    if granularity == Granularity.MONTH:
+        return f"{int(bucket[0])}-{int(bucket[1]):02d}"
+    return str(int(bucket[0]))
+
+
+@wrap_with_database
+def get_event_counts(start: datetime,
+                     end: datetime,
+                     granularity: Granularity = Granularity.MONTH,
+                     event_types: Iterable[EventType] | None = None,
+                     db: Session = None) -> list[PeriodStat]:
+    """
+    Количество событий каждого типа по периодам в диапазоне [start, end)
+
+    :param start: Начало диапазона
+    :param end: Конец диапазона (не включается)
+    :param granularity: Длина периода
+    :param event_types: Типы событий, по умолчанию все
+    :param db: Сессия базы данных
+    """
+
+    bucket_columns = _bucket_columns(granularity)
+
+    q = sql.select(
+        History.event_type, *bucket_columns, sql.func.count(History.id)
+    ).where(
+        History.time >= start,
+        History.time < end
+    ).group_by(
+        History.event_type, *bucket_columns
+    )
+    if event_types is not None:
+        q = q.where(History.event_type.in_(list(event_types)))
+
+    stats = {label: PeriodStat(period=label) for label in _iter_period_labels(start, end, granularity)}
+    for event_type, *bucket, events_count in db.execute(q):
+        label = _bucket_to_label(tuple(bucket), granularity)
+        stat = stats.setdefault(label, PeriodStat(period=label))
+        stat.counts[event_type] = stat.counts.get(event_type, 0) + events_count
+
+    return list(stats.values())
+
+
+@wrap_with_database
+def get_event_totals(start: datetime, end: datetime, db: Session = None) -> dict[EventType, int]:
+    q = sql.select(
+        History.event_type, sql.func.count(History.id)
+    ).where(
+        History.time >= start,
+        History.time < end
+    ).group_by(
+        History.event_type
+    )
+
+    return dict(db.execute(q).all())
+
+
+@wrap_with_database
+def get_top_books_on_loan(start: datetime, end: datetime, limit: int = 10, db: Session = None) -> list[TopBook]:
+    """
+    Книги, больше всего экземпляров которых сейчас на руках, среди выдач с start по end.
+    Считаются только невозвращённые книги: в истории нет ссылки на книгу, поэтому выдачи за период по ней не посчитать.
+    """
+
+    loans_count = sql.func.count(BookToReader.id).label("loans")
+    q = sql.select(
+        Book.code, Book.name, Book.author, loans_count
+    ).join(
+        BookToReader.book
+    ).where(
+        BookToReader.issue_date >= start,
+        BookToReader.issue_date < end
+    ).group_by(
+        Book.id, Book.code, Book.name, Book.author
+    ).order_by(
+        loans_count.desc()
+    ).limit(limit)
+
+    return [TopBook(*row) for row in db.execute(q)]
+
+
+@wrap_with_database
+def get_top_authors_on_loan(start: datetime, end: datetime, limit: int = 10, db: Session = None) -> list[TopAuthor]:
+    """ Аналог get_top_books_on_loan для авторов """
+
+    loans_count = sql.func.count(BookToReader.id).label("loans")
+    q = sql.select(
+        Book.author, loans_count
+    ).join(
+        BookToReader.book
+    ).where(
+        BookToReader.issue_date >= start,
+        BookToReader.issue_date < end
+    ).group_by(
+        Book.author
+    ).order_by(
+        loans_count.desc()
+    ).limit(limit)
+
+    return [TopAuthor(*row) for row in db.execute(q)]
+
+
+def get_months_start(months: int, now: datetime | None = None) -> datetime:
+    """ Начало месяца, отстоящего от текущего на months - 1 месяцев назад """
+
+    now = now or datetime.now()
+    year, month = divmod(now.year * 12 + now.month - 1 - (months - 1), 12)
+    return datetime(year, month + 1, 1)
@@ -0,0 +1,66 @@
+"""
+Локальный кэш последних показанных строк таблиц.
+
+При запуске приложения строки из кэша показываются сразу, ещё до подключения к базе данных,
+а затем всегда заменяются данными, заново загруженными из бд. Хранятся только отображаемые значения
+и первичные ключи, поэтому по строкам из кэша нельзя выполнять действия.
+
+Кэш лежит в каталоге пользователя (см. user_dirs) без шифрования. Отображаемые значения включают
+имена и телефоны читателей, поэтому каталог доступен только владельцу, а строки,
+отобранные поиском или фильтром, не сохраняются.
+"""
+
+import json
+import os
+from dataclasses import dataclass, field, asdict
+from logging import getLogger
+from pathlib import Path
+
+from .user_dirs import get_cache_dir, make_private_dir
+
+
+logger = getLogger(__name__)
+
+TABLE_CACHE_DIR = get_cache_dir("tables")
+TABLE_CACHE_FORMAT_VERSION = 2
+
+
+@dataclass
+class CachedTable:
+    fields: list[str]
+    rows: list[tuple[int, list[str]]] = field(default_factory=list)
+    format_version: int = TABLE_CACHE_FORMAT_VERSION
+
+
+class TableCache:
+    def __init__(self, directory: str | Path = TABLE_CACHE_DIR):
+        self._directory = Path(directory)
+
+    def load(self, key: str, fields: list[str]) -> CachedTable | None:
+        """ Возвращает None, если кэша нет, он повреждён или сохранён для другого набора колонок """
+
+        path = self._get_path(key)
+        try:
+            cached = CachedTable(**json.loads(path.read_text(encoding="UTF-8")))
+        except FileNotFoundError:
+            return None
+        except (ValueError, TypeError):
+            logger.warning(f"Ignoring broken table cache '{path}'")
+            return None
+
+        if cached.format_version != TABLE_CACHE_FORMAT_VERSION or cached.fields != fields:
+            logger.info(f"Table cache '{path}' is outdated, ignoring it")
+            return None
+
+        return cached
+
+    def save(self, key: str, cached: CachedTable):
+        make_private_dir(self._directory)
+
+        path = self._get_path(key)
+        tmp_path = path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(asdict(cached), ensure_ascii=False, separators=(",", ":")), encoding="UTF-8")
+        os.replace(tmp_path, path)
+
+    def _get_path(self, key: str) -> Path:
+        return self._directory / f"{key}.json"
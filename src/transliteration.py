@@ -0,0 +1,37 @@
+""" Транслитерация текста в латиницу для экспорта в форматы, шрифты которых не поддерживают кириллицу """
+
+from dataclasses import dataclass
+from functools import lru_cache
+
+from transliterate import translit
+
+
+# Коды, названия и авторы книг сильно повторяются, поэтому результаты кэшируются
+CACHE_SIZE = 8192
+
+
+@dataclass
+class TransliterationStats:
+    hits: int
+    misses: int
+    size: int
+    max_size: int
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def to_latin(text: str) -> str:
+    return translit(text, "ru", reversed=True)
+
+
+def get_stats() -> TransliterationStats:
+    info = to_latin.cache_info()
+    return TransliterationStats(hits=info.hits, misses=info.misses, size=info.currsize, max_size=info.maxsize)
+
+
+def clear_cache():
+    to_latin.cache_clear()
@@ -0,0 +1,41 @@
+"""
+Каталоги приложения в профиле пользователя.
+
+Кэши хранятся не в текущем каталоге, а в стандартном для системы месте:
+%LOCALAPPDATA% в Windows, ~/Library/Caches в macOS и $XDG_CACHE_HOME (~/.cache) в остальных системах.
+Каталоги создаются доступными только владельцу, так как в кэшах могут быть данные читателей.
+В Windows права на каталоги не задаются: %LOCALAPPDATA% и так доступен только владельцу.
+"""
+
+import os
+import sys
+from pathlib import Path
+
+
+APP_DIR_NAME = "library_manager"
+
+
+def get_cache_dir(name: str) -> Path:
+    """ Каталог кэша name, сам каталог не создаётся """
+
+    if sys.platform == "win32":
+        base = os.environ.get("LOCALAPPDATA") or Path.home() / "AppData" / "Local"
+    elif sys.platform == "darwin":
+        base = Path.home() / "Library" / "Caches"
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+
+    return Path(base) / APP_DIR_NAME / name
+
+
+def make_private_dir(path: Path):
+    """ Создаёт path и недостающие родительские каталоги, каждый из них - доступным только владельцу """
+
+    missing = list()
+    while not path.exists():
+        missing.append(path)
+        path = path.parent
+
+    # mkdir(parents=True) задаёт mode только последнему каталогу, поэтому каталоги создаются по одному
+    for directory in reversed(missing):
+        directory.mkdir(mode=0o700, exist_ok=True)
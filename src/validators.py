@@ -3,14 +3,19 @@ import re
 from .exc import FieldValidationError
 
 
+PHONE_NUMBER_PATTERN = re.compile(r"\+7\d{10}")
+
+
 class Validator:
     """ Класс для валидации различных данных """
 
     @staticmethod
-    def validate_phone_number(str_to_validate: str) -> None:
-        number_pattern = re.compile(r"\+7\d{10}")
+    def is_phone_number(str_to_validate: str) -> bool:
+        return PHONE_NUMBER_PATTERN.fullmatch(str_to_validate) is not None
 
-        if not number_pattern.fullmatch(str_to_validate):
+    @staticmethod
+    def validate_phone_number(str_to_validate: str) -> None:
+        if not Validator.is_phone_number(str_to_validate):
             raise FieldValidationError("Некорректный номер телефона")
 
     @staticmethod
@@ -1,5 +1,8 @@
 import logging.config
 
+from src import profiler
+profiler.install_import_hook()
+
 import config
 import style
 from src.app import Application
@@ -0,0 +1,41 @@
+import os
+import tempfile
+from unittest import TestCase, IsolatedAsyncioTestCase
+
+from src import db, async_db
+from src.db import init_db
+
+
+class _TemporaryDatabase:
+    """
+    Каждый тест работает с новой SQLite базой во временном файле.
+    Движки бд глобальные, поэтому после теста возвращаются прежние: модули тестов, работающие с бд из config,
+    подключаются к ней при импорте и должны продолжать работать, если запущены вместе с этими тестами.
+    """
+
+    def setUp(self):
+        self._saved_engine = getattr(db, "_engine", None)
+        self._saved_async_engine = async_db._async_engine
+
+        fd, self._db_path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        self.db_url = f"sqlite:///{self._db_path}"
+        init_db(self.db_url)
+
+    def tearDown(self):
+        db._engine.dispose()
+        db._engine = self._saved_engine
+        async_db._async_engine = self._saved_async_engine
+
+        os.remove(self._db_path)
+
+
+class DatabaseTestCase(_TemporaryDatabase, TestCase):
+    pass
+
+
+class AsyncDatabaseTestCase(_TemporaryDatabase, IsolatedAsyncioTestCase):
+    async def asyncTearDown(self):
+        # Асинхронный движок, созданный тестом, закрывается в цикле событий теста
+        if async_db._async_engine is not self._saved_async_engine:
+            await async_db.dispose()
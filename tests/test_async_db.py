@@ -0,0 +1,30 @@
+import asyncio
+
+from src import async_db, operations
+from src.db import Book, Reader
+from .base import AsyncDatabaseTestCase
+
+
+class TestAsyncDb(AsyncDatabaseTestCase):
+    async def asyncSetUp(self):
+        async_db.init_async_db(self.db_url)
+
+        self._book = operations.save_book({"code": "B1", "name": "Книга", "author": "Автор", "count": 2})
+        operations.save_reader({"firstname": "Иван", "phone": "+79990000000"})
+
+    async def test_concurrent_fetch_and_return(self):
+        loan = operations.issue_book(self._book.id, "+79990000000")
+
+        (data_version, rows), (_, reader_rows) = await asyncio.gather(
+            async_db.fetch_table_rows(Book, order_by=Book.code),
+            async_db.fetch_table_rows(Reader)
+        )
+        self.assertGreater(data_version, 0)
+        self.assertEqual(rows[0].values, ("B1", "Книга", "Автор", "1 шт.", "2 шт."))
+        # Ключи сортировки в порядке Book.get_sort_fields, строки без учёта регистра
+        self.assertEqual(rows[0].sort_keys, ((1, "b1"), (1, "книга"), (1, "автор"), (1, 2), (1, 1)))
+        self.assertEqual(len(reader_rows), 1)
+
+        returned = await async_db.return_book(loan.id)
+        self.assertEqual(returned.book.code, "B1")
+        self.assertEqual(operations.list_loans(book_id=self._book.id), [])
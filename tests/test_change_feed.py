@@ -0,0 +1,105 @@
+import os
+import tempfile
+from datetime import datetime
+
+import sqlalchemy as sql
+
+from src import change_feed, operations
+from src.db import wrap_with_database, ChangeLog, Session
+from src.json_dump import Dumper, snapshot
+from .base import DatabaseTestCase
+
+
+@wrap_with_database
+def commit_change(change_id: int, table_name: str, time: datetime | None = None, db: Session = None):
+    db.add(ChangeLog(id=change_id, table_name=table_name, row_id=1, time=time or datetime.now()))
+    db.commit()
+
+
+class TestChangeFeed(DatabaseTestCase):
+    def test_changes_since_last_poll(self):
+        book = operations.save_book({"code": "B1", "name": "Книга", "author": "Автор", "count": 1})
+        operations.save_reader({"phone": "+79990000000"})
+        last_change_id = change_feed.get_last_change_id()
+
+        loan = operations.issue_book(book.id, "+79990000000")
+        operations.return_book(loan.id)
+
+        change_set = change_feed.get_changes(last_change_id)
+        self.assertEqual(change_set.tables["book_to_reader"].deleted_row_ids, {loan.id})
+        self.assertNotIn("readers", change_set.tables)
+
+        self.assertFalse(change_feed.get_changes(change_set.last_change_id))
+
+    def test_change_committed_after_later_id(self):
+        # id записи журнала выдаётся при вставке, поэтому транзакция с меньшим id может зафиксироваться позже.
+        # SQLite не допускает двух пишущих транзакций одновременно, поэтому порядок фиксации задаётся явными id
+        operations.save_book({"code": "B1", "name": "Книга", "author": "Автор", "count": 1})
+        cursor = change_feed.get_cursor()
+        late_id, early_id = cursor.last_change_id + 1, cursor.last_change_id + 2
+
+        commit_change(early_id, "readers")
+        change_set = change_feed.get_changes(cursor)
+        self.assertEqual(change_set.last_change_id, early_id)
+        self.assertIn(late_id, change_set.cursor.gaps)
+
+        # Снимок берёт ту же позицию, что и лента: не дальше незавершённой транзакции
+        fd, snapshot_path = tempfile.mkstemp(suffix=".lbsnap")
+        os.close(fd)
+        self.addCleanup(os.remove, snapshot_path)
+        self.assertEqual(Dumper.dump_to_snapshot(snapshot_path), late_id - 1)
+
+        commit_change(late_id, "books")
+        late_change_set = change_feed.get_changes(change_set.cursor)
+        self.assertTrue(late_change_set.tables["books"].has_late_changes)
+        self.assertEqual(late_change_set.cursor.gaps, {})
+        self.assertEqual(late_change_set.last_change_id, early_id)
+
+    def test_snapshot_restore_is_logged(self):
+        book = operations.save_book({"code": "B1", "name": "Книга", "author": "Автор", "count": 1})
+        fd, snapshot_path = tempfile.mkstemp(suffix=".lbsnap")
+        os.close(fd)
+        self.addCleanup(os.remove, snapshot_path)
+
+        Dumper.dump_to_snapshot(snapshot_path)
+        operations.delete_book(book.id)
+        cursor = change_feed.get_cursor()
+
+        Dumper.load_from_snapshot(snapshot_path)
+
+        change_set = change_feed.get_changes(cursor)
+        self.assertEqual(set(change_set.tables), {"books", "readers", "book_to_reader", "history"})
+        self.assertTrue(all(changes.whole_table for changes in change_set.tables.values()))
+        self.assertEqual(change_set.tables["books"].row_ids, set())
+
+    def test_rolled_back_gap_expires(self):
+        cursor = change_feed.get_cursor()
+        rolled_back_id = cursor.last_change_id + 1
+
+        commit_change(rolled_back_id + 1, "readers", datetime.now() - change_feed.CHANGE_GAP_TIMEOUT * 2)
+
+        self.assertEqual(change_feed.get_changes(cursor).cursor.gaps, {})
+        self.assertEqual(change_feed.get_cursor().settled_change_id, rolled_back_id + 1)
+
+    def test_prune_change_log(self):
+        fd, snapshot_path = tempfile.mkstemp(suffix=".lbsnap")
+        os.close(fd)
+        self.addCleanup(os.remove, snapshot_path)
+
+        dump_id = Dumper.dump_to_snapshot(snapshot_path)
+        for number in range(3):
+            operations.save_book({"code": f"B{number}", "name": "Книга", "author": "Автор", "count": 1})
+        last_change_id = change_feed.get_last_change_id()
+
+        @wrap_with_database
+        def make_old(db: Session = None):
+            db.execute(sql.update(ChangeLog).values(time=datetime.now() - change_feed.CHANGE_LOG_RETENTION * 2))
+            db.commit()
+
+        make_old()
+        self.assertEqual(change_feed.prune_change_log(), 2)
+
+        # Последняя запись остаётся, версия данных не уменьшается
+        self.assertEqual(change_feed.get_last_change_id(), last_change_id)
+        with self.assertRaises(snapshot.SnapshotChainError):
+            Dumper.dump_to_snapshot(snapshot_path, since_dump_id=dump_id)
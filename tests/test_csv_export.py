@@ -0,0 +1,37 @@
+import csv
+import os
+import tempfile
+
+from src import operations
+from src.csv_export import export_table, EXPORT_BATCH_SIZE
+from src.db import Book
+from .base import DatabaseTestCase
+
+
+class TestCsvExport(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+
+        fd, self._csv_path = tempfile.mkstemp(suffix=".csv")
+        os.close(fd)
+
+    def tearDown(self):
+        os.remove(self._csv_path)
+        super().tearDown()
+
+    def test_export_streams_display_columns(self):
+        books_count = EXPORT_BATCH_SIZE + 5
+        for i in range(books_count):
+            operations.save_book({"code": f"B{i:05}", "name": "Книга", "author": "Автор", "count": 1})
+
+        progress = []
+        exported = export_table(Book, self._csv_path, order_by=Book.code, progress=progress.append)
+
+        with open(self._csv_path, encoding="utf-8-sig", newline="") as f:
+            rows = list(csv.reader(f))
+
+        self.assertEqual(exported, books_count)
+        self.assertEqual(progress, [EXPORT_BATCH_SIZE, books_count])
+        self.assertEqual(rows[0], Book.get_table_fields())
+        self.assertEqual(len(rows), books_count + 1)
+        self.assertEqual(rows[1][:3], ["B00000", "Книга", "Автор"])
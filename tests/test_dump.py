@@ -2,7 +2,8 @@ from unittest import TestCase
 from pathlib import Path
 import os
 
-from src.json_dump import Dumper
+from src import operations
+from src.json_dump import Dumper, snapshot
 from src.db import init_db
 from src.config_models import ConfigModel
 import config
@@ -22,3 +23,77 @@ class TestDatabase(TestCase):
         Dumper.load_from_file(test_file_path)
 
         os.remove(test_file_path)
+
+    def test_snapshot_dump(self):
+        test_file_path = "test_dump.lbsnap"
+        Dumper.dump_to_snapshot(test_file_path)
+
+        is_file_exists = Path(test_file_path).exists()
+        self.assertEqual(is_file_exists, True)
+
+        Dumper.load_from_snapshot(test_file_path)
+
+        os.remove(test_file_path)
+
+    def test_snapshot_json_conversion(self):
+        json_path, snapshot_path = "test_dump.json", "test_dump.lbsnap"
+        Dumper.dump_to_file(json_path)
+
+        Dumper.convert_json_to_snapshot(json_path, snapshot_path)
+        Dumper.convert_snapshot_to_json(snapshot_path, json_path)
+
+        Dumper.load_from_file(json_path)
+
+        os.remove(json_path)
+        os.remove(snapshot_path)
+
+    def test_differential_snapshot_dump(self):
+        base_path, delta_path = "test_dump.lbsnap", "test_dump_delta.lbsnap"
+        for book in operations.list_books("DIFF-"):
+            operations.delete_book(book.id)
+
+        updated = operations.save_book({"code": "DIFF-1", "name": "Книга", "author": "Автор", "count": 1})
+        deleted = operations.save_book({"code": "DIFF-2", "name": "Книга", "author": "Автор", "count": 1})
+        dump_id = Dumper.dump_to_snapshot(base_path)
+
+        # Между базовым и дифференциальным снимками меняем, удаляем и добавляем по строке
+        operations.save_book({"name": "Новое название"}, book_id=updated.id)
+        inserted = operations.save_book({"code": "DIFF-3", "name": "Книга", "author": "Автор", "count": 2})
+        operations.delete_book(deleted.id)
+        Dumper.dump_to_snapshot(delta_path, since_dump_id=dump_id)
+
+        with open(delta_path, "rb") as f:
+            delta = snapshot.read_snapshot(f)
+        self.assertIn({"table_name": "books", "row_id": deleted.id},
+                      list(delta.sections[snapshot.TOMBSTONES_SECTION].iter_rows()))
+        self.assertEqual({row["id"] for row in delta.sections["books"].iter_rows()}, {updated.id, inserted.id})
+
+        Dumper.load_from_snapshot(base_path, delta_path)
+
+        books = {book.code: book for book in operations.list_books("DIFF-")}
+        self.assertEqual(set(books), {"DIFF-1", "DIFF-3"})
+        self.assertEqual(books["DIFF-1"].name, "Новое название")
+        self.assertEqual(books["DIFF-3"].count, 2)
+
+        os.remove(base_path)
+        os.remove(delta_path)
+
+    def test_differential_snapshot_after_restore(self):
+        old_path, base_path, delta_path = "test_dump_old.lbsnap", "test_dump.lbsnap", "test_dump_delta.lbsnap"
+        for book in operations.list_books("DIFF-"):
+            operations.delete_book(book.id)
+
+        operations.save_book({"code": "DIFF-1", "name": "Книга", "author": "Автор", "count": 1})
+        Dumper.dump_to_snapshot(old_path)
+        operations.save_book({"code": "DIFF-2", "name": "Книга", "author": "Автор", "count": 1})
+        dump_id = Dumper.dump_to_snapshot(base_path)
+
+        # Восстановление удаляет DIFF-2 мимо ORM, дифференциальный снимок всё равно должен это учесть
+        Dumper.load_from_snapshot(old_path)
+        Dumper.dump_to_snapshot(delta_path, since_dump_id=dump_id)
+
+        Dumper.load_from_snapshot(base_path, delta_path)
+        self.assertEqual({book.code for book in operations.list_books("DIFF-")}, {"DIFF-1"})
+
+        for path in (old_path, base_path, delta_path):
+            os.remove(path)
@@ -0,0 +1,54 @@
+import os
+import tempfile
+from datetime import datetime
+from unittest import mock
+
+from src import operations
+from src.db import EventType
+from src.json_dump import Dumper, pydantic_models
+from src.json_dump.checkpoint import ImportCheckpoint
+from .base import DatabaseTestCase
+
+
+EVENTS_COUNT = 5
+
+
+class CheckpointLost(Exception):
+    pass
+
+
+class TestImportCheckpoint(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+
+        file_model = pydantic_models.FileModel(history=[
+            pydantic_models.Event(event_type=EventType.NEW_READER, time=datetime(2024, 1, day), comment=str(day))
+            for day in range(1, EVENTS_COUNT + 1)
+        ])
+
+        fd, self._dump_path = tempfile.mkstemp(suffix=".json")
+        with os.fdopen(fd, "w", encoding="UTF-8") as dump_file:
+            dump_file.write(file_model.json())
+
+    def tearDown(self):
+        ImportCheckpoint.remove(self._dump_path)
+        os.remove(self._dump_path)
+        super().tearDown()
+
+    def test_resume_after_lost_checkpoint(self):
+        save_checkpoint = ImportCheckpoint.save
+
+        # Сбой после коммита второй пачки истории, но до записи её контрольной точки
+        def save(checkpoint: ImportCheckpoint, dump_filepath: str):
+            if checkpoint.section == "history" and checkpoint.offset == 4:
+                raise CheckpointLost()
+            save_checkpoint(checkpoint, dump_filepath)
+
+        with mock.patch("src.json_dump.dumper.IMPORT_BATCH_SIZE", 2):
+            with mock.patch.object(ImportCheckpoint, "save", save), self.assertRaises(CheckpointLost):
+                Dumper.load_from_file(self._dump_path)
+
+            Dumper.load_from_file(self._dump_path)
+
+        events = operations.list_history(EVENTS_COUNT * 2)
+        self.assertEqual(sorted(event.comment for event in events), [str(day) for day in range(1, EVENTS_COUNT + 1)])
@@ -0,0 +1,46 @@
+from src import operations, change_feed
+from src.db import wrap_with_database, Session, BookToReader
+from src.exc import OperationError
+from .base import DatabaseTestCase
+
+
+class TestOperations(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+
+        self._book = operations.save_book({"code": "B1", "name": "Книга", "author": "Автор", "count": 2})
+        operations.save_reader({"phone": "+79990000000"})
+
+    def test_loan_counters_are_logged(self):
+        cursor = change_feed.get_cursor()
+        loan = operations.issue_book(self._book.id, "+79990000000")
+        self.assertEqual(change_feed.get_changes(cursor).tables["books"].row_ids, {self._book.id})
+
+        cursor = change_feed.get_cursor()
+        operations.return_book(loan.id)
+        changes = change_feed.get_changes(cursor).tables
+        self.assertEqual(changes["books"].row_ids, {self._book.id})
+        self.assertEqual(changes["book_to_reader"].deleted_row_ids, {loan.id})
+
+    def test_concurrent_return_changes_counters_once(self):
+        loan = operations.issue_book(self._book.id, "+79990000000")
+
+        # Второе рабочее место прочитало выдачу до того, как первое её вернуло
+        @wrap_with_database
+        def return_stale_loan(db: Session = None):
+            stale_loan = db.get(BookToReader, loan.id)
+            db.commit()
+            operations.return_book(loan.id)
+            operations.return_book(stale_loan.id, db=db)
+
+        with self.assertRaises(OperationError):
+            return_stale_loan()
+
+        book = operations.get_book(self._book.id)
+        self.assertEqual((book.get_taken_count(), book.get_available_count()), (0, 2))
+
+    def test_saved_book_is_readable_after_session_closes(self):
+        operations.issue_book(self._book.id, "+79990000000")
+
+        book = operations.save_book({"count": 5}, book_id=self._book.id)
+        self.assertEqual((book.get_taken_count(), book.get_available_count()), (1, 4))
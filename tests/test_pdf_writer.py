@@ -0,0 +1,54 @@
+import os
+import tempfile
+
+from borb.pdf import PDF
+
+from src import operations
+from src.pdf_report import PdfCreator, FIRST_PAGE_ROWS, ROWS_PER_PAGE
+from .base import DatabaseTestCase
+
+
+LOANS_COUNT = FIRST_PAGE_ROWS + 2 * ROWS_PER_PAGE
+
+
+class TestPdfPages(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+
+        # Длинные значения не должны переносить строки таблицы на следующий лист
+        operations.save_reader({"phone": "+79990000000"})
+        for number in range(LOANS_COUNT):
+            book = operations.save_book({"code": f"B{number}", "name": "Очень длинное название книги " * 5,
+                                         "author": "Автор с длинным именем " * 3, "count": 1})
+            operations.issue_book(book.id, "+79990000000")
+
+        fd, self._report_path = tempfile.mkstemp(suffix=".pdf")
+        os.close(fd)
+
+    def tearDown(self):
+        if os.path.exists(self._report_path):
+            os.remove(self._report_path)
+        super().tearDown()
+
+    def test_report_pages(self):
+        progress = []
+        PdfCreator.create_pdf_report(self._report_path, lambda done, total: progress.append(done), use_cache=False)
+
+        # Перед статистикой и перед таблицей передаётся ноль готовых строк
+        self.assertEqual(progress, [0, 0, FIRST_PAGE_ROWS, FIRST_PAGE_ROWS + ROWS_PER_PAGE, LOANS_COUNT])
+
+        with open(self._report_path, "rb") as pdf_file:
+            doc = PDF.loads(pdf_file)
+        # Статистика может занять отдельный лист, каждая следующая страница таблицы - ровно один лист
+        self.assertIn(int(doc.get_document_info().get_number_of_pages()), (3, 4))
+
+    def test_cancelled_report_is_removed(self):
+        # Отмена после первой страницы, когда файл уже частично записан
+        def cancel(done: int, total: int):
+            if done:
+                raise KeyboardInterrupt
+
+        with self.assertRaises(KeyboardInterrupt):
+            PdfCreator.create_pdf_report(self._report_path, cancel, use_cache=False)
+
+        self.assertFalse(os.path.exists(self._report_path))
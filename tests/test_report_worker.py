@@ -0,0 +1,76 @@
+import os
+import tempfile
+import time
+
+from src import operations
+from src.report_worker import ReportQueue, ReportJob
+from .base import DatabaseTestCase
+
+
+POLL_TIMEOUT = 60.0
+POLL_INTERVAL = 0.05
+
+
+class TestReportQueue(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+
+        operations.save_reader({"phone": "+79990000000"})
+        for number in range(50):
+            book = operations.save_book({"code": f"B{number}", "name": "Книга", "author": "Автор", "count": 1})
+            operations.issue_book(book.id, "+79990000000")
+
+        self._report_dir = tempfile.TemporaryDirectory()
+        self._events = []
+
+    def tearDown(self):
+        self._report_dir.cleanup()
+        super().tearDown()
+
+    def _make_job(self) -> ReportJob:
+        return ReportJob(filepath=os.path.join(self._report_dir.name, "report.pdf"),
+                         on_done=lambda: self._events.append("done"),
+                         on_error=lambda message: self._events.append(f"error: {message}"),
+                         on_cancelled=lambda: self._events.append("cancelled"))
+
+    def _wait(self, queue: ReportQueue):
+        deadline = time.monotonic() + POLL_TIMEOUT
+        while queue.has_jobs():
+            self.assertLess(time.monotonic(), deadline, "Report job did not finish")
+            queue.poll()
+            time.sleep(POLL_INTERVAL)
+
+    def test_report(self):
+        queue = ReportQueue(self.db_url)
+        job = self._make_job()
+        queue.submit(job)
+        self._wait(queue)
+
+        self.assertEqual(self._events, ["done"])
+        self.assertTrue(os.path.exists(job.filepath))
+
+    def test_cancel_running_report(self):
+        queue = ReportQueue(self.db_url)
+        job = self._make_job()
+        queue.submit(job)
+        queue.poll()
+
+        # Процесс запущен и останавливается на первой проверке флага отмены
+        queue.cancel(job)
+        self._wait(queue)
+
+        self.assertEqual(self._events, ["cancelled"])
+        self.assertFalse(os.path.exists(job.filepath))
+
+    def test_terminate_report_after_cancel_timeout(self):
+        queue = ReportQueue(self.db_url, cancel_timeout=0)
+        job = self._make_job()
+        queue.submit(job)
+        queue.poll()
+
+        queue.cancel(job)
+        queue.poll()
+
+        self.assertFalse(queue.has_jobs())
+        self.assertEqual(self._events, ["cancelled"])
+        self.assertFalse(os.path.exists(job.filepath))
@@ -0,0 +1,65 @@
+import time
+
+from src import operations, db
+from src.scan_queue import ScanQueue, ScanResult
+from .base import DatabaseTestCase
+
+
+class TestScanQueue(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+
+        operations.save_book({"code": "B1", "name": "Книга", "author": "Автор", "count": 1})
+        operations.save_reader({"phone": "+79990000000"})
+
+        self._queue = ScanQueue().start()
+
+    def tearDown(self):
+        self._queue.stop()
+        self._queue.join()
+        super().tearDown()
+
+    def _wait_results(self, count: int) -> list[ScanResult]:
+        results = []
+        deadline = time.monotonic() + 5
+        while len(results) < count and time.monotonic() < deadline:
+            results.extend(self._queue.get_results())
+            time.sleep(0.01)
+
+        return results
+
+    def test_checkout_and_return(self):
+        for text in ("+79990000000", "B1", "B1", "B1", "UNKNOWN"):
+            self._queue.put(text)
+        self._queue.reset_reader()
+        self._queue.put("B1")
+
+        results = self._wait_results(7)
+        self.assertEqual([result.ok for result in results], [True, True, True, True, False, True, True])
+        self.assertEqual(results[1].message, "Книга 'B1' выдана читателю '+79990000000'")
+        self.assertEqual(results[2].message, "Книга 'B1' возвращена читателем '+79990000000'")
+        self.assertIsNone(results[-1].current_phone)
+
+        self.assertEqual(operations.list_loans(), [])
+        self.assertEqual(operations.get_book(1).get_available_count(), 1)
+
+    def test_failed_batch_keeps_worker_running(self):
+        engine = db._engine
+        db._engine = None
+        self._queue.put("+79990000000")
+        failed = self._wait_results(1)
+        db._engine = engine
+
+        self.assertFalse(failed[0].ok)
+        self.assertIsNone(failed[0].current_phone)
+
+        self._queue.put("+79990000000")
+        self.assertEqual(self._wait_results(1)[0].current_phone, "+79990000000")
+
+    def test_stop_applies_scanned_codes(self):
+        for text in ("+79990000000", "B1"):
+            self._queue.put(text)
+        self._queue.stop()
+
+        self.assertEqual(len(self._wait_results(2)), 2)
+        self.assertEqual(len(operations.list_loans()), 1)
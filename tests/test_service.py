@@ -0,0 +1,101 @@
+import asyncio
+import json
+
+from src.service import LibraryService
+from .base import AsyncDatabaseTestCase
+
+
+async def request(port: int, method: str, path: str, data: dict | None = None) -> tuple[int, dict]:
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+
+    body = json.dumps(data).encode() if data is not None else b""
+    writer.write(f"{method} {path} HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n"
+                 f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+    await writer.drain()
+
+    response = await reader.read()
+    writer.close()
+
+    head, _, response_body = response.partition(b"\r\n\r\n")
+    status = int(head.split()[1])
+    return status, json.loads(response_body)
+
+
+class TestService(AsyncDatabaseTestCase):
+    async def asyncSetUp(self):
+        self._service = LibraryService(cache_ttl=60)
+        self._port = await self._service.start(port=0)
+
+    async def asyncTearDown(self):
+        await self._service.stop()
+        await super().asyncTearDown()
+
+    async def test_issue_and_return_book(self):
+        status, book = await request(self._port, "POST", "/books",
+                                     {"code": "B1", "name": "Книга", "author": "Автор", "count": 1})
+        self.assertEqual(status, 201)
+        self.assertEqual(book["available"], 1)
+
+        status, _ = await request(self._port, "POST", "/readers", {"firstname": "Иван", "phone": "+79990000000"})
+        self.assertEqual(status, 201)
+
+        status, loan = await request(self._port, "POST", "/loans", {"book_code": "B1", "phone": "+79990000000"})
+        self.assertEqual(status, 201)
+
+        status, error = await request(self._port, "POST", "/loans", {"book_code": "B1", "phone": "+79990000000"})
+        self.assertEqual(status, 409)
+        self.assertIn("error", error)
+
+        _, books = await request(self._port, "GET", "/books")
+        self.assertEqual(books[0]["available"], 0)
+
+        status, _ = await request(self._port, "POST", f"/loans/{loan['id']}/return")
+        self.assertEqual(status, 200)
+
+        _, books = await request(self._port, "GET", "/books?search=B1")
+        self.assertEqual(books[0]["available"], 1)
+
+        _, history = await request(self._port, "GET", "/history")
+        self.assertEqual(len(history), 3)
+
+    async def test_errors(self):
+        status, _ = await request(self._port, "GET", "/unknown")
+        self.assertEqual(status, 404)
+
+        status, _ = await request(self._port, "DELETE", "/readers/100")
+        self.assertEqual(status, 404)
+
+        status, _ = await request(self._port, "POST", "/readers", {"phone": "123"})
+        self.assertEqual(status, 400)
+
+        status, _ = await request(self._port, "POST", "/loans", ["B1"])
+        self.assertEqual(status, 400)
+
+        for path, data in (("/readers", {"phone": 79990000000}),
+                           ("/books", {"code": "B1", "name": "Книга", "author": "Автор", "count": [1]}),
+                           ("/books", {"name": "Книга"}),
+                           ("/loans", {"book_code": "B1", "phone": ["x"]})):
+            status, _ = await request(self._port, "POST", path, data)
+            self.assertEqual(status, 400, (path, data))
+
+        status, _ = await request(self._port, "GET", "/history?limit=-1")
+        self.assertEqual(status, 400)
+
+        book = {"code": "B1", "name": "Книга", "author": "Автор", "count": 1}
+        status, _ = await request(self._port, "POST", "/books", book)
+        self.assertEqual(status, 201)
+        status, error = await request(self._port, "POST", "/books", book)
+        self.assertEqual((status, error["error"]), (400, "Ошибка, код книги дублируется"))
+
+        status, _ = await request(self._port, "POST", "/load", {"file": "/tmp/dump.json"})
+        self.assertEqual(status, 404)
+
+    async def test_bad_content_length(self):
+        reader, writer = await asyncio.open_connection("127.0.0.1", self._port)
+        writer.write(b"POST /readers HTTP/1.1\r\nConnection: close\r\nContent-Length: abc\r\n\r\n")
+        await writer.drain()
+
+        response = await reader.read()
+        writer.close()
+
+        self.assertEqual(int(response.split()[1]), 400)
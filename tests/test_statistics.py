@@ -0,0 +1,21 @@
+from unittest import TestCase
+from datetime import datetime
+
+from src import statistics
+from src.db import init_db
+from src.config_models import ConfigModel
+import config
+
+config_model = ConfigModel(**vars(config))
+init_db(config_model.database)
+
+
+class TestStatistics(TestCase):
+    def test_month_trend(self):
+        now = datetime.now()
+        start = statistics.get_months_start(12, now)
+
+        trend = statistics.get_event_counts(start, now, statistics.Granularity.MONTH)
+
+        self.assertEqual(len(trend), 12)
+        self.assertEqual(trend[-1].period, f"{now.year}-{now.month:02d}")
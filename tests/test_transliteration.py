@@ -0,0 +1,16 @@
+from unittest import TestCase
+
+from src import transliteration
+
+
+class TestTransliteration(TestCase):
+    def test_to_latin(self):
+        transliteration.clear_cache()
+
+        self.assertEqual(transliteration.to_latin("Пушкин"), "Pushkin")
+        self.assertEqual(transliteration.to_latin("Пушкин"), "Pushkin")
+        self.assertEqual(transliteration.to_latin("ABC-123"), "ABC-123")
+
+        stats = transliteration.get_stats()
+        self.assertEqual(stats.hits, 1)
+        self.assertEqual(stats.misses, 2)
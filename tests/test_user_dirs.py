@@ -0,0 +1,18 @@
+import os
+import stat
+import sys
+import tempfile
+from pathlib import Path
+from unittest import TestCase, skipIf
+
+from src.user_dirs import make_private_dir
+
+
+@skipIf(sys.platform == "win32", "права на каталоги в Windows не задаются")
+class TestUserDirs(TestCase):
+    def test_created_parents_are_private(self):
+        with tempfile.TemporaryDirectory() as base:
+            make_private_dir(Path(base) / "library_manager" / "reports")
+
+            for directory in (Path(base) / "library_manager", Path(base) / "library_manager" / "reports"):
+                self.assertEqual(stat.S_IMODE(os.stat(directory).st_mode), 0o700)